@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# load test for the data api, comparing the motor based handlers with the
+# former blocking pymongo calls inside the same async handlers. Run it from
+# the repository root with
+#   python benchmarks/api_load.py
+# which uses an in memory stand-in db with a simulated round trip latency, or
+#   python benchmarks/api_load.py --address localhost:27017
+# against a local mongod (the collections of the db "cme_load_test" are
+# overwritten).
+
+import argparse
+import asyncio
+import os
+import time
+from unittest import mock
+
+import httpx
+
+from cme import database, async_database
+from cme.api import api, auth, cache
+
+CLIENT = "loadtest"
+PASSWORD = "loadtest"
+DB_NAME = "cme_load_test"
+
+SESSIONS = [
+    {"session_id": 19000 + i, "legislative_period": 19, "session_no": i, "interactions": []}
+    for i in range(1, 51)]
+MDBS = [
+    {"speaker_id": f"MDB-{i}", "forename": f"Vorname{i}", "surname": f"Nachname{i % 100}"}
+    for i in range(500)]
+
+
+def _matches(doc: dict, query: dict) -> bool:
+    return all(doc.get(k) == v for k, v in (query or {}).items())
+
+
+def _project(doc: dict, projection: dict) -> dict:
+    if not projection:
+        return dict(doc)
+    if any(projection.values()):
+        return {k: v for k, v in doc.items() if projection.get(k) or k == "_id"}
+    return {k: v for k, v in doc.items() if k not in projection}
+
+
+class _StandInCollection:
+    """Equality matching in memory collection which waits latency seconds on
+    every round trip, either blocking like pymongo or awaiting like motor."""
+
+    def __init__(self, docs, latency: float, blocking: bool):
+        self.docs = [{"_id": i, **d} for i, d in enumerate(docs)]
+        self.latency = latency
+        self.blocking = blocking
+
+    def _find(self, query, projection=None):
+        return [_project(d, projection) for d in self.docs if _matches(d, query)]
+
+    def _round_trip(self, result):
+        if self.blocking:
+            time.sleep(self.latency)
+            return result
+
+        async def _result():
+            await asyncio.sleep(self.latency)
+            return result
+
+        return _result()
+
+    def find_one(self, query, projection=None, sort=None):
+        docs = self._find(query, projection)
+        for key, direction in reversed(sort or []):
+            docs.sort(key=lambda d: d.get(key) or "", reverse=direction < 0)
+        return self._round_trip(next(iter(docs), None))
+
+    def count_documents(self, query):
+        return self._round_trip(len(self._find(query)))
+
+    def estimated_document_count(self):
+        return self._round_trip(len(self.docs))
+
+    def find(self, query=None, projection=None):
+        if self.blocking:
+            time.sleep(self.latency)
+            return iter(self._find(query, projection))
+        return _StandInCursor(self, query, projection)
+
+
+class _StandInCursor:
+
+    def __init__(self, collection: _StandInCollection, query, projection):
+        self.collection = collection
+        self.query = query
+        self.projection = projection
+        self.keys = []
+        self.limit_ = 0
+
+    def sort(self, keys):
+        self.keys = keys
+        return self
+
+    def limit(self, limit):
+        self.limit_ = limit
+        return self
+
+    async def to_list(self, length=None):
+        await asyncio.sleep(self.collection.latency)
+        docs = self.collection._find(self.query, self.projection)
+        for key, direction in reversed(self.keys):
+            docs.sort(key=lambda d: d[key], reverse=direction < 0)
+        return docs[:self.limit_ or length]
+
+
+def _stand_in_db(latency: float, blocking: bool) -> dict:
+    return {
+        "client": _StandInCollection([{"_id": CLIENT}], latency, blocking),
+        "session": _StandInCollection(SESSIONS, latency, blocking),
+        "mdb": _StandInCollection(MDBS, latency, blocking),
+    }
+
+
+def _blocking_async_database():
+    """Patches async_database with the blocking cme.database functions,
+    which is how the handlers accessed the db before."""
+
+    async def find_one(*args, **kwargs):
+        return database.find_one(*args, **kwargs)
+
+    async def find_many(collection_name=None, query=None, exclude=None, sort=None, limit=0):
+        docs = database.find_many(collection_name, query, exclude)
+        for key, direction in reversed(sort or []):
+            docs.sort(key=lambda d: d[key], reverse=direction < 0)
+        return docs[:limit or None]
+
+    async def find_all_ids(*args, **kwargs):
+        return database.find_all_ids(*args, **kwargs)
+
+    async def collection_version(collection_name, query=None):
+        collection = database.get_cme_db()[collection_name]
+        latest = collection.find_one(query or {}, {"modified": 1}, sort=[("modified", -1)])
+        return collection.count_documents(query or {}), latest.get("modified") if latest else None
+
+    return mock.patch.multiple(
+        async_database, find_one=find_one, find_many=find_many, find_all_ids=find_all_ids,
+        collection_version=collection_version)
+
+
+async def _load(requests: int, concurrency: int) -> float:
+    paths = [
+        "/cme/data/session/19001",
+        "/cme/data/sessions/",
+        "/cme/data/period/19",
+        "/cme/data/mdb?surname=Nachname7",
+        "/cme/data/faction",
+    ]
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=api.app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://load", auth=(CLIENT, PASSWORD)) as client:
+        async def _request(i: int):
+            async with semaphore:
+                response = await client.get(paths[i % len(paths)])
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*[_request(i) for i in range(requests)])
+        return time.perf_counter() - start
+
+
+def _run(mode: str, args) -> float:
+    # every mode starts with empty auth and response caches
+    auth.authenticator.invalidate()
+    cache.response_cache.invalidate()
+
+    if args.address:
+        with mock.patch.dict(os.environ, {"CME_DB_ADDRESS": args.address, "CME_DB_NAME": DB_NAME}):
+            if mode == "blocking":
+                with _blocking_async_database():
+                    return asyncio.run(_load(args.requests, args.concurrency))
+            try:
+                return asyncio.run(_load(args.requests, args.concurrency))
+            finally:
+                async_database.close()
+
+    if mode == "blocking":
+        with _blocking_async_database(), \
+                mock.patch.object(database, "get_cme_db", return_value=_stand_in_db(args.latency, True)):
+            return asyncio.run(_load(args.requests, args.concurrency))
+
+    async def get_cme_db():
+        return stand_in
+
+    stand_in = _stand_in_db(args.latency, False)
+    with mock.patch.object(async_database, "get_cme_db", get_cme_db):
+        return asyncio.run(_load(args.requests, args.concurrency))
+
+
+def _fill_local_db(address: str):
+    with mock.patch.dict(os.environ, {"CME_DB_ADDRESS": address, "CME_DB_NAME": DB_NAME}):
+        db = database.get_cme_db()
+    for name, docs in (("client", [{"_id": CLIENT}]), ("session", SESSIONS), ("mdb", MDBS)):
+        db[name].delete_many({})
+        db[name].insert_many([dict(d) for d in docs])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--address", help="address of a local mongod, the stand-in db is used if omitted")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.002,
+                        help="simulated round trip latency of the stand-in db in seconds")
+    args = parser.parse_args()
+
+    os.environ[f"{CLIENT.upper()}_PASSWORD"] = PASSWORD
+    if args.address:
+        _fill_local_db(args.address)
+
+    print(f"{args.requests} requests with concurrency {args.concurrency} "
+          f"against {args.address or f'stand-in db ({args.latency * 1000:.1f}ms latency)'}:")
+
+    results = {mode: _run(mode, args) for mode in ("blocking", "motor")}
+    for mode, seconds in results.items():
+        print(f"{mode:>10}: {seconds:7.3f}s ({args.requests / seconds:8.1f} req/s)")
+    print(f"speedup: {results['blocking'] / results['motor']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# benchmark of the comment extraction on the comments of
+# resources/plenarprotokolle/open_data/19180-data.xml and
+# resources/plenarprotokolle/group_1/19192.json. Run it from the repository
+# root with
+#   python benchmarks/comment_extraction.py
+# The mdbs are kept in the runtime storage and every round shares a speaker
+# registry, as in the import of a session.
+
+import json
+import logging
+import re
+import timeit
+from pathlib import Path
+
+from cme import utils
+from cme.data import read_transcript_xml_file, read_transcripts_json
+from cme.domain import MDB, Faction
+from cme.extraction import extract_comment, split_comments, comment_grammar, human_sender_re, keywords, _build_mdb
+
+RESOURCES = Path(__file__).parent.parent / "resources" / "plenarprotokolle"
+
+logger = logging.getLogger("cme.extraction")
+
+
+def _extract_comment_split(text_part: str, add_debug_obj: bool = False):
+    # the implementation before CommentGrammar
+    # converting direct speech separated with a colon
+    if ":" in text_part:
+        ps, pm = [s.strip() for s in text_part.split(":", 1)]
+        pr = None
+
+        # grabbing the special case of a changed receiver during the
+        # comment
+        if ", an" in ps or ", zur" in ps:
+            ps, pr = [s.strip() for s in ps.split(",", 1)]
+
+            pr_match = human_sender_re.search(pr)
+            pfr = Faction.in_text(pr)
+            if pr_match:
+                pr = [pr_match.group("person")]
+            elif pfr:
+                pr = pfr
+            else:
+                logger.warning("not handled alternative receiver \"{}\"".format(pr))
+                pr = None
+
+        # extraction of the sender or senders
+        phs = human_sender_re.findall(ps)
+        if phs:
+            if len(phs) != 1:
+                raise RuntimeError(
+                    "Found multiple possible direct speaker ({}) in \"{}\"! "
+                    "This is currently not supported".format(phs, text_part))
+
+            if pr:
+                for curr_pr in pr:
+                    if isinstance(curr_pr, str):
+                        curr_pr = _build_mdb(curr_pr, add_debug_obj)
+                    elif isinstance(curr_pr, Faction):
+                        curr_pr = curr_pr
+
+                    return [(
+                        _build_mdb(phs[0], add_debug_obj),
+                        curr_pr,
+                        pm)]
+            else:
+                return [(
+                    _build_mdb(phs[0], add_debug_obj),
+                    None,
+                    pm)]
+        else:
+            pfs = Faction.in_text(ps)
+
+            if len(pfs) == 0 and utils.logging_is_needed(text_part):
+                logger.warning(
+                    "Found no direct sender in \"{}\"! Ignoring the "
+                    "message...".format(text_part))
+
+            return [(f, None, pm) for f in pfs]
+    # converting non verbal messages like laughing
+    else:
+        words = text_part.split(" ")
+
+        if len(words) == 0:
+            logger.warning(
+                "Found a no direct speech message without a sender "
+                "(\"{}\")! Ignoring it now message...".format(text_part))
+            return list()
+
+        last_kw_idx = -1
+        for i, w in enumerate(words):
+            if w in keywords:
+                last_kw_idx = i
+
+        if last_kw_idx < 0:
+            if utils.logging_is_needed(text_part):
+                logger.warning(
+                    "Found no handled keyword in a non direct speech message "
+                    "(\"{}\")! Ignoring it now message...".format(text_part))
+            return list()
+
+        relevant_text = " ".join(words[last_kw_idx + 1:])
+        potential_senders = re.split(r"(?:\sund\s)|(?:\ssowie\s)|(?:,\s)", relevant_text)
+
+        found_senders = list()
+        for ps in potential_senders:
+            phs = human_sender_re.findall(ps)
+
+            if phs:
+                if len(phs) != 1:
+                    raise RuntimeError(
+                        "Found multiple possible direct speaker ({}) in \"{}\"! "
+                        "This is currently not supported".format(phs, text_part))
+
+                found_senders.append((
+                    _build_mdb(phs[0], add_debug_obj),
+                    None,
+                    text_part))
+
+            else:
+                pfs = Faction.in_text(ps)
+
+                if len(pfs) == 0 and utils.logging_is_needed(text_part):
+                    logger.warning(
+                        "Found no direct sender in \"{}\"! Ignoring the "
+                        "message...".format(text_part))
+
+                found_senders += [(f, None, text_part) for f in pfs]
+
+        return found_senders
+
+
+def _comment_parts():
+    candidates = read_transcript_xml_file(RESOURCES / "open_data" / "19180-data.xml")[1]
+    for _, session_candidates in read_transcripts_json(
+            json.loads((RESOURCES / "group_1" / "19192.json").read_bytes())):
+        candidates += session_candidates
+
+    return [
+        part
+        for c in candidates if c.comment is not None
+        for part in split_comments(c.comment.strip("()"))]
+
+
+def main(rounds: int = 10):
+    # the extraction logs every malformed sender
+    logging.disable(logging.CRITICAL)
+    MDB.set_storage_mode("runtime")
+    parts = _comment_parts()
+
+    implementations = {
+        "split and find": _extract_comment_split,
+        "CommentGrammar": extract_comment,
+    }
+
+    print(f"{len(parts)} comment parts, {rounds} rounds:")
+    for name, implementation in implementations.items():
+        with MDB.speaker_registry():
+            senders = sum(len(implementation(p)) for p in parts)
+            seconds = timeit.timeit(lambda: [implementation(p) for p in parts], number=rounds)
+        print(f"{name:>16}: {len(parts) * rounds / seconds:9.0f} comments/s, {senders} senders")
+
+    seconds = timeit.timeit(lambda: [comment_grammar.parse(p) for p in parts], number=rounds)
+    print(f"{'parse only':>16}: {len(parts) * rounds / seconds:9.0f} comments/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# benchmark of the json serialization of a full session document, built
+# from resources/plenarprotokolle/open_data/19180-data.xml. Run it from the
+# repository root with
+#   python benchmarks/json_response.py
+# The mdbs are kept in the runtime storage.
+
+import timeit
+from pathlib import Path
+
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+from cme.api.response import FastJSONResponse
+from cme.controller import _convert_file
+from cme.domain import MDB
+from cme.utils import safe_json_dumps
+
+TRANSCRIPT_FILE = Path(__file__).parent.parent / "resources" / "plenarprotokolle" / "open_data" / "19180-data.xml"
+
+
+def main(rounds: int = 20):
+    MDB.set_storage_mode("runtime")
+    transcript = _convert_file(TRANSCRIPT_FILE)[0]
+    session = transcript.dict(exclude_none=True, exclude_unset=True)
+
+    implementations = {
+        "jsonable_encoder + JSONResponse": lambda: JSONResponse(jsonable_encoder(session)).body,
+        "safe_json_dumps": lambda: safe_json_dumps(session).encode("utf-8"),
+        "FastJSONResponse": lambda: FastJSONResponse(session).body,
+    }
+
+    print(f"session {transcript.session_no} with {len(transcript.interactions)} interactions, {rounds} rounds:")
+    for name, implementation in implementations.items():
+        size = len(implementation())
+        seconds = timeit.timeit(implementation, number=rounds)
+        print(f"{name:>32}: {seconds / rounds * 1000:7.2f} ms/response, {size} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# micro benchmark for the name splitting, based on the cases of
+# test/test_name_splitting.py. Run it from the repository root with
+#   python benchmarks/name_splitting.py
+
+import timeit
+
+from nameparser import HumanName
+from nameparser.config import Constants
+
+from cme.utils import NameSplitter
+
+# the person strings of test/test_name_splitting.py
+PERSON_STRS = [
+    "Vorname Nachname",
+    "Präsident Dr. Manfred Jürgenson von Kuchenhausen",
+    "Dr. Test Senior",
+    "Dr. h. c. Thomas Sattelberger",
+    "Dr. Dr. h. c. Karl A. Lamers",
+    "B.Sc. Vorname Nachname",
+    "Dr. h. c. Dr. Ing. e. h. Vorname Nachname",
+    "Beatrix von Storch",
+    "Dr. Konstantin von Notz",
+    "Berengar Elsner von Gronow",
+    "Dr. Daniela De Ridder",
+    "Christian Frhr. von Stetten",
+    "Hans-Georg von der Marwitz",
+    "Dr. Thomas de Maizière",
+    "Axel E. Fischer",
+    "Dr. Johann David Wadephul",
+    "Bettina Margarethe Wiesmann",
+    "Dr. Ernst Dieter Rossmann",
+    "Mariana Iris Harder-Kühnel",
+    "Tobias Matthias Peterka",
+    "Eberhardt Alexander Gauland",
+]
+
+
+def _split_with_fresh_constants(person_str: str):
+    # the implementation before NameSplitter, building the constants per call
+    constants = Constants()
+    constants.titles.add("Prof.", "Ing.", "B.Sc.", "h.", "c.", "e.")
+    constants.prefixes.add(
+        "Baronin", "Baron", "Freiherr", "Frhr.",
+        "Fürstin", "Fürst", "Gräfin", "Graf",
+        "Prinzessin", "Prinz", "von", "van", "de",
+        "vom", "zu")
+    hn = HumanName(person_str, constants=constants)
+    return hn.title, hn.first, hn.last
+
+
+def main(rounds: int = 20):
+    shared_constants = NameSplitter(maxsize=0)
+    memoized = NameSplitter()
+
+    results = {
+        "fresh constants per call": timeit.timeit(
+            lambda: [_split_with_fresh_constants(p) for p in PERSON_STRS], number=rounds),
+        "shared constants": timeit.timeit(
+            lambda: [shared_constants.split_name(p) for p in PERSON_STRS], number=rounds),
+        "shared constants + lru cache": timeit.timeit(
+            lambda: [memoized.split_name(p) for p in PERSON_STRS], number=rounds),
+    }
+
+    calls = rounds * len(PERSON_STRS)
+    baseline = results["fresh constants per call"]
+    for name, seconds in results.items():
+        print(f"{name:<30} {seconds / calls * 1e6:10.1f} us/call {baseline / seconds:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# benchmark of the paragraph receiver extraction on the paragraphs of
+# resources/plenarprotokolle/open_data/19180-data.xml. Run it from the
+# repository root with
+#   python benchmarks/paragraph_extraction.py
+# The mdbs are the speakers of the session, kept in the runtime storage.
+
+import timeit
+from pathlib import Path
+
+from cme.data import read_transcript_xml_file
+from cme.domain import MDB, Faction
+from cme.extraction import extract_paragraph, valid_prepositions
+
+TRANSCRIPT_FILE = Path(__file__).parent.parent / "resources" / "plenarprotokolle" / "open_data" / "19180-data.xml"
+
+
+def _extract_paragraph_split(text_part: str, paragraph_keymap):
+    # the implementation before ReceiverMatcher
+    text_tokens = text_part.split(" ")
+
+    receivers = []
+    paragraph_keywords = paragraph_keymap.keys()
+
+    for index, token in enumerate(text_tokens):
+        if token in paragraph_keywords:
+            preceding_index = index - 1
+            if preceding_index >= 0:
+                preceding_token = text_tokens[preceding_index]
+                if preceding_token in valid_prepositions:
+                    receiver = paragraph_keymap[token]
+                    if isinstance(receiver, MDB):
+                        receivers.append(receiver)
+
+    receiver_factions = Faction.in_text(text_part)
+
+    receivers.extend(receiver_factions)
+
+    return receivers
+
+
+def main(rounds: int = 10):
+    MDB.set_storage_mode("runtime")
+    _, candidates = read_transcript_xml_file(TRANSCRIPT_FILE)
+    paragraphs = [c.paragraph for c in candidates]
+    paragraph_keymap = MDB.surname_index()
+
+    implementations = {
+        "split tokens": _extract_paragraph_split,
+        "ReceiverMatcher": extract_paragraph,
+    }
+
+    print(f"{len(paragraphs)} paragraphs, {len(paragraph_keymap)} indexed surnames, {rounds} rounds:")
+    for name, implementation in implementations.items():
+        receivers = sum(
+            sum(isinstance(r, MDB) for r in implementation(p, paragraph_keymap)) for p in paragraphs)
+        seconds = timeit.timeit(lambda: [implementation(p, paragraph_keymap) for p in paragraphs], number=rounds)
+        print(f"{name:>16}: {len(paragraphs) * rounds / seconds:9.0f} paragraphs/s, {receivers} mdb receivers")
+
+
+if __name__ == "__main__":
+    main()
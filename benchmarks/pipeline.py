@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# benchmark of the import pipeline on the bundled transcripts. Every stage is
+# timed on its own: parse, candidate building, extract_comment,
+# extract_paragraph, the whole extract_communication_model,
+# Transcript.from_interactions and the serialization of the session
+# document. The peak memory of every stage is measured in an extra round
+# with tracemalloc. Run it from the repository root with
+#   python benchmarks/pipeline.py --output results.json
+# and compare the results of two commits with
+#   python benchmarks/pipeline.py --compare results.json
+# The mdbs are kept in the runtime storage.
+
+import argparse
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Tuple, Callable, Optional
+
+from bs4 import BeautifulSoup
+
+from cme.data import read_transcripts_json
+from cme.data.xml_parse import _extract_metadata_xml, _extract_paragraphs_xml
+from cme.domain import MDB, Transcript, SessionMetadata, InteractionCandidate
+from cme.extraction import (
+    extract_comment, extract_paragraph, extract_communication_model, retrieve_paragraph_keymap, split_comments)
+from cme.utils import fast_json_dumps
+
+RESOURCES = Path(__file__).parent.parent / "resources" / "plenarprotokolle"
+FIXTURES = [
+    RESOURCES / "open_data" / "19180-data.xml",
+    RESOURCES / "open_data_old" / "18245.xml",
+    RESOURCES / "group_1" / "19192.json",
+    RESOURCES / "group_1" / "19_181_187.json",
+]
+STAGES = [
+    "parse", "candidates", "extract_comment", "extract_paragraph", "extract_communication_model",
+    "from_interactions", "serialization",
+]
+
+
+class _Recorder:
+    """Collects the duration and, while tracemalloc is tracing, the peak
+    memory of every stage of one round."""
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+        self.peak_bytes: Dict[str, int] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            start_bytes = tracemalloc.get_traced_memory()[0]
+
+        start = time.perf_counter()
+        yield
+        self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+
+        if tracing:
+            peak = tracemalloc.get_traced_memory()[1] - start_bytes
+            self.peak_bytes[name] = max(self.peak_bytes.get(name, 0), peak)
+
+
+def _read_xml(file: Path, recorder: _Recorder) -> List[Tuple[SessionMetadata, List[InteractionCandidate]]]:
+    with recorder.stage("parse"):
+        soup = BeautifulSoup(file.read_bytes(), "xml")
+
+    with recorder.stage("candidates"):
+        root_el = soup.dbtplenarprotokoll
+        if root_el is None:
+            raise ValueError(f"unsupported xml format, root element is <{soup.find().name}>")
+        metadata = _extract_metadata_xml(root_el)
+        candidates = _extract_paragraphs_xml(root_el)
+
+    return [(metadata, candidates)]
+
+
+def _read_json(file: Path, recorder: _Recorder) -> List[Tuple[SessionMetadata, List[InteractionCandidate]]]:
+    with recorder.stage("parse"):
+        transcript = json.loads(file.read_bytes())
+
+    with recorder.stage("candidates"):
+        if "rednerListe" not in transcript:
+            raise ValueError(f"unsupported json format, top level keys are {list(transcript)}")
+        return read_transcripts_json(transcript)
+
+
+def _run_pipeline(file: Path, recorder: _Recorder) -> Tuple[int, int]:
+    with MDB.speaker_registry():
+        return _run_sessions(file, recorder)
+
+
+def _run_sessions(file: Path, recorder: _Recorder) -> Tuple[int, int]:
+    read = _read_json if file.suffix.lower() == ".json" else _read_xml
+    sessions = read(file, recorder)
+
+    candidate_count = 0
+    interaction_count = 0
+    for metadata, candidates in sessions:
+        candidate_count += len(candidates)
+
+        with recorder.stage("extract_comment"):
+            for candidate in candidates:
+                if candidate.comment is not None:
+                    for comment_part in split_comments(candidate.comment.strip("()")):
+                        extract_comment(comment_part)
+
+        with recorder.stage("extract_paragraph"):
+            paragraph_keymap = retrieve_paragraph_keymap()
+            for candidate in candidates:
+                extract_paragraph(candidate.paragraph, paragraph_keymap)
+
+        with recorder.stage("extract_communication_model"):
+            interactions = extract_communication_model(candidates)
+
+        with recorder.stage("from_interactions"):
+            transcript = Transcript.from_interactions(metadata=metadata, interactions=interactions)
+
+        with recorder.stage("serialization"):
+            fast_json_dumps(transcript.dict(exclude_none=True, exclude_unset=True))
+
+        interaction_count += len(interactions)
+
+    return candidate_count, interaction_count
+
+
+def benchmark_file(file: Path, rounds: int, warmup: int) -> Dict:
+    for _ in range(warmup):
+        _run_pipeline(file, _Recorder())
+
+    recorders = []
+    for _ in range(rounds):
+        recorders.append(_Recorder())
+        candidate_count, interaction_count = _run_pipeline(file, recorders[-1])
+
+    memory = _Recorder()
+    tracemalloc.start()
+    try:
+        _run_pipeline(file, memory)
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    stages = {}
+    for name in STAGES:
+        seconds = [r.seconds[name] for r in recorders if name in r.seconds]
+        if seconds:
+            stages[name] = {
+                "median_s": statistics.median(seconds),
+                "min_s": min(seconds),
+                "peak_bytes": memory.peak_bytes.get(name, 0)}
+
+    return {
+        "status": "ok",
+        "candidates": candidate_count,
+        "interactions": interaction_count,
+        "peak_bytes": peak_bytes,
+        "stages": stages}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(files: List[Path], rounds: int, warmup: int) -> Dict:
+    results = {}
+    for file in files:
+        try:
+            results[file.name] = benchmark_file(file, rounds, warmup)
+        except Exception as err:
+            results[file.name] = {"status": "skipped", "reason": f"{type(err).__name__}: {err}"}
+
+    return {
+        "commit": _git_commit(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "rounds": rounds,
+        "results": results}
+
+
+def print_results(report: Dict, print_fn: Callable[[str], None] = print):
+    print_fn(f"commit {report['commit']}, python {report['python']}, {report['rounds']} rounds")
+    for name, result in report["results"].items():
+        if result["status"] != "ok":
+            print_fn(f"{name}: skipped, {result['reason']}")
+            continue
+
+        print_fn(f"{name}: {result['candidates']} candidates, {result['interactions']} interactions, "
+                 f"peak {result['peak_bytes'] / 2 ** 20:.1f} MiB")
+        for stage, timing in result["stages"].items():
+            print_fn(f"  {stage:>28}: {timing['median_s'] * 1000:9.2f} ms median, "
+                     f"{timing['min_s'] * 1000:9.2f} ms min, peak {timing['peak_bytes'] / 2 ** 20:7.1f} MiB")
+
+
+def compare(baseline: Dict, report: Dict, threshold: float, print_fn: Callable[[str], None] = print) -> int:
+    """Prints the ratio of every stage to the baseline and returns the number
+    of stages which got slower or needed more memory than the threshold
+    allows."""
+
+    print_fn(f"compared to commit {baseline['commit']}:")
+    regressions = 0
+    for name, result in report["results"].items():
+        old = baseline["results"].get(name)
+        if result["status"] != "ok" or not old or old["status"] != "ok":
+            continue
+
+        for stage, timing in result["stages"].items():
+            old_timing = old["stages"].get(stage)
+            if not old_timing:
+                continue
+
+            # the fastest round is the least disturbed by other processes
+            time_ratio = timing["min_s"] / old_timing["min_s"] if old_timing["min_s"] else 1.0
+            memory_ratio = timing["peak_bytes"] / old_timing["peak_bytes"] if old_timing["peak_bytes"] else 1.0
+            regressed = time_ratio > 1 + threshold or memory_ratio > 1 + threshold
+            regressions += regressed
+            print_fn(f"{'REGRESSED' if regressed else 'ok':>9} {name} {stage}: time x{time_ratio:.2f}, "
+                     f"memory x{memory_ratio:.2f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the parse, extract and persist pipeline.")
+    parser.add_argument("files", nargs="*", type=Path, default=FIXTURES,
+                        help="Transcripts to benchmark. (Default: the bundled fixtures)")
+    parser.add_argument("--rounds", type=int, default=5, help="Timed rounds per file. (Default: 5)")
+    parser.add_argument("--warmup", type=int, default=1,
+                        help="Untimed rounds per file, e.g. to fill the mdb runtime storage. (Default: 1)")
+    parser.add_argument("--output", type=Path, help="Writes the results as json to this file.")
+    parser.add_argument("--compare", type=Path, help="Results of an earlier run to compare with.")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Relative slow down of the fastest round or memory growth reported as regression. "
+                             "(Default: 0.2)")
+    args = parser.parse_args()
+
+    # the extraction logs every dropped paragraph and malformed sender
+    logging.disable(logging.CRITICAL)
+    MDB.set_storage_mode("runtime")
+
+    report = run(args.files, args.rounds, args.warmup)
+    print_results(report)
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+
+    if args.compare:
+        regressions = compare(json.loads(args.compare.read_text()), report, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,24 +2,34 @@
 # -*- coding: utf-8 -*-
 #
 # Communication Model Extractor - CME API
+import asyncio
+import logging
+import os
 import time
 
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Depends
 from fastapi.exceptions import RequestValidationError
+from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from starlette.requests import Request
-from starlette.responses import JSONResponse
-from starlette.status import HTTP_400_BAD_REQUEST
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.status import HTTP_400_BAD_REQUEST, HTTP_503_SERVICE_UNAVAILABLE
 
-from cme.api import api_session, api_doc, api_mdb, api_faction
+from cme import async_database, database, jobs, indexes, utils
+from cme.metrics import metrics
+from cme.api import auth, api_session, api_doc, api_mdb, api_faction, api_interaction, cache
+from cme.api.response import FastJSONResponse
 
 BASE_PREFIX = "cme"
+HEALTH_TIMEOUT = float(os.getenv("CME_HEALTH_TIMEOUT", 2.0))
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
+security = HTTPBasic()
 
 app.include_router(api_session.router, prefix=f"/{BASE_PREFIX}/data")
 app.include_router(api_mdb.router, prefix=f"/{BASE_PREFIX}/data")
 app.include_router(api_faction.router, prefix=f"/{BASE_PREFIX}/data")
+app.include_router(api_interaction.router, prefix=f"/{BASE_PREFIX}/data")
 app.include_router(api_doc.router, prefix=f"/{BASE_PREFIX}/doc")
 
 
@@ -32,6 +42,59 @@ async def add_process_time_header(request: Request, call_next):
     return response
 
 
+@app.on_event("startup")
+async def preload_clients():
+    try:
+        await auth.authenticator.preload()
+    except Exception as err:
+        # the clients are loaded on the first request then
+        logging.warning(f"Preloading the api clients failed: {err!r}")
+
+
+@app.on_event("startup")
+async def create_indexes():
+    try:
+        await indexes.ensure_indexes_async()
+    except Exception as err:
+        logging.warning(f"Creating the indexes failed: {err!r}")
+
+
+@app.on_event("shutdown")
+def shutdown():
+    jobs.shutdown_job_queue()
+    async_database.close()
+    database.close()
+
+
+@app.get(f"/{BASE_PREFIX}/health", tags=['health'])
+async def health():
+    """Pings the cme db, answers with 503 if it isn't reachable within
+    CME_HEALTH_TIMEOUT seconds. No credentials are required."""
+
+    try:
+        latency = await asyncio.wait_for(async_database.ping(), HEALTH_TIMEOUT)
+    except Exception as err:
+        logging.warning(f"Health check failed: {err!r}")
+        return JSONResponse({"status": "unavailable"}, status_code=HTTP_503_SERVICE_UNAVAILABLE)
+
+    return {"status": "ok", "db_ping_ms": round(latency * 1000, 3)}
+
+
+@app.get(f"/{BASE_PREFIX}/metrics", tags=['health'], response_class=PlainTextResponse)
+async def get_metrics(credentials: HTTPBasicCredentials = Depends(security)):
+    """Returns the metrics of the api and its evaluation jobs in the
+    prometheus text format."""
+
+    await utils.get_basic_auth_client(credentials)
+
+    for status, count in jobs.get_job_queue().stats().items():
+        metrics.set("cme_jobs", count, status=status)
+    for name, value in cache.response_cache.stats().items():
+        metrics.set("cme_response_cache", value, stat=name)
+
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request, exc):
     return JSONResponse(exc.errors(), status_code=HTTP_400_BAD_REQUEST)
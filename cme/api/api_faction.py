@@ -11,7 +11,7 @@ security = HTTPBasic()
 
 @router.get("/faction", status_code=HTTP_200_OK, tags=['data'])
 async def get_factions(credentials: HTTPBasicCredentials = Depends(security)):
-    utils.get_basic_auth_client(credentials)
+    await utils.get_basic_auth_client(credentials)
 
     factions = {}
     for faction in Faction:
@@ -0,0 +1,84 @@
+from datetime import datetime
+from typing import Optional, List, AsyncIterator
+
+from fastapi import APIRouter, Depends
+from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from starlette.responses import StreamingResponse
+from starlette.status import HTTP_200_OK
+
+from cme import async_database, utils
+
+router = APIRouter()
+security = HTTPBasic()
+
+
+def _interaction_pipeline(
+        legislative_period: Optional[int] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        sender: Optional[str] = None,
+        receiver: Optional[str] = None) \
+        -> List[dict]:
+    session_query = {}
+    if legislative_period is not None:
+        session_query["legislative_period"] = legislative_period
+    if start_date or end_date:
+        session_query["start"] = {}
+        if start_date:
+            session_query["start"]["$gte"] = start_date
+        if end_date:
+            session_query["start"]["$lte"] = end_date
+
+    interaction_query = {}
+    if sender:
+        interaction_query["interactions.sender"] = sender
+    if receiver:
+        interaction_query["interactions.receiver"] = receiver
+
+    # the interaction filter is applied before the unwind as well, so
+    # sessions without any matching interaction are skipped early. The
+    # leading $match and $sort are served by the session_id index (or the
+    # legislative_period_session_id one), so the sorted sessions are streamed
+    # instead of being sorted in memory
+    pipeline = [
+        {"$match": {**session_query, **interaction_query}},
+        {"$sort": {"session_id": 1}},
+        {"$unwind": "$interactions"},
+    ]
+    if interaction_query:
+        pipeline.append({"$match": interaction_query})
+    pipeline.append({"$project": {
+        "_id": 0,
+        "session_id": 1,
+        "legislative_period": 1,
+        "start": 1,
+        "sender": "$interactions.sender",
+        "receiver": "$interactions.receiver",
+        "message": "$interactions.message",
+        "from_paragraph": "$interactions.from_paragraph",
+    }})
+    return pipeline
+
+
+async def _as_ndjson(interactions: AsyncIterator[dict]) -> AsyncIterator[str]:
+    async for interaction in interactions:
+        yield utils.fast_json_dumps(interaction) + "\n"
+
+
+@router.get("/interactions", status_code=HTTP_200_OK, tags=['data'])
+async def get_interactions(legislative_period: Optional[int] = None,
+                           start_date: Optional[datetime] = None,
+                           end_date: Optional[datetime] = None,
+                           sender: Optional[str] = None,
+                           receiver: Optional[str] = None,
+                           credentials: HTTPBasicCredentials = Depends(security)):
+    """Streams all interactions matching the filters as newline delimited
+    json, one interaction per line. The dates filter the start of the
+    sessions, sender and receiver are speaker ids or faction ids."""
+
+    await utils.get_basic_auth_client(credentials)
+
+    pipeline = _interaction_pipeline(legislative_period, start_date, end_date, sender, receiver)
+    return StreamingResponse(
+        _as_ndjson(async_database.aggregate("session", pipeline, allow_disk_use=True)),
+        media_type="application/x-ndjson")
@@ -2,8 +2,9 @@ from fastapi import APIRouter, Depends
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from starlette.status import HTTP_200_OK
 
-from cme import database, utils
+from cme import async_database, utils
 from cme.api import error
+from cme.api.response import FastJSONResponse
 
 router = APIRouter()
 security = HTTPBasic()
@@ -15,20 +16,22 @@ async def get_mdb(mdb_number: str = "",
                   forename: str = "",
                   surname: str = "",
                   credentials: HTTPBasicCredentials = Depends(security)):
-    utils.get_basic_auth_client(credentials)
+    await utils.get_basic_auth_client(credentials)
     query = {}
     # unique identifier, so only one object should be returned
     if speaker_id != "":
-        return database.find_many("mdb", {"speaker_id": speaker_id}, {"_id": 0, "createdBy": 0})
+        return FastJSONResponse(
+            await async_database.find_many("mdb", {"speaker_id": speaker_id}, {"_id": 0, "createdBy": 0}))
     if mdb_number != "":
-        return database.find_many("mdb", {"mdb_number": mdb_number}, {"_id": 0, "createdBy": 0})
+        return FastJSONResponse(
+            await async_database.find_many("mdb", {"mdb_number": mdb_number}, {"_id": 0, "createdBy": 0}))
 
     # search by multiple params
     if forename != "":
         query['forename'] = forename
     if surname != "":
         query['surname'] = surname
-    users = database.find_many("mdb", query, {"_id": 0, "createdBy": 0})
+    users = await async_database.find_many("mdb", query, {"_id": 0, "createdBy": 0})
     if not users:
         error.raise_404(f"No mdb's were found for your search query: {query}")
-    return users
+    return FastJSONResponse(users)
@@ -1,61 +1,167 @@
 import logging
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, BackgroundTasks, Depends
+from fastapi import APIRouter, Depends, Query
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from pymongo import ASCENDING
+from starlette.requests import Request
 from starlette.status import HTTP_200_OK
 
-from cme import database, utils, controller
-from cme.api import error
+from cme import async_database, utils, jobs
+from cme.api import cache, error
+from cme.domain import Transcript
 
 router = APIRouter()
 security = HTTPBasic()
 
+MAX_PAGE_SIZE = 100
+# a session with its interactions takes a few MB, so pages including them
+# are much smaller by default
+INTERACTIONS_PAGE_SIZE = 5
+
 
 # for group 1 to give information about new protocols
 @router.post("/", status_code=HTTP_200_OK, tags=[])
-async def post_new_ids(ids: List[str], background_tasks: BackgroundTasks,
-                       credentials: HTTPBasicCredentials = Depends(security)):
-    utils.get_basic_auth_client(credentials)
+async def post_new_ids(ids: List[str], credentials: HTTPBasicCredentials = Depends(security)):
+    await utils.get_basic_auth_client(credentials)
 
-    # create subprocess: background task to get new protocols and iterate over (start parser/cme)
+    # the sessions are evaluated by the worker processes of the job queue
     logging.info(f"Received update request for sessions '{ids}'")
-    background_tasks.add_task(controller.evaluate_newest_sessions, ids)
+    try:
+        job = jobs.get_job_queue().submit(ids)
+    except jobs.QueueFullError as err:
+        error.raise_429(f"Too many sessions are waiting for their evaluation, please retry later. ({err})")
+
+    if not job:
+        return {"details: ": f"All sessions with ids '{ids}' are already queued for evaluation."}
+
+    return {"details: ": f"Job '{job.job_id}' has been queued to evaluate newest sessions with ids: '{job.session_ids}'",
+            "job_id": job.job_id}
+
+
+@router.get("/jobs", status_code=HTTP_200_OK, tags=['jobs'])
+async def get_jobs(credentials: HTTPBasicCredentials = Depends(security)):
+    await utils.get_basic_auth_client(credentials)
+
+    return jobs.get_job_queue().jobs()
+
 
-    return {"details: ": f"Background task has been created to evaluate newest sessions with ids: '{ids}'"}
+@router.get("/jobs/{job_id}", status_code=HTTP_200_OK, tags=['jobs'])
+async def get_job(job_id: str, credentials: HTTPBasicCredentials = Depends(security)):
+    await utils.get_basic_auth_client(credentials)
+
+    job = jobs.get_job_queue().get(job_id)
+    if not job:
+        error.raise_404(f"No job with id '{job_id}' was found.")
+    return job
 
 
 @router.get("/session/{session_id}", status_code=HTTP_200_OK, tags=['data'])
-async def get_session(session_id: int, credentials: HTTPBasicCredentials = Depends(security)):
-    utils.get_basic_auth_client(credentials)
+async def get_session(session_id: int, request: Request, credentials: HTTPBasicCredentials = Depends(security)):
+    await utils.get_basic_auth_client(credentials)
 
     # id = legislative period + session eg: 19177
-    session = database.find_one("session", {'session_id': session_id})
-
-    if not session:
+    query = {'session_id': session_id}
+    version = await async_database.find_one("session", query, {"_id": 0, "session_id": 1, "modified": 1})
+    if not version:
         error.raise_404(f"No session with id '{session_id}' was found.")
-    del session['_id']
-    return session
+
+    async def _load():
+        session = await async_database.find_one("session", query, {"_id": 0})
+        if not session:
+            error.raise_404(f"No session with id '{session_id}' was found.")
+        return session, {}
+
+    return await cache.cached_json_response(request, ("session", session_id), version.get("modified"), _load)
 
 
 @router.get("/sessions/", status_code=HTTP_200_OK, tags=['data'])
-async def get_session_ids(credentials: HTTPBasicCredentials = Depends(security)):
-    utils.get_basic_auth_client(credentials)
+async def get_session_ids(request: Request, credentials: HTTPBasicCredentials = Depends(security)):
+    await utils.get_basic_auth_client(credentials)
+
+    async def _load():
+        session_ids = await async_database.find_all_ids('session', 'session_id')
+        session_ids.sort()
+        return session_ids, {}
+
+    version = await async_database.collection_version("session")
+    return await cache.cached_json_response(request, ("sessions",), version, _load)
 
-    session_ids = database.find_all_ids('session', 'session_id')
-    session_ids.sort()
-    return session_ids
+
+# fields of the stored session documents which can be requested via fields=
+SESSION_FIELDS = set(Transcript.__fields__.keys()) | {"session_id", "created", "modified"}
+
+
+def _session_projection(fields: Optional[str], include_interactions: bool) -> dict:
+    if fields:
+        requested = {f.strip() for f in fields.split(",") if f.strip()}
+        unknown = requested - SESSION_FIELDS
+        if unknown:
+            error.raise_400(f"Unknown session fields {sorted(unknown)}, valid fields are {sorted(SESSION_FIELDS)}.")
+        if not include_interactions:
+            requested.discard("interactions")
+
+        # the session_id is the pagination cursor, so it is always returned
+        projection = {f: 1 for f in requested | {"session_id"}}
+    else:
+        projection = dict()
+        if not include_interactions:
+            projection["interactions"] = 0
+
+    projection["_id"] = 0
+    return projection
+
+
+# /period/{lp} pages are ordered by the session_id, which continues a page
+PERIOD_SORT = [('session_id', ASCENDING)]
+
+
+def _period_query(legislative_period: int, after: Optional[int] = None) -> dict:
+    query = {'legislative_period': legislative_period}
+    if after is not None:
+        query['session_id'] = {'$gt': after}
+    return query
+
+
+def _default_page_size(projection: dict) -> int:
+    inclusive = any(v == 1 for v in projection.values())
+    with_interactions = projection.get("interactions", 0 if inclusive else 1) == 1
+    return INTERACTIONS_PAGE_SIZE if with_interactions else MAX_PAGE_SIZE
 
 
 @router.get("/period/{legislative_period}", status_code=HTTP_200_OK, tags=['data'])
 async def get_all_sessions_in_legislative_period(legislative_period: int,
+                                                 request: Request,
+                                                 limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+                                                 after: Optional[int] = None,
+                                                 fields: Optional[str] = None,
+                                                 include_interactions: bool = True,
                                                  credentials: HTTPBasicCredentials = Depends(security)):
-    utils.get_basic_auth_client(credentials)
-
-    sessions = database.find_many("session", {'legislative_period': legislative_period})
-    if not sessions:
-        error.raise_404(f"No sessions found for legislative period '{legislative_period}'.")
-
-    for session in sessions:
-        del session['_id']
-    return sessions
+    """Returns a page of at most limit sessions of a legislative period
+    ordered by session_id. If the page is full, the X-Next-After header
+    holds the session_id to pass as after for the next page. fields is a
+    comma separated list of the session fields to return and
+    include_interactions=false omits the interactions. The default limit is
+    INTERACTIONS_PAGE_SIZE if the interactions are returned and
+    MAX_PAGE_SIZE otherwise."""
+
+    await utils.get_basic_auth_client(credentials)
+
+    projection = _session_projection(fields, include_interactions)
+    if limit is None:
+        limit = _default_page_size(projection)
+
+    async def _load():
+        sessions = await async_database.find_many(
+            "session", _period_query(legislative_period, after), projection, sort=PERIOD_SORT, limit=limit)
+        if not sessions and after is None:
+            error.raise_404(f"No sessions found for legislative period '{legislative_period}'.")
+
+        headers = {}
+        if len(sessions) == limit:
+            headers["X-Next-After"] = str(sessions[-1]["session_id"])
+        return sessions, headers
+
+    version = await async_database.collection_version("session", {'legislative_period': legislative_period})
+    key = ("period", legislative_period, limit, after, tuple(sorted(projection.items())))
+    return await cache.cached_json_response(request, key, version, _load)
@@ -0,0 +1,75 @@
+import hashlib
+import hmac
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Optional, Set, Tuple
+
+from fastapi.security import HTTPBasicCredentials
+
+from cme import async_database
+from cme.api import error
+
+logger = logging.getLogger("cme.auth")
+
+
+class ClientAuthenticator:
+    """Validates basic auth credentials against the client collection and the
+    <CLIENT>_PASSWORD environment variables. The known clients are loaded
+    with a single query and validated credentials are cached (by a hash of
+    the password) for ttl seconds, so a request normally doesn't need a db
+    round trip. Failed attempts are never cached."""
+
+    def __init__(self, ttl: float = 300.0, maxsize: int = 1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._clients: Optional[Set[str]] = None
+        self._clients_expire: float = 0.0
+        self._validated: "OrderedDict[Tuple[str, bytes], float]" = OrderedDict()
+
+    @staticmethod
+    def _hash(password: str) -> bytes:
+        return hashlib.sha256(password.encode("utf-8")).digest()
+
+    async def preload(self):
+        """Loads all client ids with a single query."""
+
+        self._clients = set(await async_database.find_all_ids("client", "_id"))
+        self._clients_expire = time.monotonic() + self.ttl
+        logger.info(f"preloaded {len(self._clients)} api clients")
+
+    def invalidate(self):
+        self._clients = None
+        self._validated.clear()
+
+    async def _is_known_client(self, username: str) -> bool:
+        if self._clients is None or time.monotonic() >= self._clients_expire:
+            await self.preload()
+        return username in self._clients
+
+    async def authenticate(self, credentials: HTTPBasicCredentials):
+        key = (credentials.username, self._hash(credentials.password))
+        now = time.monotonic()
+
+        expires = self._validated.get(key)
+        if expires is not None:
+            if now < expires:
+                self._validated.move_to_end(key)
+                return
+            del self._validated[key]
+
+        if not await self._is_known_client(credentials.username):
+            error.raise_401(f"Incorrect credentials 1 for client '{credentials.username}'")
+
+        password = os.environ.get(f"{credentials.username.upper()}_PASSWORD")
+        if password is None or not hmac.compare_digest(
+                credentials.password.encode("utf-8"), password.encode("utf-8")):
+            error.raise_401(f"Incorrect credentials 2 for client '{credentials.username}'")
+
+        self._validated[key] = now + self.ttl
+        while len(self._validated) > self.maxsize:
+            self._validated.popitem(last=False)
+
+
+authenticator = ClientAuthenticator(ttl=float(os.getenv("CME_AUTH_CACHE_TTL", 300)))
@@ -0,0 +1,135 @@
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.status import HTTP_304_NOT_MODIFIED
+
+from cme import database, utils
+from cme.api.response import FastJSONResponse
+
+logger = logging.getLogger("cme.cache")
+
+
+class CachedResponse:
+    __slots__ = ("etag", "body", "headers")
+
+    def __init__(self, etag: str, body: bytes, headers: Dict[str, str]):
+        self.etag = etag
+        self.body = body
+        self.headers = headers
+
+    @property
+    def size(self) -> int:
+        return len(self.body)
+
+
+class ResponseCache:
+    """LRU cache of serialized json responses, bounded by the byte size of
+    the cached bodies. Every entry is stored together with the etag of the
+    data version it was built from, so a stale entry is never served even
+    if the writing process couldn't invalidate it."""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, etag: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None or entry.etag != etag:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: Hashable, entry: CachedResponse):
+        self._discard(key)
+        if entry.size > self.max_bytes:
+            return
+
+        self._entries[key] = entry
+        self.size += entry.size
+        while self.size > self.max_bytes:
+            self._discard(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self):
+        self._entries.clear()
+        self.size = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions}
+
+    def _discard(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self.size -= entry.size
+
+
+def build_etag(key: Hashable, version: Any) -> str:
+    """Builds a strong etag from the cache key and the data version, e.g. the
+    'modified' field of a document."""
+
+    return '"{}"'.format(hashlib.sha256(repr((key, version)).encode("utf-8")).hexdigest()[:32])
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+
+    candidates = {c.strip() for c in if_none_match.split(",")}
+    # If-None-Match uses the weak comparison
+    candidates |= {c[2:] for c in candidates if c.startswith("W/")}
+    return "*" in candidates or etag in candidates
+
+
+async def cached_json_response(
+        request: Request,
+        key: Hashable,
+        version: Any,
+        load: Callable[[], Awaitable[Tuple[Any, Dict[str, str]]]]) \
+        -> Response:
+    """Answers with 304 if the client already has the version, otherwise
+    with the cached body or the json of the (content, headers) returned by
+    load. Without a version nothing is cached."""
+
+    if version is None:
+        content, headers = await load()
+        return FastJSONResponse(content, headers=headers)
+
+    etag = build_etag(key, version)
+    if _etag_matches(request, etag):
+        return Response(status_code=HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    entry = response_cache.get(key, etag)
+    if not entry:
+        content, headers = await load()
+        entry = CachedResponse(etag, utils.fast_json_dumps(content).encode("utf-8"), headers)
+        response_cache.put(key, entry)
+
+    return Response(entry.body, media_type="application/json", headers={**entry.headers, "ETag": etag})
+
+
+response_cache = ResponseCache(int(os.getenv("CME_RESPONSE_CACHE_BYTES", 64 * 1024 * 1024)))
+
+# writes of this process invalidate right away, writes of other processes
+# (e.g. the job workers) change the 'modified' based version instead
+database.add_write_listener("session", lambda query: response_cache.invalidate())
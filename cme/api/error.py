@@ -1,11 +1,19 @@
 import logging
 
 from fastapi import HTTPException
-from starlette.status import HTTP_401_UNAUTHORIZED, HTTP_404_NOT_FOUND
+from starlette.status import HTTP_400_BAD_REQUEST, HTTP_401_UNAUTHORIZED, HTTP_404_NOT_FOUND, \
+    HTTP_429_TOO_MANY_REQUESTS
 
 logger = logging.getLogger("cme.error")
 
 
+def raise_400(message: str = 'Bad Request'):
+    raise HTTPException(
+        status_code=HTTP_400_BAD_REQUEST,
+        detail=message,
+    )
+
+
 def raise_401(message: str = 'No Authentication'):
     logging.info(f"Failed authentication: {message}")
     raise HTTPException(
@@ -20,3 +28,11 @@ def raise_404(message: str = 'Not Found'):
         status_code=HTTP_404_NOT_FOUND,
         detail=message,
     )
+
+
+def raise_429(message: str = 'Too Many Requests', retry_after: int = 60):
+    raise HTTPException(
+        status_code=HTTP_429_TOO_MANY_REQUESTS,
+        detail=message,
+        headers={"Retry-After": str(retry_after)},
+    )
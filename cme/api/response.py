@@ -0,0 +1,15 @@
+from typing import Any
+
+from starlette.responses import JSONResponse
+
+from cme import utils
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with ujson through utils.fast_json_dumps. Routes
+    returning it directly (instead of plain content) skip the
+    jsonable_encoder of FastAPI, which is the expensive part for large
+    session documents."""
+
+    def render(self, content: Any) -> bytes:
+        return utils.fast_json_dumps(content).encode("utf-8")
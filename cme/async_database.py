@@ -0,0 +1,191 @@
+"""Non blocking counterpart of cme.database for the api. It offers the same
+read functions on top of motor, so the request handlers can await the db
+instead of blocking the event loop of uvicorn."""
+import asyncio
+import logging
+import os
+import time
+from typing import Optional, List, Tuple, AsyncIterator
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import DESCENDING
+from pymongo.errors import ServerSelectionTimeoutError
+
+from cme.database import _get_credentials, _build_db_url, _round_trip, client_options
+
+logger = logging.getLogger("cme.async_database")
+
+__cme_client = None
+__cme_db = None
+__cme_loop = None
+__cme_pid = None
+__cme_lock = None
+__cme_lock_loop = None
+
+
+async def _open_db_connection(
+        user: str,
+        password: str,
+        address: str,
+        db_name: str,
+        auth_db_name: str = None,
+        test_connection: bool = True,
+        options: dict = None) \
+        -> AsyncIOMotorDatabase:
+    logger.info(f"trying to connect to mongo db {address} (async)")
+
+    db_url = _build_db_url(user, password, address, db_name, auth_db_name)
+
+    client = AsyncIOMotorClient(db_url, tz_aware=True, **(options or {"serverSelectionTimeoutMS": 10000}))
+    db = client[db_name]
+
+    if test_connection:
+        try:
+            await db.command("ping")
+            logger.info(f"Async connection to DB with address '{address}' was successful.")
+        except ServerSelectionTimeoutError as err:
+            client.close()
+            logging.error(f"Timeout while connecting to external DB, error: {err}")
+            raise RuntimeError(
+                f"Connecting to db {address} failed! Please check the "
+                f"used credentials.")
+
+    return db
+
+
+def _get_lock(loop: asyncio.AbstractEventLoop) -> asyncio.Lock:
+    # an asyncio.Lock is bound to the loop it is first used in
+    global __cme_lock
+    global __cme_lock_loop
+    if __cme_lock is None or __cme_lock_loop is not loop:
+        __cme_lock = asyncio.Lock()
+        __cme_lock_loop = loop
+    return __cme_lock
+
+
+async def get_cme_db() -> AsyncIOMotorDatabase:
+    """Returns the motor database of the cme. A motor client is bound to the
+    event loop it was first used in, so a new client is opened if the
+    running loop changed in the meantime (e.g. between test clients). The
+    same goes for a forked process, which must not use the sockets of its
+    parent. Concurrent calls share a single new client."""
+
+    global __cme_client
+    global __cme_db
+    global __cme_loop
+    global __cme_pid
+    loop = asyncio.get_running_loop()
+    if __cme_db is not None and __cme_loop is loop and __cme_pid == os.getpid():
+        return __cme_db
+
+    async with _get_lock(loop):
+        # another request might have opened the client in the meantime
+        if __cme_db is not None and __cme_loop is loop and __cme_pid == os.getpid():
+            return __cme_db
+
+        # the client of another loop or process isn't used by anyone
+        close()
+        username, password, address, db_name = _get_credentials(
+            "CME_DB_USERNAME", "CME_DB_PASSWORD", "CME_DB_ADDRESS", "CME_DB_NAME")
+        db = await _open_db_connection(
+            username, password, address, db_name, db_name, options=client_options("CME"))
+        __cme_client = db.client
+        __cme_db = db
+        __cme_loop = loop
+        __cme_pid = os.getpid()
+        return __cme_db
+
+
+def close():
+    global __cme_client
+    global __cme_db
+    global __cme_loop
+    global __cme_pid
+    # the client of a parent process is dropped without closing it
+    if __cme_client is not None and __cme_pid == os.getpid():
+        __cme_client.close()
+
+    __cme_client = None
+    __cme_db = None
+    __cme_loop = None
+    __cme_pid = None
+
+
+async def ping() -> float:
+    """Returns the round trip time of a ping in seconds."""
+
+    db = await get_cme_db()
+    start = time.perf_counter()
+    await db.command("ping")
+    return time.perf_counter() - start
+
+
+async def find_one(collection_name: str, query: dict, exclude: dict = None) -> Optional[dict]:
+    _round_trip(collection_name, "find_one")
+    db = await get_cme_db()
+    if exclude:
+        return await db[collection_name].find_one(query, exclude)
+    return await db[collection_name].find_one(query)
+
+
+async def find_all_ids(collection_name: str, attribute_name: str) -> list:
+    _round_trip(collection_name, "find")
+    db = await get_cme_db()
+    cursor = db[collection_name].find({}, {attribute_name: 1})
+    return [doc[attribute_name] for doc in await cursor.to_list(length=None)]
+
+
+async def collection_version(collection_name: str, query: dict = None) -> Tuple[int, Optional[str]]:
+    """Returns the count and the latest 'modified' timestamp of the matching
+    documents, which changes with every write through cme.database."""
+
+    _round_trip(collection_name, "find_one")
+    _round_trip(collection_name, "count")
+    db = await get_cme_db()
+    collection = db[collection_name]
+    latest = await collection.find_one(query or {}, {"modified": 1}, sort=[("modified", DESCENDING)])
+    if query:
+        count = await collection.count_documents(query)
+    else:
+        count = await collection.estimated_document_count()
+    return count, latest.get("modified") if latest else None
+
+
+async def find_many(
+        collection_name: str = None,
+        query: dict = None,
+        exclude: dict = None,
+        sort: List[Tuple[str, int]] = None,
+        limit: int = 0) \
+        -> list:
+    """Returns the matching documents. sort and limit are applied by mongo,
+    so only the requested page is transferred."""
+
+    _round_trip(collection_name, "find")
+    db = await get_cme_db()
+    if exclude:
+        cursor = db[collection_name].find(query, exclude)
+    else:
+        cursor = db[collection_name].find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    if limit:
+        cursor = cursor.limit(limit)
+    return await cursor.to_list(length=limit or None)
+
+
+async def aggregate(
+        collection_name: str,
+        pipeline: List[dict],
+        batch_size: int = 100,
+        allow_disk_use: bool = False) \
+        -> AsyncIterator[dict]:
+    """Yields the results of the aggregation pipeline while iterating the
+    cursor, so only batch_size documents are held in memory at a time.
+    allow_disk_use lets blocking stages (e.g. a $sort without an index)
+    exceed the 100 MB memory limit of mongo."""
+
+    _round_trip(collection_name, "aggregate")
+    db = await get_cme_db()
+    async for doc in db[collection_name].aggregate(pipeline, batchSize=batch_size, allowDiskUse=allow_disk_use):
+        yield doc
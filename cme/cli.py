@@ -5,7 +5,7 @@ from pathlib import Path
 import uvicorn
 from dotenv import load_dotenv
 
-from cme.controller import init_mdb_collection, manual_import, dump_mode
+from cme.controller import init_mdb_collection, manual_import, dump_mode, explain_queries
 
 logger = logging.getLogger()
 logger.name = "cme"
@@ -54,6 +54,18 @@ def main():
     manual_parser.add_argument("--notify", default=False, action="store_true",
                                help="Notify Group 3/Sentiment Analyses via HTTP request about new protocols. "
                                     "(Default: False)")
+    manual_parser.add_argument("--xml-engine", type=str, default="bs4", choices=["bs4", "iterparse"],
+                               help="Parser backend for .xml files. iterparse streams the file with lxml instead of "
+                                    "loading the whole document into BeautifulSoup. (Default: bs4)")
+    manual_parser.add_argument("--jobs", "-j", type=int, default=1,
+                               help="Number of worker processes used to parse and extract the given files. The "
+                                    "results are written by the main process. (Default: 1)")
+    manual_parser.add_argument("--force", default=False, action="store_true",
+                               help="Re-import files even if a session with the same source content hash and "
+                                    "pipeline version is already stored. (Default: False)")
+    manual_parser.add_argument("--stats", default=False, action="store_true",
+                               help="Print the time spent per stage, the db round trips, the mdb cache hits and the "
+                                    "dropped interactions after the import. (Default: False)")
     manual_parser.set_defaults(func=manual_import)
 
     dump_parser = subparsers.add_parser("dump", aliases=["d"], help="Let's you extract database raw data. "
@@ -90,6 +102,13 @@ def main():
     init_parser.add_argument("--file", type=Path, help="Path of a json you want to use instead of the remote crawler")
     init_parser.set_defaults(func=init_mdb_collection)
 
+    db_parser = subparsers.add_parser("db", help="Maintenance of the cme database.")
+    db_subparsers = db_parser.add_subparsers()
+    explain_parser = db_subparsers.add_parser("explain",
+                                              help="Explains the queries of the extraction and the api and flags "
+                                                   "the ones scanning a whole collection (COLLSCAN).")
+    explain_parser.set_defaults(func=explain_queries)
+
     args = parser.parse_args()
 
     if not args.env_file.exists() or not args.env_file.is_file():
@@ -103,7 +122,7 @@ def main():
     if args.env_file:
         load_dotenv(args.env_file)
 
-    if len(vars(args)) == 0:
+    if not hasattr(args, "func"):
         parser.error("You must choose one of the subcommands!")
 
     args.func(args)
@@ -1,14 +1,19 @@
 import json
 import logging
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import List, Tuple, Dict, Iterator, Set
 
-from cme import utils, database
+from cme import utils, database, indexes
 from cme.data import read_transcripts_json, read_transcripts_json_file, read_transcript_xml_file
 from cme.domain import Faction, MDB
-from cme.domain import Transcript, CommunicationModel
+from cme.domain import Transcript, CommunicationModel, SessionMetadata, InteractionCandidate
 from cme.extraction import extract_communication_model
+from cme.metrics import metrics
 from cme.utils import get_safe_datetime, safe_json_dumps, safe_json_dump
+from cme.version import PIPELINE_VERSION
 
 logger = logging.getLogger("cme.controller")
 
@@ -16,9 +21,26 @@ logger = logging.getLogger("cme.controller")
 def init_mdb_collection(args):
     file = args.file
     database.delete_many("mdb", {})
+    indexes.ensure_indexes()
     update_mdbs_from_crawler(file)
 
 
+def explain_queries(args):
+    """Prints the stages of the query plans of the app's queries and exits
+    with 1 if a query scans a whole collection."""
+
+    collscans = 0
+    for query, stages in indexes.explain():
+        flag = "COLLSCAN" if "COLLSCAN" in stages else "ok"
+        collscans += flag != "ok"
+        print(f"{flag:>8}  {query.collection:<8} {query.description:<40} {' <- '.join(stages)}")
+
+    if collscans:
+        logger.warning(f"{collscans} queries scan a whole collection, run `cme init` or start the server "
+                       f"to create the missing indexes")
+        sys.exit(1)
+
+
 def update_mdbs_from_crawler(file: Path):
     try:
         if file:
@@ -48,32 +70,175 @@ def update_mdbs_from_crawler(file: Path):
                                     initial=True, created_by="init")
 
 
+def _source_hash_query(source_hashes: List[str]) -> dict:
+    return {"source_hash": {"$in": list(source_hashes)}, "pipeline_version": PIPELINE_VERSION}
+
+
+def _imported_source_hashes(source_hashes: List[str]) -> Set[str]:
+    """Returns the given source hashes of which sessions were already
+    imported with the current PIPELINE_VERSION."""
+
+    sessions = database.find_many("session", _source_hash_query(source_hashes), {"_id": 0, "source_hash": 1})
+    return {session["source_hash"] for session in sessions}
+
+
+def _build_transcript(
+        metadata: SessionMetadata,
+        candidates: List[InteractionCandidate],
+        add_debug_objects: bool = False) \
+        -> Transcript:
+    with metrics.timer("cme_session_seconds"):
+        with metrics.timer("cme_stage_seconds", stage="extract"):
+            interactions = extract_communication_model(candidates=candidates, add_debug_objects=add_debug_objects)
+        with metrics.timer("cme_stage_seconds", stage="transcript"):
+            transcript = Transcript.from_interactions(metadata=metadata, interactions=interactions)
+
+    metrics.inc("cme_sessions_total")
+    metrics.observe("cme_session_candidates", len(candidates))
+    metrics.inc("cme_interactions_total", len(interactions))
+    logger.info(
+        f"extracted {len(interactions)} interactions from {len(candidates)} candidates of session "
+        f"'{metadata.session_no}'")
+    return transcript
+
+
+def _write_transcript(transcript: Transcript, source_hash: str):
+    with metrics.timer("cme_stage_seconds", stage="write"):
+        transcript_dict = transcript.dict(exclude_none=True, exclude_unset=True)
+        transcript_dict['session_id'] = transcript.session_no
+        transcript_dict['source_hash'] = source_hash
+        transcript_dict['pipeline_version'] = PIPELINE_VERSION
+        logger.info(
+            f"writing session '{transcript.session_no}' with '{len(transcript_dict['interactions'])}' "
+            f"interactions into db.")
+        database.update_one("session", {"session_id": transcript.session_no}, transcript_dict)
+
+
 def evaluate_newest_sessions(id_list: List[str]):
-    for id in id_list:
-        current_session = utils.get_crawled_session(id)
+    with database.bulk_writes():
+        evaluated, failed = _evaluate_sessions(id_list)
+
+    if evaluated:
+        utils.notify_sentiment_analysis_group(evaluated)
+    if failed:
+        raise RuntimeError(f"The evaluation of the sessions {failed} failed.")
+
+
+def _evaluate_sessions(id_list: List[str]) -> Tuple[List[str], Dict[str, str]]:
+    """Evaluates the crawled sessions one after another, so a failing session
+    doesn't block the others. Returns the ids of the written sessions and
+    the errors of the failed ones."""
+
+    evaluated = list()
+    failed = dict()
+
+    for id, current_session in utils.iter_crawled_sessions(id_list):
         if not current_session:
             logging.warning(f"Could not find the session '{id}' in crawler DB. Won't update...")
             continue
 
-        file_content = read_transcripts_json(current_session)
-        for metadata, inter_candidates in file_content:
-            transcript = Transcript.from_interactions(
-                metadata=metadata,
-                interactions=extract_communication_model(inter_candidates))
+        try:
+            if _evaluate_session(id, current_session):
+                evaluated.append(id)
+        except Exception as err:
+            logging.exception(f"Evaluating the session '{id}' failed, continuing with the next one...")
+            failed[id] = repr(err)
+
+    return evaluated, failed
+
+
+def _evaluate_session(id: str, current_session: Dict) -> bool:
+    source_hash = utils.crawled_session_hash(current_session)
+    if _imported_source_hashes([source_hash]):
+        logging.info(f"Session '{id}' is unchanged since its last import. Skipping...")
+        return False
+
+    with MDB.identity_cache(), MDB.speaker_registry():
+        with metrics.timer("cme_stage_seconds", stage="parse"):
+            file_content = read_transcripts_json(current_session)
+        transcripts = [
+            _build_transcript(metadata, inter_candidates)
+            for metadata, inter_candidates in file_content]
+
+    written = False
+    for transcript in transcripts:
+        # write to DB
+        if len(transcript.interactions) == 0:
+            logging.warning(f"Could not find any interactions in session with id '{id}'")
+        else:
+            _write_transcript(transcript, source_hash)
+            written = True
+
+    return written
 
-            # write to DB
-            if len(transcript.interactions) == 0:
-                logging.warning(f"Could not find any interactions in session with id '{id}'")
+
+def _convert_file(
+        file: Path,
+        xml_engine: str = "bs4",
+        add_debug_objects: bool = False) \
+        -> List[Transcript]:
+    logger.info("reading \"{}\" now...".format(file.as_posix()))
+
+    with MDB.identity_cache(), MDB.speaker_registry():
+        with metrics.timer("cme_stage_seconds", stage="parse"):
+            if file.suffix.lower() == ".json":
+                logger.info("reading json based transcript file now...")
+                file_content = read_transcripts_json_file(file)
             else:
-                session_id = transcript.session_no
-                logging.info(
-                    f"Inserting evaluated session '{session_id}' with {len(transcript.interactions)} interactions into DB")
+                logger.info("reading xml based transcript file now...")
+                file_content = [read_transcript_xml_file(file, engine=xml_engine)]
+
+        logger.info("extracting communication model now...".format(file.as_posix()))
+        transcripts = list()
+        for metadata, inter_candidates in file_content:
+            transcripts.append(_build_transcript(metadata, inter_candidates, add_debug_objects))
+
+    return transcripts
+
+
+def _init_import_worker(storage_type: str):
+    MDB.set_storage_mode(storage_type)
+
+
+def _convert_file_in_worker(
+        file: Path,
+        xml_engine: str,
+        add_debug_objects: bool) \
+        -> Tuple[List[Transcript], Dict[str, Dict], Dict]:
+    # only the metrics of this file are sent back, the worker might have
+    # converted other files before
+    metrics.reset()
+    transcripts = _convert_file(file, xml_engine, add_debug_objects)
+
+    # runtime storage lives inside the worker process and has to travel
+    # back to the writer together with the transcripts
+    runtime_storage = dict()
+    if MDB._storage_type == "runtime":
+        runtime_storage = MDB._mdb_runtime_storage
 
-                transcript_dict = transcript.dict(exclude_none=True, exclude_unset=True)
-                transcript_dict['session_id'] = session_id
-                database.update_one("session", {"session_id": session_id}, transcript_dict)
+    return transcripts, runtime_storage, metrics.snapshot()
 
-    utils.notify_sentiment_analysis_group(id_list)
+
+def _convert_files_parallel(files: List[Path], args) -> Iterator[Tuple[Path, List[Transcript]]]:
+    # spawn instead of fork, as the MongoClient of the parent process must
+    # not be shared with the workers
+    executor = ProcessPoolExecutor(
+        max_workers=args.jobs,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_import_worker,
+        initargs=(MDB._storage_type,))
+
+    with executor:
+        results = executor.map(
+            _convert_file_in_worker,
+            files,
+            [args.xml_engine] * len(files),
+            [args.add_debug_objects] * len(files))
+
+        for file, (transcripts, runtime_storage, worker_metrics) in zip(files, results):
+            MDB.merge_runtime_storage(runtime_storage)
+            metrics.merge(worker_metrics)
+            yield file, transcripts
 
 
 def manual_import(args):
@@ -89,47 +254,51 @@ def manual_import(args):
                 if sub_file.is_file():
                     files.append(sub_file)
 
-    for file in files:
-        logger.info("reading \"{}\" now...".format(file.as_posix()))
-        transcripts = list()
-
-        if file.suffix.lower() == ".json":
-            logger.info("reading json based transcript file now...")
-            file_content = read_transcripts_json_file(file)
-        else:
-            logger.info("reading xml based transcript file now...")
-            file_content = [read_transcript_xml_file(file)]
-
-        logger.info("extracting communication model now...".format(file.as_posix()))
-        for metadata, inter_candidates in file_content:
-
-            transcript = Transcript.from_interactions(
-                metadata=metadata,
-                interactions=extract_communication_model(
-                    candidates=inter_candidates,
-                    add_debug_objects=args.add_debug_objects))
-
-            # insert into DB
-            if not args.dry_run:
-                transcript_dict = transcript.dict(exclude_none=True, exclude_unset=True)
-                logger.info(f"writing transcript with '{len(transcript_dict['interactions'])}' interactions into db.")
-                database.update_one("session", {"session_id": transcript.session_no}, transcript_dict)
-
-            transcripts.append(transcript)
-
-            # notify sentiment group
-            if args.notify and transcript:
-                utils.notify_sentiment_analysis_group([str(transcript.session_no)])
-
-        cm = CommunicationModel(transcripts=transcripts)
-
-        if args.dry_run:
-            out_file: Path = file.with_suffix(".converted.json")
-            logger.info("writing transcripts into {}.".format(out_file.absolute().as_posix()))
-            with open(out_file, "w", encoding="utf-8") as o:
-                o.write(cm.json(exclude_none=True, indent=4, ensure_ascii=False))
-            with open(out_file.parent / "mdb.json", "w", encoding="utf-8") as o:
-                safe_json_dump(MDB._mdb_runtime_storage, o)
+    # the source of a file is hashed before parsing it, so unchanged files
+    # which were already imported with the current pipeline can be skipped
+    source_hashes = {file: utils.content_hash(file.read_bytes()) for file in files}
+    if not args.dry_run and not args.force:
+        imported = _imported_source_hashes(list(source_hashes.values()))
+        unchanged_files = [file for file in files if source_hashes[file] in imported]
+        for file in unchanged_files:
+            logger.info(f"skipping \"{file.as_posix()}\" as it is unchanged since its last import.")
+        files = [file for file in files if file not in unchanged_files]
+
+    if args.jobs > 1 and len(files) > 1:
+        logger.info(f"converting {len(files)} files with {args.jobs} worker processes...")
+        converted_files = _convert_files_parallel(files, args)
+    else:
+        converted_files = (
+            (file, _convert_file(file, args.xml_engine, args.add_debug_objects))
+            for file in files)
+
+    # the parsing and extraction might happen in worker processes, but the
+    # results are always written from this single process
+    with database.bulk_writes() as writer:
+        for file, transcripts in converted_files:
+            for transcript in transcripts:
+                # insert into DB
+                if not args.dry_run:
+                    _write_transcript(transcript, source_hashes[file])
+
+            # the sentiment group reads the sessions right after the
+            # notification, so they must not be pending anymore
+            if args.notify:
+                writer.flush()
+                utils.notify_sentiment_analysis_group([str(t.session_no) for t in transcripts])
+
+            cm = CommunicationModel(transcripts=transcripts)
+
+            if args.dry_run:
+                out_file: Path = file.with_suffix(".converted.json")
+                logger.info("writing transcripts into {}.".format(out_file.absolute().as_posix()))
+                with open(out_file, "w", encoding="utf-8") as o:
+                    o.write(cm.json(exclude_none=True, indent=4, ensure_ascii=False))
+                with open(out_file.parent / "mdb.json", "w", encoding="utf-8") as o:
+                    safe_json_dump(MDB._mdb_runtime_storage, o)
+
+    if args.stats:
+        print(metrics.summary())
 
 
 def dump_mode(args):
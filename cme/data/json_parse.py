@@ -4,7 +4,7 @@ from datetime import datetime
 from pathlib import Path
 from typing import List, Dict, Tuple
 
-from cme import utils, database
+from cme import utils
 from cme.domain import SessionMetadata, InteractionCandidate, MDB, Faction
 
 logger = logging.getLogger("cme.json")
@@ -28,8 +28,8 @@ def _get_candidates(topic_points: List[Dict], speaker_map: Dict[str, MDB]) -> Li
             speaker = speaker_map.get(sp["rednerId"])
 
             if not speaker:
-                # try to get speaker through mdb_number from DB
-                speaker = database.find_one('mdb', {'mdb_number': sp["rednerId"]})
+                # try to get speaker through mdb_number from the storage
+                speaker = MDB.find_by_mdb_number(sp["rednerId"])
                 if not speaker:
                     if sp['rednerId'] not in not_in_speaker_list:
                         not_in_speaker_list.append(sp['rednerId'])
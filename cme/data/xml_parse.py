@@ -1,9 +1,10 @@
 import logging
 from datetime import datetime
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Tuple, Iterator, Optional, Union, Dict
 
 from bs4 import BeautifulSoup, element as bs4e
+from lxml import etree
 
 from cme.domain import InteractionCandidate, SessionMetadata, MDB, Faction
 from cme.utils import cleanup_str, split_name_str, build_datetime, find_non_ascii_chars, logging_is_needed, \
@@ -89,8 +90,10 @@ def _extract_paragraphs_xml(root_el: bs4e.Tag) -> List[InteractionCandidate]:
                             curr_paragraph = new_para_str
                             continue
 
-                        speaker = curr_speaker if isinstance(curr_speaker, MDB) \
-                            else MDB.find_and_add_in_storage(**curr_speaker, created_by="manualXmlParser")
+                        if not isinstance(curr_speaker, MDB):
+                            # resolved once, the rest of the speech reuses the object
+                            curr_speaker = MDB.find_and_add_in_storage(**curr_speaker, created_by="manualXmlParser")
+                        speaker = curr_speaker
 
                         pms.append(InteractionCandidate(
                             speaker=speaker,
@@ -116,8 +119,10 @@ def _extract_paragraphs_xml(root_el: bs4e.Tag) -> List[InteractionCandidate]:
                             cleanup_str(el.getText())))
                     continue
 
-                speaker = curr_speaker if isinstance(curr_speaker, MDB) \
-                    else MDB.find_and_add_in_storage(**curr_speaker, created_by="manualXmlParser")
+                if not isinstance(curr_speaker, MDB):
+                    # resolved once, the rest of the speech reuses the object
+                    curr_speaker = MDB.find_and_add_in_storage(**curr_speaker, created_by="manualXmlParser")
+                speaker = curr_speaker
 
                 pms.append(InteractionCandidate(
                     speaker=speaker,
@@ -135,8 +140,10 @@ def _extract_paragraphs_xml(root_el: bs4e.Tag) -> List[InteractionCandidate]:
                         cleanup_str(curr_paragraph)))
                 return pms
 
-            speaker = curr_speaker if isinstance(curr_speaker, MDB) \
-                else MDB.find_and_add_in_storage(**curr_speaker, created_by="manualXmlParser")
+            if not isinstance(curr_speaker, MDB):
+                # resolved once, the rest of the speech reuses the object
+                curr_speaker = MDB.find_and_add_in_storage(**curr_speaker, created_by="manualXmlParser")
+            speaker = curr_speaker
 
             pms.append(InteractionCandidate(
                 speaker=speaker,
@@ -160,9 +167,244 @@ def _extract_paragraphs_xml(root_el: bs4e.Tag) -> List[InteractionCandidate]:
     return pms
 
 
-def read_transcript_xml_file(
+_ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+
+
+def _lxml_get_text(element: etree._Element) -> str:
+    # mirrors bs4's getText() which concatenates all descendant strings
+    # without the tail of the element itself. bs4 collapses strings which
+    # only consist of ascii whitespaces into a single newline or space.
+    parts = list()
+    for part in element.itertext():
+        if part and not part.strip(_ASCII_SPACES):
+            part = "\n" if "\n" in part else " "
+        parts.append(part)
+    return "".join(parts)
+
+
+def _lxml_safe_get_text(element: etree._Element, child_tag: str, default=""):
+    searched_child = element.find(f".//{child_tag}")
+    if searched_child is not None: return cleanup_str(_lxml_get_text(searched_child))
+    return default
+
+
+class _IterparseBlock:
+    """Parsing state of a currently open sitzungsbeginn, tagesordnungspunkt or
+    rede element. It holds the same state which is passed around as arguments
+    in _extract_paragraphs_xml."""
+
+    def __init__(
+            self,
+            element: etree._Element,
+            curr_speaker: Union[MDB, Dict, None] = None,
+            curr_paragraph: Optional[str] = None):
+        self.element = element
+        self.curr_speaker = curr_speaker
+        self.curr_paragraph = curr_paragraph
+        self.first_speaker = None
+
+    def speaker(self) -> MDB:
+        if not isinstance(self.curr_speaker, MDB):
+            # resolved once, the rest of the speech reuses the object
+            self.curr_speaker = MDB.find_and_add_in_storage(**self.curr_speaker, created_by="manualXmlParser")
+        return self.curr_speaker
+
+    def handle_child(self, el: etree._Element) -> Iterator[InteractionCandidate]:
+        if el.tag == "name" or (el.tag == "p" and el.get("klasse") == "N"):
+            role, title, first_name, last_name = split_name_str(cleanup_str(_lxml_get_text(el).rstrip(":")))
+            self.curr_speaker = {
+                "forename": cleanup_str(first_name),
+                "surname": cleanup_str(last_name),
+                "memberships": [(datetime.min, None, Faction.NONE)],
+                "job_title": role,
+                "title": title
+            }
+        elif el.tag == "p":
+            category = el.get("klasse")
+
+            if category == "redner":
+                redner_el = el.find(".//redner")
+
+                # workaround for the situation in which the fraktion tags in
+                # the xml somehow contain a direct speech formatted like this "SPD: ja."
+                faction_txt = _lxml_safe_get_text(redner_el, "fraktion")
+                if ":" in faction_txt:
+                    faction_txt = faction_txt.split(":")[0].strip()
+
+                self.curr_speaker = {
+                    "mdb_number": redner_el.get("id"),
+                    "forename": _lxml_safe_get_text(redner_el, "vorname"),
+                    "surname": _lxml_safe_get_text(redner_el, "nachname"),
+                    "memberships": [(datetime.min, None, Faction.from_name(faction_txt))],
+                    "job_title": _lxml_safe_get_text(redner_el, "rolle_lang")}
+
+            elif category in ["J", "J_1", "O", "Z"]:
+                new_para_str = cleanup_str(_lxml_get_text(el))
+                if self.curr_paragraph is not None and self.curr_speaker:
+                    yield self._candidate(self.curr_paragraph, None)
+                self.curr_paragraph = new_para_str
+            else:
+                logger.debug("Ignoring unhandled category \"{}\" of tag "
+                             "p.".format(category))
+        elif el.tag == "kommentar":
+            comment_text = _lxml_get_text(el)
+            if not self.curr_speaker:
+                if logging_is_needed(comment_text):
+                    logger.warning(
+                        "found a comment but there has been no speaker so far"
+                        "! skipping it (\"{}\") until we find a speaker...".format(
+                            cleanup_str(comment_text)))
+                return
+
+            if not self.curr_paragraph:
+                logger.warning(
+                    "found a comment but there has been no paragraph so far"
+                    "! skipping it (\"{}\") until we find a paragraph...".format(
+                        cleanup_str(comment_text)))
+                return
+
+            yield self._candidate(self.curr_paragraph, cleanup_str(comment_text))
+            self.curr_paragraph = None
+
+    def finish(self) -> Iterator[InteractionCandidate]:
+        # finish still open curr_paragraph
+        if self.curr_paragraph is not None:
+            if not self.curr_speaker:
+                logger.warning(
+                    "found a open paragraph but there has been no speaker so far"
+                    "! skipping it (\"{}\"), but this should be investigated as it "
+                    "means no speaker in the whole block has been found".format(
+                        cleanup_str(self.curr_paragraph)))
+                return
+
+            yield self._candidate(self.curr_paragraph, None)
+
+    def _candidate(self, paragraph: str, comment: Optional[str]) -> InteractionCandidate:
+        candidate = InteractionCandidate(
+            speaker=self.speaker(),
+            paragraph=paragraph,
+            comment=comment)
+
+        if self.first_speaker is None:
+            self.first_speaker = candidate.speaker
+
+        return candidate
+
+
+def _release(el: etree._Element):
+    # drops the already processed subtree and all of its processed siblings
+    # so that the memory footprint stays bounded by the size of a single block
+    el.clear()
+    parent = el.getparent()
+    if parent is not None:
+        while el.getprevious() is not None:
+            del parent[0]
+
+
+def _extract_metadata_iterparse(events: Iterator[Tuple[str, etree._Element]]) -> SessionMetadata:
+    root_el = None
+    for event, el in events:
+        if root_el is None:
+            root_el = el
+        elif event == "end" and el.tag == "kopfdaten":
+            sn_el = el.find(".//sitzungsnr")
+            lp_el = el.find(".//wahlperiode")
+
+            date_str = root_el.get("sitzung-datum")
+            session_start = root_el.get("sitzung-start-uhrzeit")
+            session_end = root_el.get("sitzung-ende-uhrzeit")
+
+            return SessionMetadata(
+                session_no=get_session_id_safe(_lxml_get_text(lp_el), _lxml_get_text(sn_el)),
+                legislative_period=int(_lxml_get_text(lp_el)),
+                start=build_datetime(date_str, session_start),
+                end=build_datetime(date_str, session_end))
+
+    raise RuntimeError("could not find the kopfdaten element of the transcript!")
+
+
+def _extract_paragraphs_iterparse(
+        events: Iterator[Tuple[str, etree._Element]]) \
+        -> Iterator[InteractionCandidate]:
+    in_sitzungsverlauf = False
+    seen_session_start = False
+    original_speaker = None
+    blocks: List[_IterparseBlock] = list()
+
+    for event, el in events:
+        parent = el.getparent()
+
+        if event == "start":
+            if el.tag == "sitzungsverlauf":
+                in_sitzungsverlauf = True
+            elif not in_sitzungsverlauf:
+                continue
+            elif not blocks:
+                if el.tag == "sitzungsbeginn" and not seen_session_start:
+                    seen_session_start = True
+                    blocks.append(_IterparseBlock(el))
+                elif el.tag == "tagesordnungspunkt":
+                    blocks.append(_IterparseBlock(el, original_speaker))
+            elif el.tag == "rede" and parent is blocks[-1].element:
+                parent_block = blocks[-1]
+                blocks.append(_IterparseBlock(el, parent_block.curr_speaker, parent_block.curr_paragraph))
+
+            continue
+
+        if blocks and el is blocks[-1].element:
+            block = blocks.pop()
+            yield from block.finish()
+
+            if el.tag == "sitzungsbeginn":
+                original_speaker = block.first_speaker
+
+            _release(el)
+        elif blocks and parent is blocks[-1].element:
+            yield from blocks[-1].handle_child(el)
+            _release(el)
+        elif el.tag == "sitzungsverlauf":
+            # nothing after the sitzungsverlauf is relevant for us
+            break
+        elif not blocks and parent is not None and (parent.tag == "sitzungsverlauf" or parent.getparent() is None):
+            _release(el)
+
+
+def stream_transcript_xml_file(
         file: Path) \
+        -> Tuple[SessionMetadata, Iterator[InteractionCandidate]]:
+    """Alternative to read_transcript_xml_file which is based on
+    lxml.etree.iterparse. The metadata is read eagerly while the returned
+    iterator lazily emits the same candidates as the BeautifulSoup based
+    parser and releases every processed block of the file."""
+
+    f = file.open(mode="rb")
+    events = etree.iterparse(f, events=("start", "end"))
+
+    try:
+        metadata = _extract_metadata_iterparse(events)
+    except BaseException:
+        f.close()
+        raise
+
+    def _candidates() -> Iterator[InteractionCandidate]:
+        try:
+            yield from _extract_paragraphs_iterparse(events)
+        finally:
+            f.close()
+
+    return metadata, _candidates()
+
+
+def read_transcript_xml_file(
+        file: Path,
+        engine: str = "bs4") \
         -> Tuple[SessionMetadata, List[InteractionCandidate]]:
+    if engine == "iterparse":
+        metadata, candidates = stream_transcript_xml_file(file)
+        return metadata, list(candidates)
+    elif engine != "bs4":
+        raise RuntimeError(f"unsupported xml engine \"{engine}\"!")
+
     with file.open(mode="rb") as f:
         soup = BeautifulSoup(f, "xml")
 
@@ -1,18 +1,62 @@
 import logging
 import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Tuple
+from typing import Tuple, Dict, Iterable, Iterator, Optional, List, Callable
 
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne, DESCENDING
 from pymongo.database import Database as MongoDatabase
 from pymongo.errors import ServerSelectionTimeoutError
 
+from cme.metrics import metrics
+
 logger = logging.getLogger("cme.database")
 
-__cme_client = None
-__cme_db = None
-__crawler_client = None
-__crawler_db = None
+__bulk_writer = None
+__write_listeners: Dict[str, List[Callable[[dict], None]]] = defaultdict(list)
+
+
+def _build_db_url(
+        user: str,
+        password: str,
+        address: str,
+        db_name: str,
+        auth_db_name: str = None) \
+        -> str:
+    if not auth_db_name:
+        auth_db_name = "admin"
+
+    if user:
+        return f"mongodb://{user}:{password}@{address}/?authSource={auth_db_name}"
+    return f"mongodb://{address}/{db_name}"
+
+
+_CLIENT_OPTIONS = {
+    "MAX_POOL_SIZE": "maxPoolSize",
+    "MIN_POOL_SIZE": "minPoolSize",
+    "MAX_IDLE_TIME_MS": "maxIdleTimeMS",
+    "CONNECT_TIMEOUT_MS": "connectTimeoutMS",
+    "SOCKET_TIMEOUT_MS": "socketTimeoutMS",
+    "SERVER_SELECTION_TIMEOUT_MS": "serverSelectionTimeoutMS",
+    "WAIT_QUEUE_TIMEOUT_MS": "waitQueueTimeoutMS",
+    "COMPRESSORS": "compressors",
+}
+
+
+def client_options(prefix: str) -> dict:
+    """Returns the MongoClient pool, timeout and compression options set by
+    the {prefix}_DB_* environment variables, e.g. CME_DB_MAX_POOL_SIZE or
+    CME_DB_COMPRESSORS=zstd,zlib."""
+
+    options = {"serverSelectionTimeoutMS": 10000}
+    for key, option in _CLIENT_OPTIONS.items():
+        value = os.getenv(f"{prefix}_DB_{key}")
+        if value:
+            options[option] = value if option == "compressors" else int(value)
+    return options
 
 
 def _open_db_connection(
@@ -21,24 +65,19 @@ def _open_db_connection(
         address: str,
         db_name: str,
         auth_db_name: str = None,
-        test_connection: bool = True) \
+        test_connection: bool = True,
+        options: dict = None) \
         -> Tuple[MongoClient, MongoDatabase]:
     logger.info(f"trying to connect to mongo db {address}")
 
-    if not auth_db_name:
-        auth_db_name = "admin"
+    db_url = _build_db_url(user, password, address, db_name, auth_db_name)
 
-    if user:
-        db_url = f"mongodb://{user}:{password}@{address}/?authSource={auth_db_name}"
-    else:
-        db_url = f"mongodb://{address}/{db_name}"
-
-    client = MongoClient(db_url, tz_aware=True, serverSelectionTimeoutMS=10000)
+    client = MongoClient(db_url, tz_aware=True, **(options or {"serverSelectionTimeoutMS": 10000}))
     db = client[db_name]
 
     if test_connection:
         try:
-            collections = db.list_collection_names()
+            db.command("ping")
             logger.info(f"Connection to DB with address '{address}' was successful.")
         except ServerSelectionTimeoutError as err:
             logging.error(f"Timeout while connecting to external DB, error: {err}")
@@ -88,30 +127,81 @@ def _generic_get_db(
     if use_default_auth_db:
         auth_db = "admin"
 
-    return _open_db_connection(username, password, address, db_name, auth_db)
+    return _open_db_connection(username, password, address, db_name, auth_db, options=client_options(prefix))
 
 
-def get_cme_db() -> MongoDatabase:
-    global __cme_db
-    global __cme_client
-    if __cme_db:
-        return __cme_db
+class ConnectionManager:
+    """Opens the MongoClient of the {prefix}_DB_* database lazily, once per
+    process. A MongoClient must not be used after a fork, so a process
+    forked after the connection was opened (e.g. a gunicorn worker of a
+    preloaded app) opens its own client instead of sharing the sockets of
+    the parent."""
+
+    def __init__(self, prefix: str, use_default_auth_db: bool = True):
+        self.prefix = prefix
+        self.use_default_auth_db = use_default_auth_db
+        self._client: Optional[MongoClient] = None
+        self._db: Optional[MongoDatabase] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def get_db(self) -> MongoDatabase:
+        if self._db is not None and self._pid == os.getpid():
+            return self._db
+
+        with self._lock:
+            if self._db is None or self._pid != os.getpid():
+                # the client of the parent process is dropped, not closed,
+                # as closing would end the sessions of the parent
+                self._client, self._db = _generic_get_db(self.prefix, self.use_default_auth_db)
+                self._pid = os.getpid()
+        return self._db
+
+    def ping(self) -> float:
+        """Returns the round trip time of a ping in seconds."""
 
-    __cme_client, __cme_db = _generic_get_db("CME", False)
-    return __cme_db
+        db = self.get_db()
+        start = time.perf_counter()
+        db.command("ping")
+        return time.perf_counter() - start
+
+    def close(self):
+        with self._lock:
+            if self._client is not None and self._pid == os.getpid():
+                self._client.close()
+            self._client = None
+            self._db = None
+            self._pid = None
+
+
+__cme_connection = ConnectionManager("CME", use_default_auth_db=False)
+__crawler_connection = ConnectionManager("CRAWLER")
+
+
+def get_cme_db() -> MongoDatabase:
+    return __cme_connection.get_db()
 
 
 def get_crawler_db() -> MongoDatabase:
-    global __crawler_db
-    global __crawler_client
-    if __crawler_db:
-        return __crawler_db
+    return __crawler_connection.get_db()
+
 
-    __crawler_client, __crawler_db = _generic_get_db("CRAWLER")
-    return __crawler_db
+def ping() -> float:
+    return __cme_connection.ping()
+
+
+def close():
+    __cme_connection.close()
+    __crawler_connection.close()
+
+
+def _round_trip(collection_name: str, operation: str):
+    metrics.inc("cme_db_round_trips_total", collection=collection_name, operation=operation)
 
 
 def find_one(collection_name: str, query: dict, exclude: dict = None) -> dict:
+    _flush_pending_writes(collection_name)
+    _round_trip(collection_name, "find_one")
     db = get_cme_db()
     if exclude:
         return db[collection_name].find_one(query, exclude)
@@ -119,12 +209,16 @@ def find_one(collection_name: str, query: dict, exclude: dict = None) -> dict:
 
 
 def find_all_ids(collection_name: str, attribute_name: str):
+    _flush_pending_writes(collection_name)
+    _round_trip(collection_name, "find")
     db = get_cme_db()
     result = db[collection_name].find({}, {attribute_name: 1})
-    return [session['session_id'] for session in result]
+    return [doc[attribute_name] for doc in result]
 
 
 def find_many(collection_name: str = None, query: dict = None, exclude: dict = None) -> list:
+    _flush_pending_writes(collection_name)
+    _round_trip(collection_name, "find")
     db = get_cme_db()
     if exclude:
         cursor = db[collection_name].find(query, exclude)
@@ -138,14 +232,27 @@ def find_many(collection_name: str = None, query: dict = None, exclude: dict = N
     return list
 
 
+def collection_version(collection_name: str) -> Tuple[int, Optional[str]]:
+    """Returns the document count and the latest 'modified' timestamp of the
+    collection. As update_one sets 'modified' on every write, the result
+    changes whenever a document is written or deleted."""
+
+    _flush_pending_writes(collection_name)
+    _round_trip(collection_name, "find_one")
+    _round_trip(collection_name, "count")
+    collection = get_cme_db()[collection_name]
+    latest = collection.find_one({}, {"modified": 1}, sort=[("modified", DESCENDING)])
+    return collection.estimated_document_count(), latest.get("modified") if latest else None
+
+
 def insert_many(collection_name: str, query: list) -> None:
+    _round_trip(collection_name, "insert_many")
     db = get_cme_db()
     collection = db[collection_name]
     collection.insert_many(query)
 
 
-def update_one(collection_name: str, query: dict, update: dict, on_insert=None, created_by=None):
-    db = get_cme_db()
+def _build_upsert(update: dict, on_insert=None, created_by=None) -> dict:
     if on_insert is None:
         on_insert = {}
     if created_by:
@@ -153,13 +260,165 @@ def update_one(collection_name: str, query: dict, update: dict, on_insert=None,
     now = datetime.utcnow().isoformat()
     update['modified'] = now
     on_insert['created'] = now
-    result = db[collection_name].update_one(query, {'$set': update, '$setOnInsert': on_insert}, upsert=True)
+    return {'$set': update, '$setOnInsert': on_insert}
+
+
+def update_one(collection_name: str, query: dict, update: dict, on_insert=None, created_by=None):
+    """Upserts a single document. While a bulk_writes block buffers the
+    collection, the write is deferred and None is returned as the result is
+    not known yet."""
+
+    upsert = _build_upsert(update, on_insert, created_by)
+    _notify_write_listeners(collection_name, query)
+
+    if __bulk_writer and __bulk_writer.buffers(collection_name):
+        __bulk_writer.add(collection_name, query, upsert)
+        return None
+
+    _round_trip(collection_name, "update_one")
+    db = get_cme_db()
+    result = db[collection_name].update_one(query, upsert, upsert=True)
     if result.modified_count == 1:
         return True
     return False
 
 
 def delete_many(collection_name: str, query: dict):
+    _flush_pending_writes(collection_name)
+    _notify_write_listeners(collection_name, query)
+    _round_trip(collection_name, "delete_many")
     db = get_cme_db()
     collection = db[collection_name]
     collection.delete_many(query)
+
+
+class BulkWriter:
+    """Collects the upserts of update_one per collection and writes them with
+    a single unordered bulk_write once max_operations documents are pending
+    or the oldest pending write is older than max_delay seconds. Upserts for
+    the same query are merged into one operation, so the unordered execution
+    can't reorder writes to the same document.
+
+    The thresholds are checked whenever a write is added, there is no
+    background flushing. Reads through this module flush the pending writes
+    of the read collection first."""
+
+    def __init__(
+            self,
+            collections: Iterable[str] = ("session", "mdb"),
+            max_operations: int = 500,
+            max_delay: float = 5.0):
+        self.collections = set(collections)
+        self.max_operations = max_operations
+        self.max_delay = max_delay
+        self.operations = 0
+        self.round_trips = 0
+        self._pending: Dict[str, Dict[tuple, Tuple[dict, dict]]] = dict()
+        self._oldest_pending: Optional[float] = None
+
+    @property
+    def saved_round_trips(self) -> int:
+        return self.operations - self.round_trips
+
+    def buffers(self, collection_name: str) -> bool:
+        return collection_name in self.collections
+
+    def pending(self, collection_name: str = None) -> int:
+        if collection_name:
+            return len(self._pending.get(collection_name, dict()))
+        return sum(len(p) for p in self._pending.values())
+
+    def add(self, collection_name: str, query: dict, upsert: dict):
+        self.operations += 1
+        if self._oldest_pending is None:
+            self._oldest_pending = time.monotonic()
+
+        collection_pending = self._pending.setdefault(collection_name, dict())
+        key = tuple(sorted(query.items()))
+        if key in collection_pending:
+            _, pending_upsert = collection_pending[key]
+            pending_upsert['$set'].update(upsert['$set'])
+            pending_upsert['$setOnInsert'] = {**upsert['$setOnInsert'], **pending_upsert['$setOnInsert']}
+        else:
+            # copied, as merging later upserts must not touch the caller's dicts
+            collection_pending[key] = (query, {'$set': dict(upsert['$set']),
+                                               '$setOnInsert': dict(upsert['$setOnInsert'])})
+
+        if self.pending() >= self.max_operations or time.monotonic() - self._oldest_pending >= self.max_delay:
+            self.flush()
+
+    def flush(self, collection_name: str = None):
+        """Writes the pending upserts of the given or all collections."""
+
+        collection_names = [collection_name] if collection_name else list(self._pending.keys())
+
+        for name in collection_names:
+            collection_pending = self._pending.pop(name, None)
+            if not collection_pending:
+                continue
+
+            operations = [UpdateOne(query, upsert, upsert=True) for query, upsert in collection_pending.values()]
+            _round_trip(name, "bulk_write")
+            with metrics.timer("cme_stage_seconds", stage="bulk_write"):
+                get_cme_db()[name].bulk_write(operations, ordered=False)
+            self.round_trips += 1
+            logger.debug(f"flushed {len(operations)} pending writes into '{name}'")
+
+        if not self._pending:
+            self._oldest_pending = None
+
+    def __enter__(self) -> "BulkWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
+
+
+@contextmanager
+def bulk_writes(
+        collections: Iterable[str] = ("session", "mdb"),
+        max_operations: int = 500,
+        max_delay: float = 5.0) \
+        -> Iterator[BulkWriter]:
+    """Buffers all update_one calls for the given collections in a
+    BulkWriter for the duration of the with block and flushes them at its
+    end. Nested usages share the outer writer."""
+
+    global __bulk_writer
+    if __bulk_writer:
+        yield __bulk_writer
+        return
+
+    writer = BulkWriter(collections, max_operations, max_delay)
+    __bulk_writer = writer
+    try:
+        with writer:
+            yield writer
+    finally:
+        __bulk_writer = None
+        if writer.operations:
+            logger.info(
+                f"bulk writes: {writer.operations} writes in {writer.round_trips} round trips "
+                f"({writer.saved_round_trips} round trips saved)")
+
+
+def _flush_pending_writes(collection_name: str):
+    if __bulk_writer and __bulk_writer.pending(collection_name):
+        __bulk_writer.flush(collection_name)
+
+
+def add_write_listener(collection_name: str, listener: Callable[[dict], None]):
+    """Registers a callback which is called with the query of every write to
+    the collection through this module, e.g. to invalidate caches. Writes of
+    other processes aren't reported."""
+
+    __write_listeners[collection_name].append(listener)
+
+
+def remove_write_listener(collection_name: str, listener: Callable[[dict], None]):
+    __write_listeners[collection_name].remove(listener)
+
+
+def _notify_write_listeners(collection_name: str, query: dict):
+    for listener in __write_listeners.get(collection_name, ()):
+        listener(query)
@@ -2,14 +2,19 @@
 place"""
 import json
 import logging
+import re
 import uuid
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
-from typing import List, Optional, Dict, Tuple, Union
+from typing import List, Optional, Dict, Tuple, Union, Set, Iterator, Hashable
 
 from pydantic import BaseModel
 
 from cme import database
+from cme.metrics import metrics
 
 logger = logging.getLogger("cme.domain")
 
@@ -149,22 +154,113 @@ class Faction(Enum):
     @classmethod
     def in_text(cls, text: str) -> List["Faction"]:
         """Utility function which returns a list of Faction objects which
-        are noted through one of there possible_names in the given text."""
+        are noted through one of there possible_names in the given text. The
+        factions are returned in the order of their definition."""
 
-        found = set()
-        for faction in cls:
-            for name in faction._possible_names:
-                if name in text:
-                    found.add(faction)
-                    break
+        return _faction_matcher.factions_in(text)
+
+    @classmethod
+    def spans_in_text(cls, text: str) -> List[Tuple[int, int, "Faction"]]:
+        """Utility function which returns the (start, end, Faction) offsets
+        of all possible_names found in the given text. Matches are leftmost
+        longest and don't overlap, e.g. "CDU/CSU" is a single span."""
 
-        return list(found)
+        return _faction_matcher.spans_in(text)
 
     @property
     def id(self) -> str:
         return self.value
 
 
+def _build_trie_pattern(words: List[str]) -> str:
+    trie = dict()
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, dict())
+        node[""] = dict()
+
+    def _build(node: Dict) -> str:
+        alternatives = [re.escape(char) + _build(child) for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ""
+
+        pattern = alternatives[0] if len(alternatives) == 1 else "(?:{})".format("|".join(alternatives))
+        if "" in node:
+            # greedy, so the longest name starting at a position wins
+            pattern = "(?:{})?".format(pattern)
+        return pattern
+
+    return _build(trie)
+
+
+class _FactionMatcher:
+    """Precompiled multi pattern matcher over the possible_names of all
+    factions. The names are compiled into a single trie shaped regex which
+    finds the leftmost longest names in one pass over the text. Every found
+    name also implies all other names it contains (e.g. "CDU/CSU" contains
+    "CSU"), so the found factions are the same as testing every name on its
+    own."""
+
+    def __init__(self, factions: List[Faction]):
+        self._factions = factions
+        self._faction_by_name: Dict[str, Faction] = dict()
+        for faction in factions:
+            for name in faction._possible_names:
+                self._faction_by_name.setdefault(name, faction)
+
+        names = list(self._faction_by_name.keys())
+        self._implied_factions: Dict[str, Set[Faction]] = {
+            name: {f for n, f in self._faction_by_name.items() if n in name}
+            for name in names}
+
+        self._pattern = re.compile("({})".format(_build_trie_pattern(names)))
+
+        # a name starting inside another name and ending behind it (e.g.
+        # "SPDie Grünen") is hidden by the non overlapping scan. The offsets
+        # where this is possible are checked separately after a match.
+        self._overlap_offsets: Dict[str, List[int]] = dict()
+        for name in names:
+            offsets = set()
+            for other in names:
+                if self._faction_by_name[other] in self._implied_factions[name]:
+                    continue
+                for overlap in range(1, min(len(name), len(other))):
+                    if name.endswith(other[:overlap]):
+                        offsets.add(len(name) - overlap)
+            if offsets:
+                self._overlap_offsets[name] = sorted(offsets)
+
+        # the implied factions as bits in the order of self._factions, which
+        # avoids hashing the Enum members in factions_in
+        self._implied_bits: Dict[str, int] = {
+            name: sum(1 << i for i, f in enumerate(factions) if f in implied)
+            for name, implied in self._implied_factions.items()}
+
+    def factions_in(self, text: str) -> List[Faction]:
+        found = 0
+        for match in self._pattern.finditer(text):
+            name = match.group(1)
+            found |= self._implied_bits[name]
+
+            for offset in self._overlap_offsets.get(name, ()):
+                overlapping = self._pattern.match(text, match.start(1) + offset)
+                if overlapping:
+                    found |= self._implied_bits[overlapping.group(1)]
+
+        if not found:
+            return []
+        return [f for i, f in enumerate(self._factions) if found >> i & 1]
+
+    def spans_in(self, text: str) -> List[Tuple[int, int, Faction]]:
+        return [
+            (match.start(1), match.end(1), self._faction_by_name[match.group(1)])
+            for match in self._pattern.finditer(text)]
+
+
+_faction_matcher = _FactionMatcher(list(Faction))
+
+
 class SessionMetadata(BaseModel):
     session_no: int
     legislative_period: int
@@ -176,6 +272,147 @@ mdb_storage = dict()
 mdb_name_map = dict()
 next_mdb_id = 0
 
+MDB_ID_NAMESPACE = uuid.UUID("5d0b1c2e-8f3a-4c61-9d6e-2b7f0a4e9c13")
+
+
+class MDBIdentityCache:
+    """Bounded LRU cache in front of the mdb collection. Entries are keyed by
+    ("mdb_number", <mdb_number>) and ("name", (<forename>, <surname>)) and
+    hold the mdb document which the equivalent database lookup would have
+    returned (None included). Writes have to be reported through invalidate
+    to keep the cache consistent with the database."""
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, Optional[Dict]]" = OrderedDict()
+        self._keys_by_speaker: Dict[str, Set[Hashable]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Tuple[bool, Optional[Dict]]:
+        """Returns a tuple of a found flag and the cached document."""
+
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, self._entries[key]
+
+        self.misses += 1
+        return False, None
+
+    def put(self, key: Hashable, mdb: Optional[Dict]):
+        if key in self._entries:
+            self._forget(key)
+
+        self._entries[key] = mdb
+        if mdb:
+            self._keys_by_speaker[mdb["speaker_id"]].add(key)
+
+        while len(self._entries) > self.maxsize:
+            oldest_key = next(iter(self._entries))
+            self._forget(oldest_key)
+            self.evictions += 1
+
+    def preload(self, mdbs: List[Dict]):
+        """Fills the cache with the result of a single bulk query."""
+
+        by_name = defaultdict(list)
+        for mdb in mdbs:
+            if mdb.get("mdb_number"):
+                self.put(("mdb_number", mdb["mdb_number"]), mdb)
+            by_name[(mdb.get("forename"), mdb.get("surname"))].append(mdb)
+
+        for name, possible_mdbs in by_name.items():
+            self.put(("name", name), MDB.get_latest_mdb(possible_mdbs))
+
+    def remember(self, mdb: Dict):
+        """Caches a just written mdb document under its mdb_number and name."""
+
+        if mdb.get("mdb_number"):
+            self.put(("mdb_number", mdb["mdb_number"]), mdb)
+        self.put(("name", (mdb.get("forename"), mdb.get("surname"))), mdb)
+
+    def invalidate(
+            self,
+            speaker_id: Optional[str] = None,
+            mdb_number: Optional[str] = None,
+            name: Optional[Tuple[str, str]] = None):
+        """Drops all entries pointing to the given speaker as well as the
+        entries for the given mdb_number and name (which might be cached as
+        not existent)."""
+
+        keys = set(self._keys_by_speaker.get(speaker_id, set()))
+        if mdb_number:
+            keys.add(("mdb_number", mdb_number))
+        if name:
+            keys.add(("name", name))
+
+        for key in keys:
+            if key in self._entries:
+                self._forget(key)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions}
+
+    def _forget(self, key: Hashable):
+        mdb = self._entries.pop(key)
+        if mdb:
+            speaker_keys = self._keys_by_speaker[mdb["speaker_id"]]
+            speaker_keys.discard(key)
+            if not speaker_keys:
+                del self._keys_by_speaker[mdb["speaker_id"]]
+
+
+class SpeakerRegistry:
+    """Canonical MDB objects of a single session. The same speaker is looked
+    up for every paragraph of a speech and every comment of a sender, so
+    find_and_add_in_storage returns the registered object for a known
+    ("mdb_number", <mdb_number>) or ("name", (<forename>, <surname>)) key
+    instead of building and validating a new one. All keys of a speaker
+    share one object, which is updated if the stored mdb changes."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._by_key: Dict[Hashable, "MDB"] = dict()
+        self._by_speaker_id: Dict[str, "MDB"] = dict()
+
+    def __len__(self) -> int:
+        return len(self._by_speaker_id)
+
+    def get(self, key: Hashable) -> Optional["MDB"]:
+        mdb = self._by_key.get(key)
+        if mdb is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return mdb
+
+    def get_by_speaker_id(self, speaker_id: str) -> Optional["MDB"]:
+        return self._by_speaker_id.get(speaker_id)
+
+    def register(self, key: Hashable, mdb: "MDB") -> "MDB":
+        """Returns the canonical object of the speaker, updated with the
+        fields of the given mdb if it is already registered."""
+
+        canonical = self._by_speaker_id.get(mdb.speaker_id)
+        if canonical is None:
+            canonical = self._by_speaker_id[mdb.speaker_id] = mdb
+        elif canonical is not mdb:
+            for field in mdb.__fields_set__:
+                setattr(canonical, field, getattr(mdb, field))
+
+        self._by_key[key] = canonical
+        return canonical
+
 
 # member of german bundestag
 class MDB(BaseModel):
@@ -184,6 +421,10 @@ class MDB(BaseModel):
     _mdb_runtime_storage: Dict[str, Dict] = dict()
     _mdb_runtime_storage_mdb_number_index: Dict[str, str] = dict()
     _mdb_runtime_storage_name_index: Dict[Tuple[str, str], str] = dict()
+    _mdb_runtime_storage_version = 0
+    _identity_cache: Optional[MDBIdentityCache] = None
+    _speaker_registry: Optional[SpeakerRegistry] = None
+    _surname_index: Optional[Tuple[Hashable, Dict[str, "MDB"]]] = None
 
     # instance vars
     speaker_id: str
@@ -209,6 +450,118 @@ class MDB(BaseModel):
     def id(self) -> str:
         return self.speaker_id
 
+    @classmethod
+    def build_speaker_id(cls, mdb_number: Optional[str], forename: str, surname: str) -> str:
+        """Derives the speaker_id deterministically from the identifying
+        fields. This way independent processes (e.g. the workers of cme
+        manual --jobs) create the same id for the same person instead of
+        minting duplicates. find_and_add_in_storage only passes the
+        mdb_number for the initial import of the master data, see there."""
+
+        if mdb_number:
+            key = f"mdb_number:{mdb_number}"
+        else:
+            key = f"name:{forename}|{surname}"
+
+        return f"MDB-{uuid.uuid5(MDB_ID_NAMESPACE, key)}"
+
+    @classmethod
+    def _update_runtime_storage(cls, key: str, value: Dict):
+        mdb_dict = cls._mdb_runtime_storage.get(key, dict())
+        mdb_dict.update(value)
+        cls._mdb_runtime_storage_version += 1
+
+        cls._mdb_runtime_storage[key] = mdb_dict
+
+        name_tuple = (mdb_dict["forename"], mdb_dict["surname"])
+        cls._mdb_runtime_storage_name_index[name_tuple] = key
+
+        mdb_number = mdb_dict.get("mdb_number")
+        if mdb_number:
+            cls._mdb_runtime_storage_mdb_number_index[mdb_number] = key
+
+    @classmethod
+    def merge_runtime_storage(cls, storage: Dict[str, Dict]):
+        """Merges the runtime storage of another process into the one of
+        this process."""
+
+        for key, value in storage.items():
+            cls._update_runtime_storage(key, value)
+
+    @staticmethod
+    def get_latest_mdb(possible_mdbs: List[Dict]) -> Dict:
+        latest_mdb = possible_mdbs[0]
+        for mdb in possible_mdbs:
+            if datetime.fromisoformat(mdb['modified']) > datetime.fromisoformat(latest_mdb['modified']):
+                latest_mdb = mdb
+
+        return latest_mdb
+
+    @classmethod
+    @contextmanager
+    def identity_cache(cls, maxsize: int = 10000, preload: bool = True) -> Iterator[Optional[MDBIdentityCache]]:
+        """Puts a MDBIdentityCache in front of find_and_add_in_storage for the
+        duration of the with block, e.g. the import of a single session. The
+        cache is preloaded with one bulk query and only used for the mongodb
+        storage type. Nested usages share the outer cache."""
+
+        if cls._storage_type != "mongodb":
+            yield None
+            return
+
+        if cls._identity_cache:
+            yield cls._identity_cache
+            return
+
+        cache = MDBIdentityCache(maxsize)
+        if preload:
+            cache.preload(database.find_many("mdb"))
+
+        cls._identity_cache = cache
+        try:
+            yield cache
+        finally:
+            cls._identity_cache = None
+            metrics.inc("cme_mdb_cache_total", cache.hits, result="hit")
+            metrics.inc("cme_mdb_cache_total", cache.misses, result="miss")
+            metrics.inc("cme_mdb_cache_total", cache.evictions, result="eviction")
+            logger.info(
+                f"mdb identity cache: {cache.hits} hits, {cache.misses} misses, "
+                f"{cache.evictions} evictions")
+
+    @classmethod
+    @contextmanager
+    def speaker_registry(cls) -> Iterator[SpeakerRegistry]:
+        """Puts a SpeakerRegistry in front of find_and_add_in_storage for the
+        duration of the with block, e.g. the import of a single session, so
+        all candidates and interactions of a speaker share one MDB object.
+        Nested usages share the outer registry."""
+
+        if cls._speaker_registry is not None:
+            yield cls._speaker_registry
+            return
+
+        registry = SpeakerRegistry()
+        cls._speaker_registry = registry
+        try:
+            yield registry
+        finally:
+            cls._speaker_registry = None
+            metrics.inc("cme_speaker_registry_total", registry.hits, result="hit")
+            metrics.inc("cme_speaker_registry_total", registry.misses, result="miss")
+            logger.info(
+                f"speaker registry: {len(registry)} speakers, {registry.hits} hits, "
+                f"{registry.misses} misses")
+
+    @classmethod
+    def find_by_mdb_number(cls, mdb_number: str) -> Optional[Dict]:
+        if cls._storage_type == "mongodb":
+            return database.find_one("mdb", {"mdb_number": mdb_number})
+        elif cls._storage_type == "runtime":
+            return cls._mdb_runtime_storage.get(cls._mdb_runtime_storage_mdb_number_index.get(mdb_number))
+        else:
+            raise RuntimeError("unsupported storage type!")
+
     @classmethod
     def find_known_mdbs(cls) -> List["MDB"]:
         def _find_all() -> Optional[List[Dict]]:
@@ -223,6 +576,47 @@ class MDB(BaseModel):
         logger.debug(f"retrieved {len(mdbs)} MDB entities from {cls._storage_type}")
         return mdbs
 
+    @classmethod
+    def storage_version(cls) -> Hashable:
+        """Returns a value which changes whenever the stored mdbs change."""
+
+        if cls._storage_type == "mongodb":
+            return database.collection_version("mdb")
+        elif cls._storage_type == "runtime":
+            return cls._storage_type, cls._mdb_runtime_storage_version
+        else:
+            raise RuntimeError("unsupported storage type!")
+
+    @classmethod
+    def surname_index(cls) -> Dict[str, "MDB"]:
+        """Returns a mapping of all surnames which belong to exactly one known
+        mdb to that mdb. The index is built with a single pass over the
+        stored mdbs and reused until storage_version changes, so it must not
+        be modified by the caller."""
+
+        version = cls.storage_version()
+        if cls._surname_index and cls._surname_index[0] == version:
+            return cls._surname_index[1]
+
+        mdbs_by_surname = defaultdict(list)
+        for mdb in cls.find_known_mdbs():
+            mdbs_by_surname[mdb["surname"]].append(mdb)
+
+        # TODO disambiguation improvement
+        # for now, we opt to look for mdb references only by their surname,
+        # as we have no method to contextualize role- or forename references
+        # enough to tell who's been adressed. Even in this solution, we
+        # discard any names that appear multiple times in our database, as we
+        # again have no system in place to figure out which entity is meant.
+        index = {
+            surname: cls(**mdbs[0])
+            for surname, mdbs in mdbs_by_surname.items()
+            if len(mdbs) == 1}
+
+        logger.debug(f"built surname index with {len(index)} entries for mdb storage version {version}")
+        cls._surname_index = (version, index)
+        return index
+
     @classmethod
     def find_and_add_in_storage(
             cls,
@@ -238,17 +632,29 @@ class MDB(BaseModel):
             initial: bool = False,
             created_by: Optional[str] = None) -> "MDB":
 
+        def _find_one_in_db(mdb_number=None, forename=None, surname=None) -> Optional[Dict]:
+            if mdb_number:
+                return database.find_one("mdb", {"mdb_number": mdb_number})
+            elif forename or surname:
+                possible_mdbs = database.find_many("mdb", {"forename": forename, "surname": surname})
+                if len(possible_mdbs) == 1:
+                    return possible_mdbs[0]
+                elif len(possible_mdbs) > 1:
+                    # use latest mdb (not best solution build else will create many duplicates)
+                    return cls.get_latest_mdb(possible_mdbs)
+
         def _find_one(mdb_number=None, forename=None, surname=None) -> Optional[Dict]:
             if cls._storage_type == "mongodb":
-                if mdb_number:
-                    return database.find_one("mdb", {"mdb_number": mdb_number})
-                elif forename or surname:
-                    possible_mdbs = database.find_many("mdb", {"forename": forename, "surname": surname})
-                    if len(possible_mdbs) == 1:
-                        return possible_mdbs[0]
-                    elif len(possible_mdbs) > 1:
-                        # use latest mdb (not best solution build else will create many duplicates)
-                        return _get_latest_mdb(possible_mdbs)
+                cache = cls._identity_cache
+                if not cache or not (mdb_number or forename or surname):
+                    return _find_one_in_db(mdb_number, forename, surname)
+
+                cache_key = ("mdb_number", mdb_number) if mdb_number else ("name", (forename, surname))
+                found, mdb = cache.get(cache_key)
+                if not found:
+                    mdb = _find_one_in_db(mdb_number, forename, surname)
+                    cache.put(cache_key, mdb)
+                return mdb
 
             elif cls._storage_type == "runtime":
                 if mdb_number:
@@ -263,28 +669,28 @@ class MDB(BaseModel):
         def _update_one(key, value, created_by=None):
             if cls._storage_type == "mongodb":
                 database.update_one("mdb", {"speaker_id": key}, value, created_by=created_by)
+                if cls._identity_cache:
+                    name = None
+                    if "forename" in value or "surname" in value:
+                        name = (value.get("forename"), value.get("surname"))
+                    cls._identity_cache.invalidate(key, value.get("mdb_number"), name)
+
+                    # a complete document (i.e. a newly created mdb) can be
+                    # served from the cache right away, even if the write is
+                    # still buffered by database.bulk_writes
+                    if "speaker_id" in value:
+                        cls._identity_cache.remember(value)
             elif cls._storage_type == "runtime":
-                mdb_dict = cls._mdb_runtime_storage.get(key, dict())
-                mdb_dict.update(value)
-
-                cls._mdb_runtime_storage[key] = mdb_dict
-
-                name_tuple = (mdb_dict["forename"], mdb_dict["surname"])
-                cls._mdb_runtime_storage_name_index[name_tuple] = key
-
-                mdb_number = mdb_dict.get("mdb_number")
-                if mdb_number:
-                    cls._mdb_runtime_storage_mdb_number_index[mdb_number] = key
+                cls._update_runtime_storage(key, value)
             else:
                 raise RuntimeError("not supported storage_type!")
 
-        def _get_latest_mdb(possible_mdbs: List[dict]):
-            latest_mdb = possible_mdbs[0]
-            for mdb in possible_mdbs:
-                if datetime.fromisoformat(mdb['modified']) > datetime.fromisoformat(latest_mdb['modified']):
-                    latest_mdb = mdb
-
-            return latest_mdb
+        registry = cls._speaker_registry if not initial else None
+        registry_key = ("mdb_number", mdb_number) if mdb_number else ("name", (forename, surname))
+        if registry is not None:
+            registered = registry.get(registry_key)
+            if registered is not None:
+                return registered
 
         mdb = None
         if mdb_number:
@@ -299,11 +705,17 @@ class MDB(BaseModel):
                 mdb['mdb_number'] = mdb_number
                 _update_one(mdb["speaker_id"], {"mdb_number": mdb_number})
         if mdb:
-            return MDB(**mdb)
+            mdb = MDB(**mdb)
+            return registry.register(registry_key, mdb) if registry is not None else mdb
 
         # create new mdb in DB
         if not mdb:
-            mdb_id = f"MDB-{uuid.uuid4()}"
+            # the name is the identity every source provides, so a worker
+            # which sees a person with its mdb_number and another one which
+            # only sees the name in a comment create the same id. Only the
+            # initial import of the master data, which doesn't look up names,
+            # keys on the mdb_number to keep namesakes apart.
+            mdb_id = cls.build_speaker_id(mdb_number if initial else None, forename, surname)
 
             mdb = cls(
                 speaker_id=mdb_id,
@@ -322,14 +734,20 @@ class MDB(BaseModel):
                 json.loads(mdb.json(exclude_none=True, indent=4, ensure_ascii=False)),
                 created_by=created_by)
 
-        return mdb
+        return registry.register(registry_key, mdb) if registry is not None else mdb
 
     # todo: we need a persistent mapping somewhere here to safely get MDBs
     #  from the db and return the MDB object based on them or add them to the
     #  db if they where missing.
 
 
-class InteractionCandidate(BaseModel):
+@dataclass
+class InteractionCandidate:
+    # a plain slotted class instead of a pydantic model, as thousands of
+    # them are created per session and only used during the extraction.
+    # A pydantic model would copy the speaker on every construction
+    __slots__ = ("speaker", "paragraph", "comment")
+
     speaker: MDB
     paragraph: str
     comment: Optional[str]
@@ -396,8 +814,11 @@ class Transcript(BaseModel):
                 if inter.receiver.value not in faction_map:
                     faction_map[inter.receiver.value] = inter.receiver
 
+        # the mdbs are shared with e.g. the cached surname index, so they
+        # are copied instead of changed in place
         for mdb_id, mdb in mdb_map.items():
-            mdb.memberships = [(m[0], m[1], m[2].value) for m in mdb.memberships]
+            mdb_map[mdb_id] = mdb.copy(update={
+                "memberships": [(m[0], m[1], m[2].value) for m in mdb.memberships]})
 
         return cls(
             session_no=metadata.session_no,
@@ -2,10 +2,11 @@ import logging
 import re
 from dataclasses import dataclass
 from datetime import datetime
-from typing import List
+from typing import List, Dict, Tuple, Optional, Union, Iterable, NamedTuple
 
-from cme import utils, database
+from cme import utils
 from cme.domain import InteractionCandidate, Interaction, MDB, Faction
+from cme.metrics import metrics
 from cme.utils import split_name_str
 
 logger = logging.getLogger("cme.extraction")
@@ -14,6 +15,11 @@ keywords = {
     "Beifall", "Zuruf", "Heiterkeit", "Zurufe", "Lachen",
     "Wiederspruch", "Widerspruch", "Gegenrufe", "Buhrufe", "Pfiffe", "Gegenruf"}
 
+# words which are never part of a name, a person containing one of them has
+# been extracted from the wrong part of a comment
+_non_name_words = frozenset(keywords | {
+    "am", "um", "ne", "wo", "Wo", ".", "-", "der", "die", "das", "des", "von", "an", "h", "h."})
+
 valid_prepositions = ['Herr', 'Hr.', 'Frau', 'Fr.', 'Dr.', 'Doktor', 'Kollege', 'Kollegin']
 
 @dataclass
@@ -88,13 +94,8 @@ def _build_mdb(person_str, add_debug_obj):
     # check if forename starts with a small char
     malformed = malformed or forename[0].islower()
     if not malformed:
-        extended_keywords = keywords.copy()
-        extended_keywords.update(["am", "um", "ne", "wo", "Wo", ".", "-", "der", "die", "das", "des", "von", "an", "h", "h."])
-        for k in extended_keywords:
-            malformed = malformed or k in full_name.split(" ")
-            malformed = malformed or k == forename.lower() or k == surname.lower()
-            if malformed:
-                break
+        malformed = not _non_name_words.isdisjoint(full_name.split(" "))
+        malformed = malformed or forename.lower() in _non_name_words or surname.lower() in _non_name_words
 
     if malformed:
         return MalformedMDB(
@@ -121,112 +122,124 @@ def _build_mdb(person_str, add_debug_obj):
 
 human_sender_re = re.compile(r"(?:Abg\.\s*)?(?P<person>.*\[+.+])")
 
-
-def extract_comment(text_part: str, add_debug_obj: bool = False):
-    # converting direct speech separated with a colon
-    if ":" in text_part:
-        ps, pm = [s.strip() for s in text_part.split(":", 1)]
-        pr = None
-
-        # grabbing the special case of a changed receiver during the
-        # comment
-        if ", an" in ps or ", zur" in ps:
-            ps, pr = [s.strip() for s in ps.split(",", 1)]
-
-            pr_match = human_sender_re.search(pr)
-            pfr = Faction.in_text(pr)
-            if pr_match:
-                pr = [pr_match.group("person")]
-            elif pfr:
-                pr = pfr
-            else:
-                logger.warning("not handled alternative receiver \"{}\"".format(pr))
-                pr = None
-
-        # extraction of the sender or senders
-        phs = human_sender_re.findall(ps)
-        if phs:
-            if len(phs) != 1:
-                raise RuntimeError(
-                    "Found multiple possible direct speaker ({}) in \"{}\"! "
-                    "This is currently not supported".format(phs, text_part))
-
-            if pr:
-                for curr_pr in pr:
-                    if isinstance(curr_pr, str):
-                        curr_pr = _build_mdb(curr_pr, add_debug_obj)
-                    elif isinstance(curr_pr, Faction):
-                        curr_pr = curr_pr
-
-                    return [(
-                        _build_mdb(phs[0], add_debug_obj),
-                        curr_pr,
-                        pm)]
-            else:
-                return [(
-                    _build_mdb(phs[0], add_debug_obj),
-                    None,
-                    pm)]
-        else:
-            pfs = Faction.in_text(ps)
-
-            if len(pfs) == 0 and utils.logging_is_needed(text_part):
-                logger.warning(
-                    "Found no direct sender in \"{}\"! Ignoring the "
-                    "message...".format(text_part))
-
-            return [(f, None, pm) for f in pfs]
-    # converting non verbal messages like laughing
-    else:
-        words = text_part.split(" ")
-
-        if len(words) == 0:
-            logger.warning(
-                "Found a no direct speech message without a sender "
-                "(\"{}\")! Ignoring it now message...".format(text_part))
-            return list()
-
-        last_kw_idx = -1
-        for i, w in enumerate(words):
-            if w in keywords:
-                last_kw_idx = i
-
-        if last_kw_idx < 0:
+DIRECT_SPEECH = "direct_speech"
+REACTION = "reaction"
+UNKNOWN = "unknown"
+
+
+class CommentPart(NamedTuple):
+    """A comment part taken apart by CommentGrammar. Senders and receivers
+    are person spans (e.g. "des Abg. Jens Beeck [FDP]"), which still have to
+    be built through _build_mdb, or Factions."""
+    kind: str
+    senders: List[Union[str, Faction]]
+    receivers: Optional[List[Union[str, Faction]]]
+    message: str
+
+
+class CommentGrammar:
+    """Precompiled grammar of a single comment part. A part containing a
+    colon is direct speech, "<senders>[, an|zur <receiver>]: <message>".
+    Any other part is a reaction, "<...> <keyword> <senders>", whose
+    senders follow the last reaction keyword and are separated by ", ",
+    " und " or " sowie ". Each sender span is either a person, which ends
+    with its bracketed faction, or the factions named in it."""
+
+    def __init__(self, reaction_keywords: Iterable[str]):
+        keyword_pattern = "|".join(re.escape(k) for k in sorted(reaction_keywords, key=len, reverse=True))
+
+        # the alternative receiver starts at the first comma of the sender
+        # part if ", an" or ", zur" appears anywhere in it
+        self._direct_speech_re = re.compile(
+            r"(?:(?P<sender>[^:,]*)(?=[^:]*, (?:an|zur)),(?P<receiver>[^:]*)|(?P<senders>[^:]*)):(?P<message>.*)",
+            re.DOTALL)
+        # the greedy prefix finds the last keyword, which has to be a whole
+        # space separated word
+        self._last_keyword_re = re.compile(r".*(?<![^ ])(?:{})(?![^ ])".format(keyword_pattern), re.DOTALL)
+        self._separator_re = re.compile(r"(?:\sund\s)|(?:\ssowie\s)|(?:,\s)")
+
+    def parse(self, text_part: str) -> CommentPart:
+        if ":" in text_part:
+            return self._parse_direct_speech(text_part)
+
+        match = self._last_keyword_re.match(text_part)
+        if not match:
             if utils.logging_is_needed(text_part):
                 logger.warning(
                     "Found no handled keyword in a non direct speech message "
                     "(\"{}\")! Ignoring it now message...".format(text_part))
-            return list()
+            return CommentPart(UNKNOWN, list(), None, text_part)
+
+        senders = list()
+        for span in self._separator_re.split(text_part[match.end() + 1:]):
+            senders += self._senders_in(span, text_part)
+        return CommentPart(REACTION, senders, None, text_part)
+
+    def _parse_direct_speech(self, text_part: str) -> CommentPart:
+        match = self._direct_speech_re.match(text_part)
+        message = match.group("message").strip()
+
+        receivers = None
+        if match.group("receiver") is not None:
+            sender_span = match.group("sender").strip()
+            receiver_span = match.group("receiver").strip()
+
+            person = self._person(receiver_span)
+            receivers = [person] if person else Faction.in_text(receiver_span)
+            if not receivers:
+                logger.warning("not handled alternative receiver \"{}\"".format(receiver_span))
+                receivers = None
+        else:
+            sender_span = match.group("senders").strip()
+
+        return CommentPart(DIRECT_SPEECH, self._senders_in(sender_span, text_part), receivers, message)
+
+    @staticmethod
+    def _person(span: str) -> Optional[str]:
+        # every person ends with a closing bracket, the regex is skipped for
+        # the many spans naming factions only
+        if "]" not in span:
+            return None
+        match = human_sender_re.search(span)
+        return match.group("person") if match else None
+
+    @staticmethod
+    def _senders_in(span: str, text_part: str) -> List[Union[str, Faction]]:
+        persons = human_sender_re.findall(span) if "]" in span else None
+        if persons:
+            if len(persons) != 1:
+                raise RuntimeError(
+                    "Found multiple possible direct speaker ({}) in \"{}\"! "
+                    "This is currently not supported".format(persons, text_part))
+            return persons
 
-        relevant_text = " ".join(words[last_kw_idx + 1:])
-        potential_senders = re.split(r"(?:\sund\s)|(?:\ssowie\s)|(?:,\s)", relevant_text)
+        factions = Faction.in_text(span)
+        if len(factions) == 0 and utils.logging_is_needed(text_part):
+            logger.warning(
+                "Found no direct sender in \"{}\"! Ignoring the "
+                "message...".format(text_part))
+        return factions
 
-        found_senders = list()
-        for ps in potential_senders:
-            phs = human_sender_re.findall(ps)
 
-            if phs:
-                if len(phs) != 1:
-                    raise RuntimeError(
-                        "Found multiple possible direct speaker ({}) in \"{}\"! "
-                        "This is currently not supported".format(phs, text_part))
+comment_grammar = CommentGrammar(keywords)
 
-                found_senders.append((
-                    _build_mdb(phs[0], add_debug_obj),
-                    None,
-                    text_part))
 
-            else:
-                pfs = Faction.in_text(ps)
-
-                if len(pfs) == 0 and utils.logging_is_needed(text_part):
-                    logger.warning(
-                        "Found no direct sender in \"{}\"! Ignoring the "
-                        "message...".format(text_part))
+def extract_comment(text_part: str, add_debug_obj: bool = False):
+    comment = comment_grammar.parse(text_part)
 
-                found_senders += [(f, None, text_part) for f in pfs]
+    senders = comment.senders
+    if comment.kind == DIRECT_SPEECH and senders and isinstance(senders[0], str):
+        # a direct speech of a person goes to the first alternative receiver
+        receiver = None
+        if comment.receivers:
+            receiver = comment.receivers[0]
+            if isinstance(receiver, str):
+                receiver = _build_mdb(receiver, add_debug_obj)
+        return [(_build_mdb(senders[0], add_debug_obj), receiver, comment.message)]
 
-        return found_senders
+    return [
+        (_build_mdb(s, add_debug_obj) if isinstance(s, str) else s, None, comment.message)
+        for s in senders]
 
 
 def split_comments(full_text: str, split_char: str = u"\u2013") -> List[str]:
@@ -240,6 +253,8 @@ def reformat_interaction(sender, receiver, message, from_paragraph: bool = True)
     sender_malformed = isinstance(sender, MalformedMDB)
     receiver_malformed = isinstance(receiver, MalformedMDB)
     if sender_malformed or receiver_malformed:
+        metrics.inc("cme_interactions_dropped_total",
+                    reason="malformed_sender" if sender_malformed else "malformed_receiver")
         if sender_malformed and receiver_malformed:
             logger.error(
                 f"Found message \"{message}\" with a broken "
@@ -257,62 +272,101 @@ def reformat_interaction(sender, receiver, message, from_paragraph: bool = True)
         return None
 
     if not receiver:
+        metrics.inc("cme_interactions_dropped_total", reason="no_receiver")
         logger.warning("Couldn't find a receiver for \"{}\"".format(message))
         return None
 
-    inter = {
-        "sender": sender,
-        "receiver": receiver,
-        "message": message,
-        "from_paragraph": from_paragraph}
-
-    return Interaction(**inter)
+    # sender and receiver are already MDBs or Factions and the message is a
+    # str, so the validation, which would copy the MDBs, is skipped
+    return Interaction.construct(
+        sender=sender,
+        receiver=receiver,
+        message=message,
+        from_paragraph=from_paragraph)
 
 
 def retrieve_paragraph_keymap(add_debug_obj: bool = False):
-    # fetch person list from mdb database
-    person_keymap = {}
-    mdb_list = MDB.find_known_mdbs()
-    ignored_mdbs = []
-    if len(mdb_list) > 0:
-        for mdb in mdb_list:
-            keyword = mdb['surname']
-            # TODO disambiguation improvement
-            # for now, we opt to look for
-            # mdb references only by their surname, as we have no method
-            # to contextualize role- or forename references enough to tell
-            # who's been adressed. Even in this solution, we discard any names
-            # that appear multiple times in our database, as we again have no
-            # system in place to figure out which entity is meant.
-            if keyword not in person_keymap.keys():
-                if keyword not in ignored_mdbs:
-                    person_keymap[keyword] = keyword
-            else:
-                person_keymap.pop(keyword)
-                ignored_mdbs.append(keyword)
-    for k in person_keymap.keys():
-        people = database.find_many("mdb", {"surname": k})
-        if not len(people) > 1:
-            person_keymap[k] = MDB(**people[0])
+    # the surname index is cached across transcripts and only rebuilt if the
+    # stored mdbs changed in the meantime
+    return MDB.surname_index()
 
-    return person_keymap
 
+_SURNAME_TOKEN_RE = re.compile(r"[\w\-]+")
+_NEXT_TOKEN_RE = re.compile(r"\s+([\w\-]+)")
 
-def extract_paragraph(text_part: str, paragraph_keymap, add_debug_obj: bool = False):
-    text_tokens = text_part.split(" ")
 
-    receivers = []
-    paragraph_keywords = paragraph_keymap.keys()
+class ReceiverMatcher:
+    """Finds the mdbs which are addressed in a paragraph through one of the
+    valid_prepositions followed by their surname, e.g. "Frau von der Leyen,".
+    The prepositions are compiled into a single regex, so the paragraph is
+    scanned once and only the few tokens following a preposition are
+    tokenized (ignoring trailing punctuation) and looked up in an index of
+    the surnames by their first token."""
+
+    def __init__(self, paragraph_keymap: Dict[str, Union[MDB, str]], prepositions: List[str] = None):
+        if prepositions is None:
+            prepositions = valid_prepositions
+
+        # no lookbehind for the word boundary in front of the preposition, as
+        # it would prevent the fast literal prefix search of the regex engine
+        self._preposition_re = re.compile(r"(?:{})(?=\s+([\w\-]+))".format(
+            "|".join(re.escape(p) for p in sorted(prepositions, key=len, reverse=True))))
+        self._by_first_token: Dict[str, List[Tuple[Tuple[str, ...], MDB]]] = dict()
+
+        for surname, receiver in paragraph_keymap.items():
+            if not isinstance(receiver, MDB):
+                continue
+            tokens = tuple(_SURNAME_TOKEN_RE.findall(surname))
+            if tokens:
+                self._by_first_token.setdefault(tokens[0], list()).append((tokens, receiver))
+
+        # longest surnames first, so "von der Leyen" wins over "von"
+        for candidates in self._by_first_token.values():
+            candidates.sort(key=lambda c: len(c[0]), reverse=True)
+
+    def receivers_in(self, text: str) -> List[MDB]:
+        receivers = []
 
-    for index, token in enumerate(text_tokens):
-        if token in paragraph_keywords:
-            preceding_index = index - 1
-            if preceding_index >= 0:
-                preceding_token = text_tokens[preceding_index]
-                if preceding_token in valid_prepositions:
-                    receiver = paragraph_keymap[token]
-                    if isinstance(receiver, MDB):
-                        receivers.append(receiver)
+        for preposition in self._preposition_re.finditer(text):
+            candidates = self._by_first_token.get(preposition.group(1))
+            if not candidates:
+                continue
+            start = preposition.start()
+            if start > 0 and (text[start - 1].isalnum() or text[start - 1] in "_-"):
+                continue
+
+            # the following tokens are only read for multi word surnames
+            tokens = [preposition.group(1)]
+            pos = preposition.end(1)
+            for surname_tokens, receiver in candidates:
+                while len(tokens) < len(surname_tokens):
+                    token = _NEXT_TOKEN_RE.match(text, pos)
+                    if not token:
+                        break
+                    tokens.append(token.group(1))
+                    pos = token.end()
+
+                if tuple(tokens[:len(surname_tokens)]) == surname_tokens:
+                    receivers.append(receiver)
+                    break
+
+        return receivers
+
+
+_receiver_matcher: Optional[Tuple[Dict, ReceiverMatcher]] = None
+
+
+def _get_receiver_matcher(paragraph_keymap: Dict[str, Union[MDB, str]]) -> ReceiverMatcher:
+    # the keymap is the cached surname index, so the matcher is only rebuilt
+    # together with it
+    global _receiver_matcher
+    if _receiver_matcher is None or _receiver_matcher[0] is not paragraph_keymap:
+        _receiver_matcher = (paragraph_keymap, ReceiverMatcher(paragraph_keymap))
+    return _receiver_matcher[1]
+
+
+def extract_paragraph(text_part: str, paragraph_keymap, add_debug_obj: bool = False):
+    receivers = _get_receiver_matcher(paragraph_keymap).receivers_in(text_part)
 
     receiver_factions = Faction.in_text(text_part)
 
@@ -338,6 +392,7 @@ def _extract_all_interactions(
                     if reformatted_interaction:
                         reformatted_interactions.append(reformatted_interaction)
             else:
+                metrics.inc("cme_interactions_dropped_total", reason="no_paragraph_receiver")
                 logger.warning(
                     f"Couldn't extract a message receiver from paragraph \"{paragraph_text}\", dropping it now...")
 
@@ -371,6 +426,7 @@ def _extract_all_interactions(
                     if reformatted_interaction:
                         reformatted_interactions.append(reformatted_interaction)
             else:
+                metrics.inc("cme_interactions_dropped_total", reason="no_paragraph_receiver")
                 logger.warning(
                     f"Couldn't extract a message receiver from paragraph \"{paragraph_text}\", dropping it now...")
 
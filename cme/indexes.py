@@ -0,0 +1,171 @@
+"""Indexes of the cme collections. INDEXES are created idempotently by
+`cme init` and at server startup, explain_queries builds the queries of the
+extraction and the api with the helpers they use themselves and
+`cme db explain` checks their query plans against a running mongo."""
+import logging
+from typing import Dict, List, Any, NamedTuple, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.database import Database as MongoDatabase
+from pymongo.errors import OperationFailure
+
+from cme import database, async_database
+
+logger = logging.getLogger("cme.indexes")
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "session": [
+        # upsert key of controller._write_transcript and the order of the
+        # /interactions stream
+        IndexModel([("session_id", ASCENDING)], name="session_id", unique=True),
+        # /period/{lp} pages are sorted by and continued after the session_id
+        IndexModel([("legislative_period", ASCENDING), ("session_id", ASCENDING)],
+                   name="legislative_period_session_id"),
+        # version of the /period/{lp} response cache
+        IndexModel([("legislative_period", ASCENDING), ("modified", DESCENDING)],
+                   name="legislative_period_modified"),
+        # version of the /sessions response cache
+        IndexModel([("modified", DESCENDING)], name="modified"),
+        # skipping unchanged files in manual_import
+        IndexModel([("source_hash", ASCENDING), ("pipeline_version", ASCENDING)],
+                   name="source_hash_pipeline_version"),
+    ],
+    "mdb": [
+        # upsert key of MDB._update_one
+        IndexModel([("speaker_id", ASCENDING)], name="speaker_id", unique=True),
+        IndexModel([("mdb_number", ASCENDING)], name="mdb_number"),
+        # serves surname only lookups of the api as well
+        IndexModel([("surname", ASCENDING), ("forename", ASCENDING)], name="surname_forename"),
+        # version of the surname index
+        IndexModel([("modified", DESCENDING)], name="modified"),
+    ],
+}
+
+
+class ExplainQuery(NamedTuple):
+    description: str
+    collection: str
+    filter: dict
+    sort: Optional[List[Tuple[str, int]]] = None
+    projection: Optional[dict] = None
+    # explained as an aggregation, filter and sort are its leading $match and
+    # $sort stages, which decide the index
+    pipeline: Optional[List[dict]] = None
+
+
+def _aggregation(description: str, collection: str, pipeline: List[dict]) -> ExplainQuery:
+    query_filter = pipeline[0].get("$match", {})
+    sort = pipeline[1].get("$sort") if len(pipeline) > 1 else None
+    return ExplainQuery(description, collection, query_filter, list(sort.items()) if sort else None,
+                        pipeline=pipeline)
+
+
+def explain_queries(session: dict = None, mdb: dict = None) -> List[ExplainQuery]:
+    """Returns the queries the app runs, filled with the values of the given
+    sample documents. The session queries are built by the helpers of the
+    api and the controller."""
+
+    # imported here, as the controller imports this module and creating the
+    # indexes doesn't need the api
+    from cme import controller
+    from cme.api import api_interaction, api_session
+
+    session = session or {}
+    mdb = mdb or {}
+    session_id = session.get("session_id", 19001)
+    legislative_period = session.get("legislative_period", 19)
+
+    return [
+        ExplainQuery("session by session_id", "session", {"session_id": session_id}),
+        ExplainQuery("latest modified session", "session", {}, [("modified", DESCENDING)]),
+        ExplainQuery("sessions of a period", "session", api_session._period_query(legislative_period),
+                     api_session.PERIOD_SORT, api_session._session_projection(None, True)),
+        ExplainQuery("next page of a period", "session", api_session._period_query(legislative_period, session_id),
+                     api_session.PERIOD_SORT, api_session._session_projection(None, False)),
+        ExplainQuery("latest modified session of a period", "session",
+                     {"legislative_period": legislative_period}, [("modified", DESCENDING)]),
+        _aggregation("interactions", "session", api_interaction._interaction_pipeline()),
+        _aggregation("interactions of a period", "session",
+                     api_interaction._interaction_pipeline(legislative_period=legislative_period)),
+        ExplainQuery("imported source hashes", "session",
+                     controller._source_hash_query([session.get("source_hash", "")])),
+        ExplainQuery("mdb by speaker_id", "mdb", {"speaker_id": mdb.get("speaker_id", "")}),
+        ExplainQuery("mdb by mdb_number", "mdb", {"mdb_number": mdb.get("mdb_number", "")}),
+        ExplainQuery("mdb by forename and surname", "mdb",
+                     {"forename": mdb.get("forename", ""), "surname": mdb.get("surname", "")}),
+        ExplainQuery("mdb by surname", "mdb", {"surname": mdb.get("surname", "")}),
+        ExplainQuery("latest modified mdb", "mdb", {}, [("modified", DESCENDING)]),
+    ]
+
+
+def ensure_indexes(db: MongoDatabase = None) -> List[str]:
+    """Creates the missing INDEXES and returns the names of all created or
+    already existing ones. An index conflicting with an existing one (e.g.
+    duplicated upsert keys for a unique index) is logged and skipped."""
+
+    db = db if db is not None else database.get_cme_db()
+    names = []
+    for collection_name, models in INDEXES.items():
+        for model in models:
+            try:
+                names.extend(db[collection_name].create_indexes([model]))
+            except OperationFailure as err:
+                logger.error(f"can't create index {model.document['name']} on {collection_name}: {err}")
+    return names
+
+
+async def ensure_indexes_async() -> List[str]:
+    """ensure_indexes for the api, on top of motor."""
+
+    db = await async_database.get_cme_db()
+    names = []
+    for collection_name, models in INDEXES.items():
+        for model in models:
+            try:
+                names.extend(await db[collection_name].create_indexes([model]))
+            except OperationFailure as err:
+                logger.error(f"can't create index {model.document['name']} on {collection_name}: {err}")
+    return names
+
+
+def plan_stages(plan: Any) -> List[str]:
+    """Returns all stages of an explain result. The layout of the plan
+    differs between the mongo versions, so the whole result is searched."""
+
+    stages = []
+    if isinstance(plan, dict):
+        if isinstance(plan.get("stage"), str):
+            stages.append(plan["stage"])
+        for key, value in plan.items():
+            if key not in ("rejectedPlans", "allPlansExecution"):
+                stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(plan_stages(value))
+    return stages
+
+
+def explain(db: MongoDatabase = None) -> List[Tuple[ExplainQuery, List[str]]]:
+    """Explains all explain_queries and returns them with the stages of
+    their winning plan."""
+
+    db = db if db is not None else database.get_cme_db()
+    queries = explain_queries(db["session"].find_one({}, {"interactions": 0}), db["mdb"].find_one())
+
+    results = []
+    for query in queries:
+        if query.pipeline is not None:
+            # the plan of the leading stages is nested in the $cursor stage or
+            # at the top, depending on the mongo version
+            plan = db.command(
+                "explain", {"aggregate": query.collection, "pipeline": query.pipeline, "cursor": {}},
+                verbosity="queryPlanner")
+            results.append((query, plan_stages(plan)))
+            continue
+
+        cursor = db[query.collection].find(query.filter, query.projection)
+        if query.sort:
+            cursor = cursor.sort(query.sort)
+        plan = cursor.explain().get("queryPlanner", {})
+        results.append((query, plan_stages(plan.get("winningPlan", {}))))
+    return results
@@ -0,0 +1,254 @@
+"""Bounded job queue which evaluates crawled sessions in worker processes, so
+the extraction neither blocks the event loop of the api nor competes with
+it for the GIL."""
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from enum import Enum
+from multiprocessing.queues import SimpleQueue
+from typing import List, Optional, Dict
+
+from pydantic import BaseModel
+
+from cme.metrics import metrics
+
+logger = logging.getLogger("cme.jobs")
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class Job(BaseModel):
+    job_id: str
+    session_ids: List[str]
+    status: JobStatus = JobStatus.QUEUED
+    created: datetime
+    started: Optional[datetime]
+    finished: Optional[datetime]
+    error: Optional[str]
+
+
+# set in the worker processes by _init_worker, the started jobs report their
+# job_id through it to the JobQueue of the api process
+_started_jobs: Optional[SimpleQueue] = None
+
+
+def _init_worker(started_jobs: Optional[SimpleQueue] = None):
+    global _started_jobs
+    _started_jobs = started_jobs
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s %(name)s [%(levelname).1s]: %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S')
+
+
+def _run_job(job_id: str, session_ids: List[str]) -> Optional[Dict]:
+    if _started_jobs is not None:
+        _started_jobs.put(job_id)
+
+    # imported here, so the api process doesn't need the controller
+    from cme import controller
+
+    # a worker process sends the metrics of the job back to the api
+    in_worker = multiprocessing.parent_process() is not None
+    if in_worker:
+        metrics.reset()
+
+    controller.evaluate_newest_sessions(session_ids)
+    return metrics.snapshot() if in_worker else None
+
+
+class JobQueue:
+    """Runs evaluate_newest_sessions jobs on a pool of workers. At most
+    max_queued jobs wait for a worker, further submissions raise a
+    QueueFullError. Session ids which are already waiting in a queued job
+    are dropped from new submissions, while ids of running jobs are queued
+    again as their crawled session might have changed in the meantime."""
+
+    def __init__(
+            self,
+            workers: int = 2,
+            max_queued: int = 20,
+            max_finished: int = 100,
+            executor: Executor = None):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        self._executor = executor
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor_lock = threading.Lock()
+        self._started_jobs: Optional[SimpleQueue] = None
+
+    def _get_executor(self) -> Executor:
+        with self._executor_lock:
+            if not self._executor:
+                # spawn instead of fork, as the event loop and db clients of
+                # the api process must not be shared with the workers
+                context = multiprocessing.get_context("spawn")
+                if self._started_jobs is None:
+                    self._started_jobs = context.SimpleQueue()
+                    threading.Thread(
+                        target=self._watch_started_jobs, args=(self._started_jobs,), daemon=True).start()
+
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=context,
+                    initializer=_init_worker,
+                    initargs=(self._started_jobs,))
+            return self._executor
+
+    def _watch_started_jobs(self, started_jobs: SimpleQueue):
+        # the workers report the job_id when they start a job, None stops
+        # the watching
+        for job_id in iter(started_jobs.get, None):
+            self._mark_started(job_id)
+
+    def _mark_started(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job and job.started is None:
+                job.started = datetime.utcnow()
+                if job.status == JobStatus.QUEUED:
+                    job.status = JobStatus.RUNNING
+
+    def _submit_job(self, executor: Executor, job_id: str, session_ids: List[str]) -> Future:
+        if isinstance(executor, ProcessPoolExecutor):
+            return executor.submit(_run_job, job_id, session_ids)
+
+        # e.g. a ThreadPoolExecutor, which runs the job in this process
+        def _run_in_process():
+            self._mark_started(job_id)
+            return _run_job(job_id, session_ids)
+        return executor.submit(_run_in_process)
+
+    def _submit(self, job_id: str, session_ids: List[str]) -> Future:
+        executor = self._get_executor()
+        try:
+            return self._submit_job(executor, job_id, session_ids)
+        except BrokenProcessPool:
+            # a died worker (e.g. killed for its memory) breaks the whole
+            # pool for good, so it is replaced once
+            logger.warning("the worker pool is broken, starting a new one")
+            with self._executor_lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False)
+            return self._submit_job(self._get_executor(), job_id, session_ids)
+
+    def _count(self, status: JobStatus) -> int:
+        return sum(job.status == status for job in self._jobs.values())
+
+    def submit(self, session_ids: List[str]) -> Optional[Job]:
+        """Queues a job for the session ids which aren't queued yet. Returns
+        None if all of them are already queued."""
+
+        with self._lock:
+            queued_ids = {
+                session_id
+                for job in self._jobs.values() if job.status == JobStatus.QUEUED
+                for session_id in job.session_ids}
+            new_ids = list(OrderedDict.fromkeys(i for i in session_ids if i not in queued_ids))
+            if not new_ids:
+                return None
+
+            # the executor itself doesn't distinguish between waiting and
+            # running jobs, so everything beyond the workers is waiting
+            waiting = self._count(JobStatus.QUEUED) + self._count(JobStatus.RUNNING) - self.workers
+            if waiting >= self.max_queued:
+                raise QueueFullError(f"{waiting} jobs are already waiting for a worker.")
+
+            job = Job(job_id=str(uuid.uuid4()), session_ids=new_ids, created=datetime.utcnow())
+            self._jobs[job.job_id] = job
+
+        logger.info(f"queued job '{job.job_id}' for sessions {new_ids}")
+        try:
+            future = self._submit(job.job_id, new_ids)
+        except Exception as err:
+            # the job must not stay queued, as it would count towards
+            # max_queued forever
+            with self._lock:
+                job.status = JobStatus.FAILED
+                job.finished = datetime.utcnow()
+                job.error = repr(err)
+            logger.error(f"can't submit job '{job.job_id}': {err!r}")
+            return job
+
+        future.add_done_callback(lambda f: self._finish(job, f))
+        return job
+
+    def _finish(self, job: Job, future: Future):
+        with self._lock:
+            job.finished = datetime.utcnow()
+            error = future.exception()
+            if error:
+                job.status = JobStatus.FAILED
+                job.error = repr(error)
+                logger.error(f"job '{job.job_id}' failed: {error!r}")
+            else:
+                job.status = JobStatus.DONE
+                logger.info(f"job '{job.job_id}' is done")
+                if future.result():
+                    metrics.merge(future.result())
+
+            finished = [j.job_id for j in self._jobs.values() if j.status in (JobStatus.DONE, JobStatus.FAILED)]
+            for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+                del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {status.value: self._count(status) for status in JobStatus}
+
+    def shutdown(self, wait: bool = True):
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+            started_jobs, self._started_jobs = self._started_jobs, None
+        if executor:
+            executor.shutdown(wait=wait)
+        if started_jobs is not None:
+            started_jobs.put(None)
+
+
+__job_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    """Returns the job queue of this process, configured through the
+    environment variables CME_JOB_WORKERS and CME_JOB_QUEUE_SIZE."""
+
+    global __job_queue
+    if not __job_queue:
+        __job_queue = JobQueue(
+            workers=int(os.getenv("CME_JOB_WORKERS", 2)),
+            max_queued=int(os.getenv("CME_JOB_QUEUE_SIZE", 20)))
+    return __job_queue
+
+
+def shutdown_job_queue():
+    global __job_queue
+    if __job_queue:
+        __job_queue.shutdown(wait=False)
+        __job_queue = None
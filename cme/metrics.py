@@ -0,0 +1,164 @@
+"""In process metrics of the import pipeline and the api: counters, gauges
+and summaries (count and sum of observations, e.g. the seconds spent in a
+stage) with labels. They are rendered in the prometheus text format by the
+/metrics endpoint and as a table by `cme manual --stats`. Worker processes
+send a snapshot of their metrics back, which is merged into the metrics of
+the parent process."""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Tuple, Iterator, List
+
+COUNTER = "counter"
+GAUGE = "gauge"
+SUMMARY = "summary"
+
+HELP = {
+    "cme_stage_seconds": "Seconds spent in a stage of the import pipeline.",
+    "cme_session_seconds": "Seconds spent to import a single session.",
+    "cme_sessions_total": "Imported sessions.",
+    "cme_session_candidates": "Interaction candidates per imported session.",
+    "cme_interactions_total": "Extracted interactions.",
+    "cme_interactions_dropped_total": "Dropped paragraphs and comments by reason.",
+    "cme_db_round_trips_total": "Round trips to the cme db by collection and operation.",
+    "cme_mdb_cache_total": "Hits, misses and evictions of the mdb identity cache.",
+    "cme_speaker_registry_total": "Hits and misses of the per session speaker registry.",
+    "cme_jobs": "Evaluation jobs of the api by status.",
+    "cme_response_cache": "State of the api response cache.",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+class Metrics:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._types: Dict[str, str] = {}
+        self._values: Dict[str, Dict[Labels, float]] = defaultdict(dict)
+        self._counts: Dict[str, Dict[Labels, int]] = defaultdict(dict)
+
+    def _register(self, name: str, metric_type: str):
+        registered = self._types.setdefault(name, metric_type)
+        if registered != metric_type:
+            raise ValueError(f"metric {name} is a {registered}, not a {metric_type}")
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            self._register(name, COUNTER)
+            values = self._values[name]
+            values[key] = values.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self._register(name, GAUGE)
+            self._values[name][_labels(labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _labels(labels)
+        with self._lock:
+            self._register(name, SUMMARY)
+            values = self._values[name]
+            values[key] = values.get(key, 0) + value
+            counts = self._counts[name]
+            counts[key] = counts.get(key, 0) + 1
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """Observes the seconds spent in the with block, even if it raises."""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def get(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._values.get(name, {}).get(_labels(labels), 0)
+
+    def count(self, name: str, **labels) -> int:
+        with self._lock:
+            return self._counts.get(name, {}).get(_labels(labels), 0)
+
+    def reset(self):
+        with self._lock:
+            self._types.clear()
+            self._values.clear()
+            self._counts.clear()
+
+    def snapshot(self) -> Dict:
+        """Returns a picklable copy of all metrics, see merge."""
+
+        with self._lock:
+            return {
+                "types": dict(self._types),
+                "values": {name: dict(values) for name, values in self._values.items()},
+                "counts": {name: dict(counts) for name, counts in self._counts.items()}}
+
+    def merge(self, snapshot: Dict):
+        """Adds the counters and summaries of a snapshot, e.g. of a worker
+        process. Gauges are replaced."""
+
+        with self._lock:
+            for name, metric_type in snapshot["types"].items():
+                self._register(name, metric_type)
+                values = self._values[name]
+                for key, value in snapshot["values"].get(name, {}).items():
+                    values[key] = value if metric_type == GAUGE else values.get(key, 0) + value
+                counts = self._counts[name]
+                for key, count in snapshot["counts"].get(name, {}).items():
+                    counts[key] = counts.get(key, 0) + count
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name in sorted(self._types):
+                metric_type = self._types[name]
+                if name in HELP:
+                    lines.append(f"# HELP {name} {HELP[name]}")
+                lines.append(f"# TYPE {name} {metric_type}")
+
+                for key, value in sorted(self._values[name].items()):
+                    if metric_type == SUMMARY:
+                        lines.append(f"{name}_sum{_format_labels(key)} {value!r}")
+                        lines.append(f"{name}_count{_format_labels(key)} {self._counts[name].get(key, 0)}")
+                    else:
+                        lines.append(f"{name}{_format_labels(key)} {value!r}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """Returns a human readable table of all metrics."""
+
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted(self._types):
+                for key, value in sorted(self._values[name].items()):
+                    labels = ", ".join(f"{k}={v}" for k, v in key)
+                    metric = f"{name} {labels}".strip()
+                    if self._types[name] == SUMMARY:
+                        count = self._counts[name].get(key, 0)
+                        mean = value / count if count else 0
+                        lines.append(f"{metric:<72} {value:12.3f} total {count:8d}x {mean:10.4f} mean")
+                    else:
+                        lines.append(f"{metric:<72} {value:12g}")
+        return "\n".join(lines)
+
+
+metrics = Metrics()
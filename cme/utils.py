@@ -1,19 +1,25 @@
 import asyncio
+import hashlib
 import json
 import logging
 import os
 import re
 import time
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, Tuple, Any, Set, IO, List
+from functools import lru_cache
+from typing import Dict, Tuple, Any, Set, IO, List, Iterable, Iterator, Optional
 
 import requests
+import ujson
 from bson import ObjectId
 from fastapi.security import HTTPBasicCredentials
 from nameparser import HumanName
+from nameparser.config import Constants
+from pymongo.errors import PyMongoError
 
 from cme import database
-from cme.api import error
+from cme.api import auth
 
 IGNORED_KEYWORDS = ["Zwischenfrage", "Gegenfrage", "Unruhe", "Glocke der Präsidentin",
                     "Kurzintervention", "nimmt Platz", "Beifall im ganzen Hause", "Unterbrechung", "Nationalhymne",
@@ -42,6 +48,44 @@ def safe_json_dumps(obj: Any, **kwargs) -> str:
     return json.dumps(obj, **kwargs)
 
 
+def _fast_json_default(obj: Any) -> Any:
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    if isinstance(obj, ObjectId):
+        return str(obj)
+
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def fast_json_dumps(obj: Any) -> str:
+    """ujson based equivalent of safe_json_dumps for large documents, e.g. raw
+    mongo documents. datetime and ObjectId are handled like SafeJsonEncoder
+    does."""
+
+    return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False, default=_fast_json_default)
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def json_content_hash(obj: Any) -> str:
+    """Hashes a json serializable object independent of its key order."""
+
+    return content_hash(safe_json_dumps(obj, sort_keys=True).encode("utf-8"))
+
+
+# fields the crawler changes without the protocol itself changing
+CRAWLER_BOOKKEEPING_FIELDS = {"notified", "_class"}
+
+
+def crawled_session_hash(session: Dict) -> str:
+    """Hashes the protocol content of a crawled session, so e.g. flipping
+    its notified flag doesn't trigger a new import."""
+
+    return json_content_hash({k: v for k, v in session.items() if k not in CRAWLER_BOOKKEEPING_FIELDS})
+
+
 def get_safe_datetime(date):
     if not isinstance(date, datetime):
         date = datetime.fromisoformat(date)
@@ -89,63 +133,80 @@ def build_isoformat_time_str(date_str: str, time_str: str, date_order: str = "DM
     return build_datetime(date_str, time_str, date_order).isoformat()
 
 
+_ALTERNATIVE_SPACES = {
+    u"\xa0",  # NO - BREAK SPACE
+    u"\xad",  # Soft Hyphen
+    u"\u1680",  # OGHAM SPACE MARK
+    u"\u180e",  # MONGOLIAN VOWEL SEPARATOR
+    u"\u2000",  # EN QUAD
+    u"\u2001",  # EM QUAD
+    u"\u2002",  # EN SPACE
+    u"\u2003",  # EM SPACE
+    u"\u2004",  # THREE - PER - EM SPACE
+    u"\u2005",  # FOUR - PER - EM SPACE
+    u"\u2006",  # SIX - PER - EM SPACE
+    u"\u2007",  # FIGURE SPACE
+    u"\u2008",  # PUNCTUATION SPACE
+    u"\u2009",  # THIN SPACE
+    u"\u200a",  # HAIR SPACE
+    u"\u2028",  # LINE SEPARATOR
+    u"\u2029",  # PARAGRAPH SEPARATOR
+    u"\u202f",  # NARROW NO - BREAK SPACE
+    u"\u205f",  # MEDIUM MATHEMATICAL SPACE
+    u"\u3000"  # IDEOGRAPHIC SPACE
+}
+
+_ALTERNATIVE_DASHES = {
+    u"\u2011",  # Non-Breaking Hyphen
+    u"\u2012",  # Figure Dash
+    # we are keeping \u2013 for the moment as those are used for the
+    # comment separation by the bundestag in the files
+    # u"\u2013",  # En Dash
+}
+
+_ALT_DOUBLE_QUOTES = {
+    u"\u201c",
+    u"\u201e",
+}
+
+_ALT_SINGLE_QUOTES = {
+    u"\u2018",
+    u"\u2019",
+    u"\u02bc",
+}
+
+_CLEANUP_REPLACEMENTS = {
+    **{c: " " for c in _ALTERNATIVE_SPACES},
+    **{c: "-" for c in _ALTERNATIVE_DASHES},
+    **{c: "\"" for c in _ALT_DOUBLE_QUOTES},
+    **{c: "\'" for c in _ALT_SINGLE_QUOTES},
+}
+
+# a single character class finds all characters to replace in one pass.
+# str.translate would be the obvious choice but is a lot slower than this on
+# non ascii strings (which every german text is).
+_CLEANUP_RE = re.compile("[{}]".format("".join(_CLEANUP_REPLACEMENTS.keys())))
+
+
+def _cleanup_replacement(match) -> str:
+    return _CLEANUP_REPLACEMENTS[match.group()]
+
+
 def cleanup_str(str_to_fix):
     if not str_to_fix:
         return str_to_fix
 
-    def _replace(value, chars, replacement) -> str:
-        for char in chars:
-            value = value.replace(char, replacement)
-        return value
-
-    alternative_spaces = {
-        u"\xa0",  # NO - BREAK SPACE
-        u"\xad",  # Soft Hyphen
-        u"\u1680",  # OGHAM SPACE MARK
-        u"\u180e",  # MONGOLIAN VOWEL SEPARATOR
-        u"\u2000",  # EN QUAD
-        u"\u2001",  # EM QUAD
-        u"\u2002",  # EN SPACE
-        u"\u2003",  # EM SPACE
-        u"\u2004",  # THREE - PER - EM SPACE
-        u"\u2005",  # FOUR - PER - EM SPACE
-        u"\u2006",  # SIX - PER - EM SPACE
-        u"\u2007",  # FIGURE SPACE
-        u"\u2008",  # PUNCTUATION SPACE
-        u"\u2009",  # THIN SPACE
-        u"\u200a",  # HAIR SPACE
-        u"\u2028",  # LINE SEPARATOR
-        u"\u2029",  # PARAGRAPH SEPARATOR
-        u"\u202f",  # NARROW NO - BREAK SPACE
-        u"\u205f",  # MEDIUM MATHEMATICAL SPACE
-        u"\u3000"  # IDEOGRAPHIC SPACE
-    }
-
-    alternative_dashes = {
-        u"\u2011",  # Non-Breaking Hyphen
-        u"\u2012",  # Figure Dash
-        # we are keeping \u2013 for the moment as those are used for the
-        # comment separation by the bundestag in the files
-        # u"\u2013",  # En Dash
-    }
-
-    alt_double_quotes = {
-        u"\u201c",
-        u"\u201e",
-    }
-
-    alt_single_quotes = {
-        u"\u2018",
-        u"\u2019",
-        u"\u02bc",
-    }
-
-    str_to_fix = _replace(str_to_fix, alternative_spaces, " ")
-    str_to_fix = _replace(str_to_fix, alternative_dashes, "-")
-    str_to_fix = _replace(str_to_fix, alt_double_quotes, "\"")
-    str_to_fix = _replace(str_to_fix, alt_single_quotes, "\'")
-
-    return str_to_fix
+    return _CLEANUP_RE.sub(_cleanup_replacement, str_to_fix)
+
+
+def cleanup_many(strs_to_fix: List[str]) -> List[str]:
+    """Bulk version of cleanup_str for a list of strings."""
+
+    # joining all strings into one and splitting the cleaned result was
+    # measured to be slower than this, as the number of replacements stays
+    # the same and the join/split adds two more copies
+    sub = _CLEANUP_RE.sub
+    return [sub(_cleanup_replacement, s) if s else s for s in strs_to_fix]
 
 
 def find_non_ascii_chars(obj: Any) -> Set[str]:
@@ -168,50 +229,82 @@ def find_non_ascii_chars(obj: Any) -> Set[str]:
     return found_chars
 
 
-def split_name_str_2(person_str: str) -> Tuple[str, str, str]:
-    from nameparser.config import Constants
+class NameSplitter:
+    """Splits person strings like "Präsident Dr. Wolfgang Schäuble" into
+    role, title, forename and surname. The nameparser constants are built
+    once per instance and the results are memoized in a LRU cache keyed on
+    the whitespace normalized person string."""
 
-    constants = Constants()
-    constants.titles.add("Prof.", "Ing.", "B.Sc.", "h.",  "c.", "e.")
-    constants.prefixes.add(
-        "Baronin", "Baron", "Freiherr", "Frhr.",
-        "Fürstin", "Fürst", "Gräfin", "Graf",
-        "Prinzessin", "Prinz", "von", "van", "de",
-        "vom", "zu")
+    known_roles = ["Präsident", "Vizepräsident", "Alterspräsident", "Ministerpräsident"]
 
-    hn = HumanName(person_str, constants=constants)
-    
-    title = hn.title
-    forename = hn.first
-    surname = hn.last
+    def __init__(self, maxsize: int = 4096):
+        self._constants = self._build_constants()
+        self._split_name_cached = lru_cache(maxsize=maxsize)(self._split_name)
 
-    return title, forename, surname
+    @staticmethod
+    def _build_constants() -> Constants:
+        constants = Constants()
+        constants.titles.add("Prof.", "Ing.", "B.Sc.", "h.", "c.", "e.")
+        constants.prefixes.add(
+            "Baronin", "Baron", "Freiherr", "Frhr.",
+            "Fürstin", "Fürst", "Gräfin", "Graf",
+            "Prinzessin", "Prinz", "von", "van", "de",
+            "vom", "zu")
+        return constants
 
+    def _split_name(self, person_str: str) -> Tuple[str, str, str]:
+        hn = HumanName(person_str, constants=self._constants)
+        return hn.title, hn.first, hn.last
 
-def split_name_str(person_str: str) -> Tuple[str, str, str, str]:
-    # random special cases
-    person_str = person_str.replace("Vizepräsident in", "Vizepräsidentin")
-    person_str = person_str.replace("Vizepräsiden", "Vizepräsident")
-    name_parts = person_str.split(" ")
+    def split_name(self, person_str: str) -> Tuple[str, str, str]:
+        """Returns title, forename and surname of the given person string."""
 
-    known_roles = ["Präsident", "Vizepräsident", "Alterspräsident", "Ministerpräsident"]
+        return self._split_name_cached(" ".join(person_str.split()))
 
-    found_role = ""
-    for role in known_roles:
-        if name_parts[0].startswith(role):
-            found_role = role
-            name_parts.pop(0)
-            break
+    def split(self, person_str: str) -> Tuple[str, str, str, str]:
+        """Returns role, title, forename and surname of the given person
+        string."""
+
+        # random special cases
+        person_str = person_str.replace("Vizepräsident in", "Vizepräsidentin")
+        person_str = person_str.replace("Vizepräsiden", "Vizepräsident")
+        name_parts = person_str.split(" ")
+
+        found_role = ""
+        for role in self.known_roles:
+            if name_parts[0].startswith(role):
+                found_role = role
+                name_parts.pop(0)
+                break
+
+        title, forename, surname = self.split_name(" ".join(name_parts))
+
+        if not forename:
+            logging.error(f"splitted a person string ({person_str}) without a forename!")
+        if not surname:
+            logging.error(f"splitted a person string ({person_str}) without a surname!")
+
+        return found_role, title, forename, surname
+
+    def split_many(self, person_strs: Iterable[str]) -> List[Tuple[str, str, str, str]]:
+        """Batch version of split which also shares the cache for duplicates
+        within the batch."""
+
+        return [self.split(person_str) for person_str in person_strs]
 
-    title, forename, surname = split_name_str_2(
-        " ".join(name_parts))
+    def cache_info(self):
+        return self._split_name_cached.cache_info()
 
-    if not forename:
-        logging.error(f"splitted a person string ({person_str}) without a forename!")
-    if not surname:
-        logging.error(f"splitted a person string ({person_str}) without a surname!")
 
-    return found_role, title, forename, surname
+name_splitter = NameSplitter()
+
+
+def split_name_str_2(person_str: str) -> Tuple[str, str, str]:
+    return name_splitter.split_name(person_str)
+
+
+def split_name_str(person_str: str) -> Tuple[str, str, str, str]:
+    return name_splitter.split(person_str)
 
 
 def run_async(coro):
@@ -228,23 +321,57 @@ def get_session_id_safe(legislative_period: str, session_no: str) -> str:
     return f"{legislative_period}{session_no_safe}"
 
 
-def get_crawled_session(session_id: str) -> dict:
-    crawler_db = database.get_crawler_db()
-
-    if not crawler_db:
-        logging.warning("External DB access was not successful. Aborting...")
-        time.sleep(4)
-        return {}
+def iter_crawled_sessions(
+        session_ids: List[str],
+        retries: int = None,
+        backoff: float = None,
+        batch_size: int = 10) \
+        -> Iterator[Tuple[str, Optional[dict]]]:
+    """Yields (session_id, session) for the requested sessions of the
+    crawler db, fetched with a single $in query and streamed through its
+    cursor in batches of batch_size sessions. The session is None if it
+    doesn't exist. On connection errors the sessions which weren't yielded
+    yet are fetched again up to retries times, waiting backoff * 2^attempt
+    seconds in between (configurable through the environment variables
+    CRAWLER_FETCH_RETRIES and CRAWLER_FETCH_BACKOFF). Invalid ids are
+    reported and skipped."""
+
+    if retries is None:
+        retries = int(os.getenv("CRAWLER_FETCH_RETRIES", 3))
+    if backoff is None:
+        backoff = float(os.getenv("CRAWLER_FETCH_BACKOFF", 1.0))
+
+    pending = OrderedDict()
+    for session_id in session_ids:
+        try:
+            pending[int(session_id)] = session_id
+        except ValueError:
+            logging.error(f"Skipping invalid session id '{session_id}'")
+
+    attempt = 0
+    while pending:
+        try:
+            crawler_db = database.get_crawler_db()
+            cursor = crawler_db["protokoll"].find({'_id': {'$in': list(pending.keys())}}, batch_size=batch_size)
+            for session in cursor:
+                session_id = pending.pop(session["_id"], None)
+                if session_id is not None:
+                    logging.info(f"Successful retrieved session '{session_id}' from external DB")
+                    yield session_id, session
+            break
+        except (PyMongoError, RuntimeError) as err:
+            if attempt >= retries:
+                raise ConnectionError(
+                    f"Fetching the sessions {list(pending.values())} from the crawler db failed after "
+                    f"{attempt + 1} attempts: {err}")
 
-    collection_name = "protokoll"
-    # todo: cast check
-    query = {'_id': int(session_id)}
-    session = crawler_db[collection_name].find_one(query)
+            delay = backoff * 2 ** attempt
+            attempt += 1
+            logging.warning(f"External DB access was not successful ({err}). Retrying in {delay:.1f}s...")
+            time.sleep(delay)
 
-    if session:
-        logging.info(f"Successful retrieved session '{session_id}' from external DB")
-        return session
-    return {}
+    for session_id in pending.values():
+        yield session_id, None
 
 
 def notify_sentiment_analysis_group(session_list: List[str]):
@@ -265,24 +392,13 @@ def notify_sentiment_analysis_group(session_list: List[str]):
         #logging.error(f"Error: {error}")
 
 
-def get_basic_auth_client(credentials: HTTPBasicCredentials):
+async def get_basic_auth_client(credentials: HTTPBasicCredentials):
     # on dev landscape allow without authentication
     if os.environ.get("LANDSCAPE") == 'dev':
         logging.info("Skipping auth because on dev landscape.")
         return
 
-    client = database.find_one('client', {'_id': credentials.username})
-    if not client:
-        error.raise_401(f"Incorrect credentials 1 for client '{credentials.username}'")
-
-    try:
-        password = os.environ.get(f"{credentials.username.upper()}_PASSWORD")
-        if credentials.password != password:
-            error.raise_401(f"Incorrect credentials 2 for client '{credentials.username}'")
-    except KeyError:
-        error.raise_401(f"Incorrect credentials 3 for client '{credentials.username}'")
-
-    return
+    await auth.authenticator.authenticate(credentials)
 
 
 def logging_is_needed(message: str) -> bool:
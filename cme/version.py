@@ -0,0 +1,11 @@
+"""Version of the extraction pipeline, kept apart from cme.extraction so
+the api and the index checks can use it without importing the extraction."""
+
+# stored with every session, sessions are only re-imported if their source or
+# this version changed.
+# 1: sessions written before the version was introduced, they have no
+#    pipeline_version field and are never matched, so they are re-imported.
+# 2: sessions written with their source_hash, the first versioned output.
+# Any change of the extraction output (interactions, speakers, factions) must
+# increase it, otherwise stored sessions keep their old results.
+PIPELINE_VERSION = 2
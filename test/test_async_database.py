@@ -0,0 +1,297 @@
+import asyncio
+import copy
+import json
+import os
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import httpx
+import mongomock
+
+from cme import async_database, database
+from cme.api import api, api_session, cache
+
+
+def _matches(doc, query):
+    for k, v in query.items():
+        if isinstance(v, dict):
+            if not doc.get(k, 0) > v["$gt"]:
+                return False
+        elif doc.get(k) != v:
+            return False
+    return True
+
+
+def _project(doc, projection):
+    included = [k for k, v in (projection or {}).items() if v and k != "_id"]
+    if included:
+        doc = {k: v for k, v in doc.items() if k in included or k == "_id"}
+    return {k: v for k, v in doc.items() if (projection or {}).get(k, 1)}
+
+
+class _Cursor:
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, keys):
+        for key, direction in reversed(keys):
+            self.docs.sort(key=lambda d: d.get(key) or "", reverse=direction < 0)
+        return self
+
+    def limit(self, limit):
+        self.docs = self.docs[:limit]
+        return self
+
+    async def to_list(self, length=None):
+        return self.docs[:length]
+
+
+class _Collection:
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.pipelines = []
+
+    async def find_one(self, query, projection=None, sort=None):
+        cursor = self.find(query, projection)
+        if sort:
+            cursor.sort(sort)
+        return next(iter(cursor.docs), None)
+
+    async def count_documents(self, query):
+        return len(self.find(query).docs)
+
+    async def estimated_document_count(self):
+        return len(self.docs)
+
+    def find(self, query, projection=None):
+        return _Cursor([_project(d, projection) for d in self.docs if _matches(d, query)])
+
+    async def aggregate(self, pipeline, batchSize=None, allowDiskUse=None):
+        self.pipelines.append((pipeline, allowDiskUse))
+        collection = mongomock.MongoClient().db.session
+        collection.insert_many(copy.deepcopy(self.docs))
+        for doc in collection.aggregate(pipeline):
+            yield doc
+
+
+class TestAsyncDatabase(unittest.TestCase):
+
+    def setUp(self):
+        self.db = db = {"session": _Collection([
+            {"_id": 1, "session_id": 19002, "legislative_period": 19},
+            {"_id": 2, "session_id": 19001, "legislative_period": 19},
+            {"_id": 3, "session_id": 19003, "legislative_period": 19, "interactions": [
+                {"sender": "F001", "receiver": "MDB-1", "message": "Beifall"},
+                {"sender": "MDB-2", "receiver": "MDB-1", "message": "Zuruf: Ä"}]}])}
+
+        async def get_cme_db():
+            return db
+
+        patcher = mock.patch.object(async_database, "get_cme_db", get_cme_db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        env_patcher = mock.patch.dict(os.environ, {"LANDSCAPE": "dev"})
+        env_patcher.start()
+        self.addCleanup(env_patcher.stop)
+
+        cache.response_cache.invalidate()
+
+    @staticmethod
+    def _get(*paths, headers=None):
+        async def _requests():
+            transport = httpx.ASGITransport(app=api.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test", auth=("test", "test")) as client:
+                return [await client.get(path, headers=headers) for path in paths]
+
+        return asyncio.run(_requests())
+
+    def test_session_endpoints(self):
+        session, session_ids, period = self._get(
+            "/cme/data/session/19001", "/cme/data/sessions/", "/cme/data/period/19")
+
+        self.assertEqual(session.status_code, 200)
+        self.assertEqual(session.json(), {"session_id": 19001, "legislative_period": 19})
+        self.assertEqual(session_ids.json(), [19001, 19002, 19003])
+        self.assertEqual(len(period.json()), 3)
+
+    def test_period_pagination_and_projection(self):
+        first, second, last = self._get(
+            "/cme/data/period/19?limit=2",
+            "/cme/data/period/19?limit=2&after=19002&include_interactions=false",
+            "/cme/data/period/19?after=19001&fields=legislative_period,interactions")
+
+        self.assertEqual([s["session_id"] for s in first.json()], [19001, 19002])
+        self.assertEqual(first.headers["X-Next-After"], "19002")
+        self.assertEqual(second.json(), [{"session_id": 19003, "legislative_period": 19}])
+        self.assertNotIn("X-Next-After", second.headers)
+        self.assertEqual(last.json()[-1]["interactions"][0]["message"], "Beifall")
+
+        unknown_field, = self._get("/cme/data/period/19?fields=password")
+        self.assertEqual(unknown_field.status_code, 400)
+
+    def test_period_is_paged_by_default(self):
+        self.db["session"].docs.extend(
+            {"session_id": 18001 + i, "legislative_period": 18} for i in range(api_session.MAX_PAGE_SIZE + 1))
+
+        with_interactions, with_fields, first, too_large = self._get(
+            "/cme/data/period/18",
+            "/cme/data/period/18?fields=interactions",
+            "/cme/data/period/18?include_interactions=false",
+            f"/cme/data/period/18?limit={api_session.MAX_PAGE_SIZE + 1}")
+        self.assertEqual(len(with_interactions.json()), api_session.INTERACTIONS_PAGE_SIZE)
+        self.assertEqual(len(with_fields.json()), api_session.INTERACTIONS_PAGE_SIZE)
+        self.assertEqual(len(first.json()), api_session.MAX_PAGE_SIZE)
+        self.assertEqual(first.headers["X-Next-After"], str(18000 + api_session.MAX_PAGE_SIZE))
+        self.assertEqual(too_large.status_code, 400)
+
+        second, = self._get(
+            f"/cme/data/period/18?include_interactions=false&after={first.headers['X-Next-After']}")
+        self.assertEqual([s["session_id"] for s in second.json()], [18001 + api_session.MAX_PAGE_SIZE])
+        self.assertNotIn("X-Next-After", second.headers)
+
+        legislative_period, = self._get("/cme/data/period/18?fields=legislative_period")
+        self.assertEqual(len(legislative_period.json()), api_session.MAX_PAGE_SIZE)
+
+    def test_missing_session(self):
+        response, = self._get("/cme/data/session/18001")
+        self.assertEqual(response.status_code, 404)
+
+    def test_interaction_stream(self):
+        response, = self._get("/cme/data/interactions?legislative_period=19&receiver=MDB-1")
+
+        self.assertEqual(response.headers["content-type"], "application/x-ndjson")
+        lines = response.text.splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[1]), {
+            "session_id": 19003, "legislative_period": 19, "sender": "MDB-2", "receiver": "MDB-1",
+            "message": "Zuruf: Ä"})
+
+        (pipeline, allow_disk_use), = self.db["session"].pipelines
+        self.assertEqual(pipeline[:2], [
+            {"$match": {"legislative_period": 19, "interactions.receiver": "MDB-1"}},
+            {"$sort": {"session_id": 1}}])
+        self.assertTrue(allow_disk_use)
+
+    def test_interaction_stream_filters_and_order(self):
+        self.db["session"].docs[:] = [
+            {"_id": 1, "session_id": 19002, "legislative_period": 19, "start": datetime(2020, 1, 2), "interactions": [
+                {"sender": "MDB-2", "receiver": "F001", "message": "b"},
+                {"sender": "MDB-3", "receiver": "MDB-1", "message": "c"}]},
+            {"_id": 2, "session_id": 19001, "legislative_period": 19, "start": datetime(2020, 1, 1), "interactions": [
+                {"sender": "MDB-2", "receiver": "MDB-1", "message": "a"}]},
+            {"_id": 3, "session_id": 19003, "legislative_period": 19, "start": datetime(2020, 1, 3), "interactions": [
+                {"sender": "MDB-2", "receiver": "MDB-1", "message": "d"}]},
+            {"_id": 4, "session_id": 18001, "legislative_period": 18, "start": datetime(2016, 1, 1), "interactions": [
+                {"sender": "MDB-2", "receiver": "MDB-1", "message": "e"}]}]
+
+        by_sender, by_period, by_date = self._get(
+            "/cme/data/interactions?sender=MDB-2",
+            "/cme/data/interactions?legislative_period=19&receiver=MDB-1",
+            "/cme/data/interactions?end_date=2020-01-02T00:00:00")
+
+        def _messages(response):
+            return [json.loads(line)["message"] for line in response.text.splitlines()]
+
+        self.assertEqual(_messages(by_sender), ["e", "a", "b", "d"])
+        self.assertEqual(_messages(by_period), ["a", "c", "d"])
+        self.assertEqual(_messages(by_date), ["e", "a", "b", "c"])
+
+    def test_etag_and_response_cache(self):
+        sessions = self.db["session"].docs
+        sessions[1]["modified"] = "2020-10-01T00:00:00"
+
+        first, = self._get("/cme/data/session/19001")
+        etag = first.headers["ETag"]
+        self.assertEqual(first.json()["session_id"], 19001)
+
+        not_modified, = self._get("/cme/data/session/19001", headers={"If-None-Match": etag})
+        self.assertEqual(not_modified.status_code, 304)
+        cached, = self._get("/cme/data/session/19001")
+        self.assertEqual(cached.content, first.content)
+        self.assertEqual(cache.response_cache.hits, 1)
+
+        # a write of another process changes the version
+        sessions[1]["modified"] = "2020-10-02T00:00:00"
+        sessions[1]["interactions"] = []
+        changed, = self._get("/cme/data/session/19001", headers={"If-None-Match": etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers["ETag"], etag)
+        self.assertEqual(changed.json()["interactions"], [])
+
+        # writes of this process invalidate the cache right away
+        with mock.patch("cme.database.get_cme_db"):
+            database.update_one("session", {"session_id": 19001}, {})
+        self.assertEqual(len(cache.response_cache), 0)
+
+    def test_health(self):
+        with mock.patch.object(async_database, "ping", mock.AsyncMock(return_value=0.0012)):
+            healthy, = self._get("/cme/health")
+        with mock.patch.object(async_database, "ping", mock.AsyncMock(side_effect=RuntimeError("down"))):
+            unavailable, = self._get("/cme/health")
+
+        self.assertEqual(healthy.json(), {"status": "ok", "db_ping_ms": 1.2})
+        self.assertEqual(unavailable.status_code, 503)
+
+    def test_metrics(self):
+        self._get("/cme/data/session/19001")
+        response, = self._get("/cme/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain"))
+        self.assertIn('cme_db_round_trips_total{collection="session",operation="find_one"}', response.text)
+        self.assertIn('cme_jobs{status="queued"} 0', response.text)
+
+    def test_metrics_require_credentials(self):
+        async def _request():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://test") as client:
+                return await client.get("/cme/metrics")
+
+        self.assertEqual(asyncio.run(_request()).status_code, 401)
+
+
+class TestAsyncConnection(unittest.TestCase):
+
+    def setUp(self):
+        self.clients = []
+        test = self
+
+        class _Client:
+            def __init__(self, *args, **kwargs):
+                self.closed = False
+                test.clients.append(self)
+
+            def __getitem__(self, db_name):
+                db = mock.Mock(client=self)
+
+                async def command(name):
+                    await asyncio.sleep(0.01)
+                db.command = command
+                return db
+
+            def close(self):
+                self.closed = True
+
+        patcher = mock.patch.object(async_database, "AsyncIOMotorClient", _Client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(async_database.close)
+        async_database.close()
+
+    def test_concurrent_calls_share_one_client(self):
+        async def _get_dbs():
+            return await asyncio.gather(*[async_database.get_cme_db() for _ in range(5)])
+
+        dbs = asyncio.run(_get_dbs())
+        self.assertEqual(len(self.clients), 1)
+        self.assertTrue(all(db is dbs[0] for db in dbs))
+        self.assertFalse(self.clients[0].closed)
+
+        # a new loop gets a new client, the one of the old loop is closed
+        asyncio.run(_get_dbs())
+        self.assertEqual(len(self.clients), 2)
+        self.assertTrue(self.clients[0].closed)
+        self.assertFalse(self.clients[1].closed)
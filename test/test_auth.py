@@ -0,0 +1,53 @@
+import asyncio
+import os
+import unittest
+from unittest import mock
+
+from fastapi import HTTPException
+from fastapi.security import HTTPBasicCredentials
+
+from cme.api.auth import ClientAuthenticator
+
+
+class TestClientAuthenticator(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch("cme.api.auth.async_database.find_all_ids", side_effect=self._find_all_ids)
+        self.find_all_ids = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        env_patcher = mock.patch.dict(os.environ, {"SENTIMENT_PASSWORD": "secret"})
+        env_patcher.start()
+        self.addCleanup(env_patcher.stop)
+
+    @staticmethod
+    async def _find_all_ids(collection_name, attribute_name):
+        return ["sentiment", "crawler"]
+
+    @staticmethod
+    def _authenticate(authenticator, username, password):
+        asyncio.run(authenticator.authenticate(HTTPBasicCredentials(username=username, password=password)))
+
+    def test_cached_authentication(self):
+        authenticator = ClientAuthenticator()
+
+        for _ in range(3):
+            self._authenticate(authenticator, "sentiment", "secret")
+        self.assertEqual(self.find_all_ids.call_count, 1)
+
+        for username, password in (("sentiment", "wrong"), ("unknown", "secret"), ("crawler", "secret")):
+            with self.assertRaises(HTTPException) as context:
+                self._authenticate(authenticator, username, password)
+            self.assertEqual(context.exception.status_code, 401)
+        self.assertEqual(self.find_all_ids.call_count, 1)
+
+    def test_expired_entries_are_validated_again(self):
+        authenticator = ClientAuthenticator(ttl=0)
+
+        self._authenticate(authenticator, "sentiment", "secret")
+        self._authenticate(authenticator, "sentiment", "secret")
+        self.assertEqual(self.find_all_ids.call_count, 2)
+
+        with mock.patch.dict(os.environ, {"SENTIMENT_PASSWORD": "changed"}):
+            with self.assertRaises(HTTPException):
+                self._authenticate(authenticator, "sentiment", "secret")
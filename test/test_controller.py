@@ -0,0 +1,68 @@
+import tempfile
+import unittest
+from argparse import Namespace
+from pathlib import Path
+from unittest import mock
+
+from cme import controller, utils
+from cme.version import PIPELINE_VERSION
+
+
+class TestIncrementalImport(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.unchanged = Path(directory.name) / "19001-data.xml"
+        self.unchanged.write_bytes(b"<dbtplenarprotokoll>1</dbtplenarprotokoll>")
+        self.changed = Path(directory.name) / "19002-data.xml"
+        self.changed.write_bytes(b"<dbtplenarprotokoll>2</dbtplenarprotokoll>")
+
+    def _import(self, **kwargs):
+        args = Namespace(
+            files=[self.unchanged.parent], dry_run=False, force=False, jobs=1, xml_engine="bs4",
+            add_debug_objects=False, notify=False, stats=False)
+        for key, value in kwargs.items():
+            setattr(args, key, value)
+
+        with mock.patch("cme.controller.database") as database, \
+                mock.patch("cme.controller._convert_file", return_value=[]) as convert_file:
+            database.find_many.return_value = [{"source_hash": utils.content_hash(self.unchanged.read_bytes())}]
+            controller.manual_import(args)
+
+        return database, convert_file
+
+    def test_unchanged_files_are_skipped(self):
+        database, convert_file = self._import()
+
+        _, query, _ = database.find_many.call_args.args
+        self.assertEqual(query["pipeline_version"], PIPELINE_VERSION)
+        self.assertEqual(len(query["source_hash"]["$in"]), 2)
+        self.assertEqual([c.args[0] for c in convert_file.call_args_list], [self.changed])
+
+    def test_force_imports_all_files(self):
+        database, convert_file = self._import(force=True)
+
+        database.find_many.assert_not_called()
+        self.assertEqual(convert_file.call_count, 2)
+
+
+class TestEvaluateNewestSessions(unittest.TestCase):
+
+    def test_failing_session_does_not_block_the_others(self):
+        crawled = [("19001", {"_id": 19001}), ("19002", {"_id": 19002}), ("19003", None)]
+
+        def _evaluate_session(id, session):
+            if id == "19001":
+                raise ValueError("malformed session")
+            return True
+
+        with mock.patch("cme.controller.utils") as utils_mock, \
+                mock.patch("cme.controller.database"), \
+                mock.patch("cme.controller._evaluate_session", side_effect=_evaluate_session):
+            utils_mock.iter_crawled_sessions.return_value = iter(crawled)
+
+            with self.assertRaisesRegex(RuntimeError, "19001"):
+                controller.evaluate_newest_sessions(["19001", "19002", "19003"])
+
+        utils_mock.notify_sentiment_analysis_group.assert_called_once_with(["19002"])
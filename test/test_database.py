@@ -0,0 +1,83 @@
+import unittest
+from unittest import mock
+
+from cme import database
+
+
+class TestBulkWrites(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch("cme.database.get_cme_db")
+        self.get_cme_db = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.db = self.get_cme_db.return_value
+
+    def test_writes_are_merged_into_one_unordered_bulk_write(self):
+        with database.bulk_writes() as writer:
+            for session_id in range(10):
+                self.assertIsNone(database.update_one("session", {"session_id": session_id}, {"n": session_id}))
+            database.update_one("session", {"session_id": 0}, {"n": 42})
+            self.db["session"].bulk_write.assert_not_called()
+
+        self.db["session"].update_one.assert_not_called()
+        self.db["session"].bulk_write.assert_called_once()
+        operations, = self.db["session"].bulk_write.call_args.args
+        self.assertEqual(self.db["session"].bulk_write.call_args.kwargs, {"ordered": False})
+
+        # the two writes to session 0 are merged into one operation
+        self.assertEqual(len(operations), 10)
+        self.assertEqual(operations[0]._doc["$set"]["n"], 42)
+
+        self.assertEqual(writer.operations, 11)
+        self.assertEqual(writer.round_trips, 1)
+        self.assertEqual(writer.saved_round_trips, 10)
+
+    def test_flush_on_max_operations(self):
+        with database.bulk_writes(max_operations=3) as writer:
+            for session_id in range(7):
+                database.update_one("session", {"session_id": session_id}, {})
+            self.assertEqual(self.db["session"].bulk_write.call_count, 2)
+            self.assertEqual(writer.pending(), 1)
+
+        self.assertEqual(self.db["session"].bulk_write.call_count, 3)
+
+    def test_read_flushes_pending_writes(self):
+        with database.bulk_writes() as writer:
+            database.update_one("mdb", {"speaker_id": "MDB-1"}, {"surname": "Mustermann"})
+            database.update_one("session", {"session_id": 1}, {})
+
+            database.find_one("mdb", {"speaker_id": "MDB-1"})
+            self.db["mdb"].bulk_write.assert_called_once()
+            self.assertEqual(writer.pending("mdb"), 0)
+            self.assertEqual(writer.pending("session"), 1)
+
+    def test_unbuffered_collections_are_written_directly(self):
+        with database.bulk_writes(collections=("session",)):
+            database.update_one("mdb", {"speaker_id": "MDB-1"}, {})
+            self.db["mdb"].update_one.assert_called_once()
+
+        self.db["mdb"].bulk_write.assert_not_called()
+
+
+class TestConnectionManager(unittest.TestCase):
+
+    @mock.patch.dict("os.environ", {"CME_DB_MAX_POOL_SIZE": "20", "CME_DB_COMPRESSORS": "zstd,zlib"})
+    def test_client_options(self):
+        self.assertEqual(database.client_options("CME"), {
+            "serverSelectionTimeoutMS": 10000, "maxPoolSize": 20, "compressors": "zstd,zlib"})
+        self.assertEqual(database.client_options("CRAWLER"), {"serverSelectionTimeoutMS": 10000})
+
+    def test_new_client_after_fork(self):
+        connection = database.ConnectionManager("CME")
+        with mock.patch("cme.database._generic_get_db", side_effect=lambda *a: (mock.Mock(), mock.Mock())) \
+                as generic_get_db, mock.patch("os.getpid", return_value=1):
+            parent_db = connection.get_db()
+            self.assertIs(connection.get_db(), parent_db)
+            parent_client = connection._client
+
+            with mock.patch("os.getpid", return_value=2):
+                self.assertIsNot(connection.get_db(), parent_db)
+
+        self.assertEqual(generic_get_db.call_count, 2)
+        # the forked process must not close the client of its parent
+        parent_client.close.assert_not_called()
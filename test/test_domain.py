@@ -0,0 +1,270 @@
+import multiprocessing
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+
+from lxml import etree
+
+from cme.domain import MDB, MDBIdentityCache, SpeakerRegistry, Faction, Interaction, SessionMetadata, Transcript
+
+
+def _mdb_doc(speaker_id, forename, surname, mdb_number=None, modified="2020-10-01T00:00:00"):
+    doc = {
+        "speaker_id": speaker_id,
+        "forename": forename,
+        "surname": surname,
+        "memberships": [(datetime.min, None, Faction.NONE)],
+        "modified": modified}
+    if mdb_number:
+        doc["mdb_number"] = mdb_number
+    return doc
+
+
+def _create_in_worker(mdb_number):
+    # run in a spawned worker with its own runtime storage
+    MDB.set_storage_mode("runtime")
+    mdb = MDB.find_and_add_in_storage(
+        "Horst", "Seehofer", [(datetime.min, None, Faction.CDU_AND_CSU)], mdb_number=mdb_number)
+    return mdb.speaker_id, MDB._mdb_runtime_storage
+
+
+TRANSCRIPT_FILE = Path(__file__).parent.parent / "resources" / "plenarprotokolle" / "open_data" / "19180-data.xml"
+
+
+def _naive_in_text(text):
+    found = set()
+    for faction in Faction:
+        for name in faction.possible_names:
+            if name in text:
+                found.add(faction)
+                break
+    return found
+
+
+class TestFaction(unittest.TestCase):
+
+    def test_in_text_matches_naive_search(self):
+        texts = [
+            "",
+            "Beifall bei der CDU/CSU und der SPD",
+            "Beifall bei der FDP sowie bei Abgeordneten der CDU/CSU, der SPD und des BÜNDNISSES 90/DIE GRÜNEN",
+            "Zuruf von der AfD",
+            "Fraktionslos",
+            "SPDie Grünen",
+            "AfDIE LINKE",
+        ]
+        transcript = etree.parse(str(TRANSCRIPT_FILE))
+        texts += ["".join(el.itertext()) for el in transcript.iter("p", "kommentar")]
+
+        for text in texts:
+            self.assertSetEqual(set(Faction.in_text(text)), _naive_in_text(text), text)
+
+    def test_in_text_keeps_definition_order(self):
+        self.assertListEqual(
+            Faction.in_text("Beifall bei der AfD, der SPD und der CDU/CSU"),
+            [Faction.CDU_AND_CSU, Faction.SPD, Faction.AFD])
+
+    def test_spans_in_text(self):
+        text = "Beifall bei der CDU/CSU und dem BÜNDNIS 90/DIE GRÜNEN"
+
+        self.assertListEqual(Faction.spans_in_text(text), [
+            (16, 23, Faction.CDU_AND_CSU),
+            (32, 53, Faction.DIE_GRÜNEN)])
+        self.assertListEqual(Faction.spans_in_text("Beifall"), [])
+
+
+class TestMDB(unittest.TestCase):
+
+    def test_speaker_id_is_deterministic(self):
+        by_number = MDB.build_speaker_id("11002140", "Horst", "Seehofer")
+        by_name = MDB.build_speaker_id(None, "Horst", "Seehofer")
+
+        self.assertEqual(by_number, MDB.build_speaker_id("11002140", "Horst", "Seehofer"))
+        self.assertEqual(by_name, MDB.build_speaker_id(None, "Horst", "Seehofer"))
+        self.assertNotEqual(by_number, by_name)
+        self.assertNotEqual(by_name, MDB.build_speaker_id(None, "Horst", "Seehofers"))
+        self.assertTrue(by_number.startswith("MDB-"))
+
+    def test_workers_create_the_same_speaker_id(self):
+        # one worker sees the mdb_number, the other one only the name
+        results = []
+        for mdb_number in ("11002140", None):
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                results.append(executor.submit(_create_in_worker, mdb_number).result(timeout=60))
+
+        self.assertEqual(results[0][0], results[1][0])
+
+        for name, value in [("_mdb_runtime_storage", {}), ("_mdb_runtime_storage_mdb_number_index", {}),
+                            ("_mdb_runtime_storage_name_index", {})]:
+            patcher = mock.patch.object(MDB, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        for _, storage in results:
+            MDB.merge_runtime_storage(storage)
+        self.assertEqual(list(MDB._mdb_runtime_storage), [results[0][0]])
+        self.assertEqual(MDB._mdb_runtime_storage[results[0][0]]["mdb_number"], "11002140")
+
+    def test_surname_index_is_rebuilt_on_new_version(self):
+        docs = [
+            _mdb_doc("MDB-1", "Horst", "Seehofer", "11002140"),
+            _mdb_doc("MDB-2", "Caren", "Lay"),
+            _mdb_doc("MDB-3", "Dietmar", "Lay")]
+
+        previous_storage_type = MDB._storage_type
+        MDB.set_storage_mode("mongodb")
+        self.addCleanup(MDB.set_storage_mode, previous_storage_type)
+
+        with mock.patch("cme.domain.database") as database:
+            database.find_many.side_effect = lambda *args, **kwargs: list(docs)
+            database.collection_version.return_value = (3, "2020-10-01T00:00:00")
+
+            index = MDB.surname_index()
+            # ambiguous surnames are not part of the index
+            self.assertEqual(list(index.keys()), ["Seehofer"])
+            self.assertEqual(index["Seehofer"].speaker_id, "MDB-1")
+            self.assertIs(MDB.surname_index(), index)
+            self.assertEqual(database.find_many.call_count, 1)
+
+            docs.append(_mdb_doc("MDB-4", "Alice", "Weidel"))
+            database.collection_version.return_value = (4, "2020-10-02T00:00:00")
+
+            self.assertEqual(set(MDB.surname_index().keys()), {"Seehofer", "Weidel"})
+            self.assertEqual(database.find_many.call_count, 2)
+
+    def test_transcripts_share_mdbs(self):
+        # e.g. receivers from the cached surname index
+        mdb = MDB(**_mdb_doc("MDB-1", "Horst", "Seehofer"))
+        interactions = [Interaction(sender=Faction.SPD, receiver=mdb, message="Beifall", from_paragraph=False)]
+
+        for session_no in (19001, 19002):
+            metadata = SessionMetadata(
+                session_no=session_no, legislative_period=19, start=datetime(2020, 10, 1), end=datetime(2020, 10, 1))
+            transcript = Transcript.from_interactions(metadata, interactions)
+            self.assertEqual(transcript.speakers["MDB-1"].memberships[0][2], Faction.NONE.value)
+
+        self.assertEqual(mdb.memberships[0][2], Faction.NONE)
+
+
+class TestMDBIdentityCache(unittest.TestCase):
+
+    def test_preload_and_counters(self):
+        cache = MDBIdentityCache()
+        cache.preload([
+            _mdb_doc("MDB-1", "Horst", "Seehofer", "11002140"),
+            _mdb_doc("MDB-2", "Caren", "Lay", modified="2020-01-01T00:00:00"),
+            _mdb_doc("MDB-3", "Caren", "Lay", modified="2020-06-01T00:00:00")])
+
+        self.assertEqual(cache.get(("mdb_number", "11002140"))[1]["speaker_id"], "MDB-1")
+        self.assertEqual(cache.get(("name", ("Horst", "Seehofer")))[1]["speaker_id"], "MDB-1")
+        # the latest of multiple mdbs with the same name is used
+        self.assertEqual(cache.get(("name", ("Caren", "Lay")))[1]["speaker_id"], "MDB-3")
+        self.assertEqual(cache.get(("name", ("Alice", "Weidel"))), (False, None))
+        self.assertEqual(cache.stats()["hits"], 3)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_lru_eviction(self):
+        cache = MDBIdentityCache(maxsize=2)
+        cache.put(("name", ("A", "A")), None)
+        cache.put(("name", ("B", "B")), None)
+        cache.get(("name", ("A", "A")))
+        cache.put(("name", ("C", "C")), None)
+
+        self.assertEqual(len(cache), 2)
+        self.assertTrue(cache.get(("name", ("A", "A")))[0])
+        self.assertFalse(cache.get(("name", ("B", "B")))[0])
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_invalidate(self):
+        cache = MDBIdentityCache()
+        cache.preload([_mdb_doc("MDB-1", "Horst", "Seehofer", "11002140")])
+        cache.put(("name", ("Alice", "Weidel")), None)
+
+        cache.invalidate("MDB-1")
+        self.assertFalse(cache.get(("mdb_number", "11002140"))[0])
+        self.assertFalse(cache.get(("name", ("Horst", "Seehofer")))[0])
+
+        cache.invalidate(name=("Alice", "Weidel"))
+        self.assertFalse(cache.get(("name", ("Alice", "Weidel")))[0])
+
+    def test_find_and_add_in_storage_uses_cache(self):
+        docs = [_mdb_doc("MDB-1", "Horst", "Seehofer", "11002140")]
+
+        def _find_one(collection_name, query, exclude=None):
+            return next((d for d in docs if all(d.get(k) == v for k, v in query.items())), None)
+
+        def _find_many(collection_name=None, query=None, exclude=None):
+            return [d for d in docs if all(d.get(k) == v for k, v in (query or {}).items())]
+
+        def _update_one(collection_name, query, update, on_insert=None, created_by=None):
+            update["modified"] = "2020-10-02T00:00:00"
+            docs.append(update)
+
+        previous_storage_type = MDB._storage_type
+        MDB.set_storage_mode("mongodb")
+        self.addCleanup(MDB.set_storage_mode, previous_storage_type)
+
+        with mock.patch("cme.domain.database") as database:
+            database.find_one.side_effect = _find_one
+            database.find_many.side_effect = _find_many
+            database.update_one.side_effect = _update_one
+
+            with MDB.identity_cache() as cache:
+                for _ in range(3):
+                    MDB.find_and_add_in_storage("Horst", "Seehofer", [], mdb_number="11002140")
+                    MDB.find_and_add_in_storage("Alice", "Weidel", [])
+
+            self.assertEqual(database.find_one.call_count, 0)
+            # one bulk preload plus one lookup of the unknown mdb, its
+            # creation puts the full document into the cache
+            self.assertEqual(database.find_many.call_count, 2)
+            self.assertEqual(database.update_one.call_count, 1)
+            self.assertGreaterEqual(cache.hits, 5)
+            self.assertIsNone(MDB._identity_cache)
+
+
+class TestSpeakerRegistry(unittest.TestCase):
+
+    def test_register_merges_into_canonical_mdb(self):
+        registry = SpeakerRegistry()
+        mdb = MDB(**_mdb_doc("MDB-1", "Horst", "Seehofer"))
+        self.assertIs(registry.register(("name", ("Horst", "Seehofer")), mdb), mdb)
+
+        updated = MDB(**_mdb_doc("MDB-1", "Horst", "Seehofer", "11002140"))
+        self.assertIs(registry.register(("mdb_number", "11002140"), updated), mdb)
+        self.assertEqual(mdb.mdb_number, "11002140")
+        self.assertIs(registry.get(("mdb_number", "11002140")), mdb)
+        self.assertIs(registry.get_by_speaker_id("MDB-1"), mdb)
+        self.assertIsNone(registry.get(("name", ("Alice", "Weidel"))))
+        self.assertEqual((registry.hits, registry.misses, len(registry)), (1, 1, 1))
+
+    def test_find_and_add_in_storage_returns_canonical_mdb(self):
+        docs = [_mdb_doc("MDB-1", "Horst", "Seehofer")]
+
+        def _find_many(collection_name=None, query=None, exclude=None):
+            return [d for d in docs if all(d.get(k) == v for k, v in (query or {}).items())]
+
+        previous_storage_type = MDB._storage_type
+        MDB.set_storage_mode("mongodb")
+        self.addCleanup(MDB.set_storage_mode, previous_storage_type)
+
+        with mock.patch("cme.domain.database") as database:
+            database.find_one.return_value = None
+            database.find_many.side_effect = _find_many
+
+            with MDB.speaker_registry() as registry:
+                mdb = MDB.find_and_add_in_storage("Horst", "Seehofer", [])
+                for _ in range(3):
+                    self.assertIs(MDB.find_and_add_in_storage("Horst", "Seehofer", []), mdb)
+
+                # found through the name, the mdb_number is added to the same object
+                self.assertIs(MDB.find_and_add_in_storage("Horst", "Seehofer", [], mdb_number="11002140"), mdb)
+                self.assertEqual(mdb.mdb_number, "11002140")
+                self.assertIs(MDB.find_and_add_in_storage("Horst", "Seehofer", [], mdb_number="11002140"), mdb)
+
+            self.assertEqual(database.find_many.call_count, 2)
+            self.assertEqual(registry.hits, 4)
+            self.assertIsNone(MDB._speaker_registry)
+            self.assertIsNot(MDB.find_and_add_in_storage("Horst", "Seehofer", []), mdb)
@@ -1,8 +1,9 @@
 import unittest
 from datetime import datetime
 
-from cme.domain import InteractionCandidate, MDB, Faction
-from cme.extraction import extract_communication_model
+from cme.domain import InteractionCandidate, Interaction, MDB, Faction
+from cme.extraction import (
+    extract_communication_model, ReceiverMatcher, comment_grammar, DIRECT_SPEECH, REACTION, UNKNOWN)
 
 
 MDB.set_storage_mode("runtime")
@@ -133,3 +134,61 @@ class TestExtraction(unittest.TestCase):
 
         self.assertEqual(interaction_0.sender, MDB.find_and_add_in_storage(forename="Manfred", surname="Grund", memberships=[(datetime.min, None, Faction.CDU_AND_CSU)]))
         self.assertEqual(interaction_0.message, 'Heiterkeit des Abg. Manfred Grund [CDU/CSU]')
+
+
+    def test_interactions_match_validated_models(self):
+        comment = "(Beifall bei der SPD – Zuruf des Abg. Jan Korte [DIE LINKE]: So ist es!)"
+
+        for interaction in extract_communication_model([_build_candidate(comment)]):
+            validated = Interaction(**{field: getattr(interaction, field) for field in interaction.__fields_set__})
+            self.assertEqual(interaction.dict(exclude_unset=True), validated.dict(exclude_unset=True))
+
+
+class TestCommentGrammar(unittest.TestCase):
+
+    def test_direct_speech(self):
+        comment = comment_grammar.parse("Zuruf des Abg. Jan Korte [DIE LINKE]: So ist es!")
+        self.assertEqual(comment.kind, DIRECT_SPEECH)
+        self.assertEqual(comment.senders, ["Zuruf des Abg. Jan Korte [DIE LINKE]"])
+        self.assertIsNone(comment.receivers)
+        self.assertEqual(comment.message, "So ist es!")
+
+        comment = comment_grammar.parse("Dr. Alice Weidel [AfD], an die SPD gewandt: Wo denn?")
+        self.assertEqual(comment.senders, ["Dr. Alice Weidel [AfD]"])
+        self.assertEqual(comment.receivers, [Faction.SPD])
+        self.assertEqual(comment.message, "Wo denn?")
+
+        comment = comment_grammar.parse("Gegenruf des Abg. Jan Korte [DIE LINKE], zur CDU/CSU: Na, na!")
+        self.assertEqual(comment.receivers, [Faction.CDU_AND_CSU])
+
+    def test_reaction(self):
+        comment = comment_grammar.parse("Heiterkeit und Beifall bei der CDU/CSU sowie des Abg. Jens Beeck [FDP]")
+        self.assertEqual(comment.kind, REACTION)
+        self.assertEqual(comment.senders, [Faction.CDU_AND_CSU, "des Abg. Jens Beeck [FDP]"])
+        self.assertEqual(comment.message, "Heiterkeit und Beifall bei der CDU/CSU sowie des Abg. Jens Beeck [FDP]")
+
+        # keywords have to be whole words, e.g. not "Beifalls"
+        self.assertEqual(comment_grammar.parse("Anhaltender Beifalls").kind, UNKNOWN)
+        self.assertEqual(comment_grammar.parse("Beifall").senders, [])
+
+
+class TestReceiverMatcher(unittest.TestCase):
+
+    @staticmethod
+    def _mdb(forename: str, surname: str) -> MDB:
+        return MDB(
+            speaker_id=MDB.build_speaker_id(None, forename, surname),
+            forename=forename,
+            surname=surname,
+            memberships=[(datetime.min, None, Faction.NONE)])
+
+    def test_receivers_in(self):
+        mueller = self._mdb("Sepp", "Müller")
+        leyen = self._mdb("Ursula", "von der Leyen")
+        matcher = ReceiverMatcher({"Müller": mueller, "von der Leyen": leyen, "Schulz": "ambiguous"})
+
+        self.assertEqual(matcher.receivers_in("Vielen Dank, Herr Müller, für die Frage."), [mueller])
+        self.assertEqual(matcher.receivers_in("Sehr geehrte Frau von der Leyen!"), [leyen])
+        self.assertEqual(matcher.receivers_in("Hr. Dr. Müller. Fr. von der Leyen."), [mueller, leyen])
+        # surnames without a preceding preposition and ambiguous ones are ignored
+        self.assertEqual(matcher.receivers_in("Müller und Herr Schulz und Frau Leyen"), [])
@@ -0,0 +1,63 @@
+import unittest
+from unittest import mock
+
+from pymongo.errors import OperationFailure
+
+from cme import indexes
+
+
+class TestIndexes(unittest.TestCase):
+
+    def test_queries_are_served_by_declared_indexes(self):
+        for query in indexes.explain_queries():
+            keys = list(query.filter) + [field for field, _ in query.sort or []]
+            declared = [list(model.document["key"]) for model in indexes.INDEXES[query.collection]]
+            # the filtered and sorted fields must be a prefix of an index,
+            # in any order for the equality matched ones
+            served = any(
+                set(index[:len(set(keys))]) == set(keys) for index in declared)
+            self.assertTrue(served, f"no index for '{query.description}'")
+
+    def test_conflicting_index_is_skipped(self):
+        db = mock.MagicMock()
+        created = []
+
+        def _create_indexes(models):
+            if models[0].document.get("unique"):
+                raise OperationFailure("E11000 duplicate key error")
+            created.append(models[0].document["name"])
+            return [models[0].document["name"]]
+
+        db.__getitem__.return_value.create_indexes.side_effect = _create_indexes
+        names = indexes.ensure_indexes(db)
+
+        self.assertEqual(names, created)
+        self.assertNotIn("session_id", names)
+        self.assertIn("surname_forename", names)
+
+    def test_interactions_are_explained_as_aggregation(self):
+        db = mock.MagicMock()
+        db.__getitem__.return_value.find_one.return_value = {"session_id": 19100, "legislative_period": 19}
+        db.__getitem__.return_value.find.return_value.sort.return_value.explain.return_value = {
+            "queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}}}
+        db.command.return_value = {"stages": [
+            {"$cursor": {"queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}}}},
+            {"$unwind": {"path": "$interactions"}}]}
+
+        results = dict((query.description, (query, stages)) for query, stages in indexes.explain(db))
+
+        query, stages = results["interactions of a period"]
+        self.assertEqual(query.filter, {"legislative_period": 19})
+        self.assertEqual(query.sort, [("session_id", 1)])
+        self.assertEqual(stages, ["FETCH", "IXSCAN"])
+        command, spec = db.command.call_args[0]
+        self.assertEqual(command, "explain")
+        self.assertEqual(spec["pipeline"], query.pipeline)
+        self.assertIn("interactions", results)
+
+    def test_plan_stages(self):
+        plan = {"queryPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "speaker_id"}},
+                "rejectedPlans": [{"stage": "COLLSCAN"}]}
+        self.assertEqual(indexes.plan_stages(plan), ["FETCH", "IXSCAN"])
+        self.assertEqual(indexes.plan_stages([{"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}]),
+                         ["SORT", "COLLSCAN"])
@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from cme.jobs import JobQueue, JobStatus, QueueFullError
+
+
+# run in spawned workers, so they have to be importable module level functions
+def _exit_in_worker(job_id, session_ids):
+    os._exit(1)
+
+
+def _evaluate_in_worker(job_id, session_ids):
+    from cme import jobs
+    with mock.patch("cme.controller.evaluate_newest_sessions"):
+        return jobs._run_job(job_id, session_ids)
+
+
+def _wait_for(queue, job, status):
+    deadline = time.monotonic() + 60
+    while queue.get(job.job_id).status != status and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return queue.get(job.job_id)
+
+
+class TestJobQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.evaluated = []
+
+        def _evaluate(session_ids):
+            self.release.wait(5)
+            if "broken" in session_ids:
+                raise ValueError("broken session")
+            self.evaluated.append(session_ids)
+
+        patcher = mock.patch("cme.controller.evaluate_newest_sessions", _evaluate)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.queue = JobQueue(workers=1, max_queued=2, executor=ThreadPoolExecutor(max_workers=1))
+        self.addCleanup(self.queue.shutdown)
+        self.addCleanup(self.release.set)
+
+    def test_dedup_backpressure_and_status(self):
+        running = self.queue.submit(["19001"])
+        queued = self.queue.submit(["19002", "19003"])
+        self.assertEqual(_wait_for(self.queue, running, JobStatus.RUNNING).status, JobStatus.RUNNING)
+        self.assertIsNotNone(running.started)
+        self.assertEqual(queued.status, JobStatus.QUEUED)
+        self.assertIsNone(queued.started)
+
+        # queued ids are dropped, running ones are queued again
+        self.assertIsNone(self.queue.submit(["19002"]))
+        broken = self.queue.submit(["19003", "19001", "broken"])
+        self.assertEqual(broken.session_ids, ["19001", "broken"])
+
+        with self.assertRaises(QueueFullError):
+            self.queue.submit(["19004"])
+
+        self.release.set()
+        self.queue.shutdown()
+
+        self.assertEqual(self.evaluated, [["19001"], ["19002", "19003"]])
+        self.assertEqual(self.queue.get(queued.job_id).status, JobStatus.DONE)
+        self.assertEqual(self.queue.get(broken.job_id).status, JobStatus.FAILED)
+        self.assertIn("broken session", self.queue.get(broken.job_id).error)
+        self.assertEqual(self.queue.stats(), {"queued": 0, "running": 0, "done": 2, "failed": 1})
+
+    def test_broken_worker_pool_is_replaced(self):
+        queue = JobQueue(workers=1)
+        self.addCleanup(queue.shutdown)
+
+        with mock.patch("cme.jobs._run_job", _exit_in_worker):
+            crashed = queue.submit(["19001"])
+            _wait_for(queue, crashed, JobStatus.FAILED)
+        self.assertIn("BrokenProcessPool", queue.get(crashed.job_id).error)
+
+        with mock.patch("cme.jobs._run_job", _evaluate_in_worker):
+            job = queue.submit(["19002"])
+            queue.shutdown()
+
+        self.assertEqual(queue.get(job.job_id).status, JobStatus.DONE)
+        self.assertEqual(queue.stats()["queued"], 0)
+
+    def test_worker_reports_the_start_of_a_job(self):
+        queue = JobQueue(workers=1)
+        self.addCleanup(queue.shutdown)
+
+        with mock.patch("cme.jobs._run_job", _evaluate_in_worker):
+            job = queue.submit(["19001"])
+            _wait_for(queue, job, JobStatus.DONE)
+
+        # the start is reported by the worker, the watcher may see it after
+        # the job is done already
+        deadline = time.monotonic() + 10
+        while queue.get(job.job_id).started is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertLessEqual(job.created, queue.get(job.job_id).started)
+
+    def test_failed_submit_does_not_stay_queued(self):
+        executor = mock.Mock()
+        executor.submit.side_effect = RuntimeError("cannot schedule new futures after shutdown")
+        queue = JobQueue(workers=1, max_queued=1, executor=executor)
+
+        for session_id in ("19001", "19002", "19003"):
+            self.assertEqual(queue.submit([session_id]).status, JobStatus.FAILED)
+        self.assertEqual(queue.stats()["queued"], 0)
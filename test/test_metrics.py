@@ -0,0 +1,43 @@
+import pickle
+import unittest
+
+from cme.metrics import Metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_prometheus_format(self):
+        metrics = Metrics()
+        metrics.inc("cme_db_round_trips_total", collection="mdb", operation="find_one")
+        metrics.inc("cme_db_round_trips_total", 2, collection="mdb", operation="find_one")
+        metrics.inc("cme_interactions_dropped_total", reason='say "hi"')
+        metrics.observe("cme_stage_seconds", 0.25, stage="parse")
+        metrics.observe("cme_stage_seconds", 0.5, stage="parse")
+
+        lines = metrics.render_prometheus().splitlines()
+        self.assertIn("# TYPE cme_db_round_trips_total counter", lines)
+        self.assertIn('cme_db_round_trips_total{collection="mdb",operation="find_one"} 3', lines)
+        self.assertIn('cme_interactions_dropped_total{reason="say \\"hi\\""} 1', lines)
+        self.assertIn("# TYPE cme_stage_seconds summary", lines)
+        self.assertIn('cme_stage_seconds_sum{stage="parse"} 0.75', lines)
+        self.assertIn('cme_stage_seconds_count{stage="parse"} 2', lines)
+
+        with self.assertRaises(ValueError):
+            metrics.set("cme_stage_seconds", 1)
+
+    def test_merge_worker_snapshot(self):
+        parent = Metrics()
+        parent.inc("cme_sessions_total")
+        parent.set("cme_jobs", 3, status="queued")
+
+        worker = Metrics()
+        worker.inc("cme_sessions_total", 2)
+        worker.set("cme_jobs", 1, status="queued")
+        with worker.timer("cme_stage_seconds", stage="extract"):
+            pass
+
+        parent.merge(pickle.loads(pickle.dumps(worker.snapshot())))
+        self.assertEqual(parent.get("cme_sessions_total"), 3)
+        self.assertEqual(parent.get("cme_jobs", status="queued"), 1)
+        self.assertEqual(parent.count("cme_stage_seconds", stage="extract"), 1)
+        self.assertIn("cme_stage_seconds stage=extract", parent.summary())
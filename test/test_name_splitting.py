@@ -1,6 +1,6 @@
 import unittest
 
-from cme.utils import split_name_str
+from cme.utils import split_name_str, NameSplitter
 
 
 class TestNameSplitting(unittest.TestCase):
@@ -65,3 +65,19 @@ class TestNameSplitting(unittest.TestCase):
         for cand in candidates:
             res = split_name_str(cand[0])
             self.assertTupleEqual(res, cand[1:])
+
+    def test_name_splitter_batch_and_cache(self):
+        splitter = NameSplitter()
+        results = splitter.split_many([
+            "Präsident Dr. Manfred Jürgenson von Kuchenhausen",
+            "Beatrix von Storch",
+            "Beatrix  von Storch ",
+        ])
+
+        self.assertListEqual(results, [
+            ("Präsident", "Dr.", "Manfred", "von Kuchenhausen"),
+            ("", "", "Beatrix", "von Storch"),
+            ("", "", "Beatrix", "von Storch"),
+        ])
+        self.assertEqual(splitter.cache_info().hits, 1)
+        self.assertEqual(splitter.cache_info().misses, 2)
@@ -0,0 +1,132 @@
+import json
+import random
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from bson import ObjectId
+from pymongo.errors import AutoReconnect
+
+from cme.utils import (
+    cleanup_str, cleanup_many, iter_crawled_sessions, safe_json_dumps, fast_json_dumps, crawled_session_hash)
+
+
+def _legacy_cleanup_str(str_to_fix):
+    # the implementation before the single pass cleanup, replacing every
+    # character on its own
+    if not str_to_fix:
+        return str_to_fix
+
+    def _replace(value, chars, replacement) -> str:
+        for char in chars:
+            value = value.replace(char, replacement)
+        return value
+
+    alternative_spaces = {
+        u"\xa0", u"\xad", u" ", u"᠎", u" ", u" ", u" ", u" ", u" ",
+        u" ", u" ", u" ", u" ", u" ", u" ", u" ", u" ", u" ",
+        u" ", u"　"}
+    alternative_dashes = {u"‑", u"‒"}
+    alt_double_quotes = {u"“", u"„"}
+    alt_single_quotes = {u"‘", u"’", u"ʼ"}
+
+    str_to_fix = _replace(str_to_fix, alternative_spaces, " ")
+    str_to_fix = _replace(str_to_fix, alternative_dashes, "-")
+    str_to_fix = _replace(str_to_fix, alt_double_quotes, "\"")
+    str_to_fix = _replace(str_to_fix, alt_single_quotes, "\'")
+
+    return str_to_fix
+
+
+ALPHABET = (
+    "abcXYZäöüß 0123456789.,:;!?()[]-\"'\n\t\x00"
+    "\xa0\xad ᠎           "
+    "    　‑‒–“„‘’ʼ")
+
+
+class TestCleanupStr(unittest.TestCase):
+
+    def test_matches_legacy_implementation(self):
+        rng = random.Random(1337)
+        for _ in range(2000):
+            text = "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 80)))
+            self.assertEqual(cleanup_str(text), _legacy_cleanup_str(text), repr(text))
+
+    def test_falsy_values(self):
+        self.assertIsNone(cleanup_str(None))
+        self.assertEqual(cleanup_str(""), "")
+
+    def test_cleanup_many_matches_cleanup_str(self):
+        rng = random.Random(4711)
+        for _ in range(200):
+            texts = [
+                "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 40)))
+                for _ in range(rng.randint(0, 10))]
+            texts.append(None)
+            rng.shuffle(texts)
+            self.assertListEqual(cleanup_many(texts), [cleanup_str(t) for t in texts])
+
+        self.assertListEqual(cleanup_many([]), [])
+
+
+class TestFastJsonDumps(unittest.TestCase):
+
+    def test_matches_safe_json_dumps(self):
+        obj = {
+            "_id": ObjectId("5f9f1b9b9c9d440000a1b2c3"),
+            "start": datetime(2020, 10, 1, 9, 0, 30),
+            "message": u"Beifall bei der AfD – „Sehr gut!“ http://example.org/a",
+            "interactions": [{"sender": "11004809", "receiver": None, "from_paragraph": True, "score": 0.5}]}
+
+        self.assertEqual(json.loads(fast_json_dumps(obj)), json.loads(safe_json_dumps(obj)))
+        self.assertIn(u"„Sehr gut!“ http://example.org/a", fast_json_dumps(obj))
+
+    def test_unknown_types_raise(self):
+        with self.assertRaises(TypeError):
+            fast_json_dumps({"value": object()})
+
+
+class TestCrawledSessionHash(unittest.TestCase):
+
+    def test_ignores_crawler_bookkeeping(self):
+        session = {"_id": 19192, "sitzungDatum": "2020-11-18", "rednerListe": [], "notified": False,
+                   "_class": "de.bundestag.Protokoll"}
+        notified = dict(session, notified=True)
+        changed = dict(session, rednerListe=[{"_id": "11004705"}])
+
+        self.assertEqual(crawled_session_hash(session), crawled_session_hash(notified))
+        self.assertNotEqual(crawled_session_hash(session), crawled_session_hash(changed))
+
+
+class TestIterCrawledSessions(unittest.TestCase):
+
+    def test_single_query_and_retry(self):
+        def _find(query, batch_size=None):
+            requested = query["_id"]["$in"]
+            yield {"_id": requested[0]}
+            if collection.find.call_count == 1:
+                raise AutoReconnect("connection lost")
+            for session_id in requested[1:]:
+                if session_id != 19003:
+                    yield {"_id": session_id}
+
+        with mock.patch("cme.utils.database") as database, mock.patch("cme.utils.time.sleep") as sleep:
+            collection = database.get_crawler_db.return_value["protokoll"]
+            collection.find.side_effect = _find
+
+            sessions = list(iter_crawled_sessions(["19001", "19002", "x", "19003"], retries=2, backoff=0.5))
+
+        self.assertEqual(sessions, [
+            ("19001", {"_id": 19001}), ("19002", {"_id": 19002}), ("19003", None)])
+        # the retry only asks for the sessions which weren't received yet
+        self.assertEqual(collection.find.call_args_list[1].args[0], {"_id": {"$in": [19002, 19003]}})
+        sleep.assert_called_once_with(0.5)
+
+    def test_gives_up_after_retries(self):
+        with mock.patch("cme.utils.database") as database, mock.patch("cme.utils.time.sleep") as sleep:
+            database.get_crawler_db.side_effect = RuntimeError("no connection")
+
+            with self.assertRaises(ConnectionError):
+                list(iter_crawled_sessions(["19001"], retries=2, backoff=1))
+
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [1, 2])
@@ -0,0 +1,36 @@
+import unittest
+from pathlib import Path
+
+from cme.data import read_transcript_xml_file, stream_transcript_xml_file
+from cme.domain import MDB
+
+
+MDB.set_storage_mode("runtime")
+
+TRANSCRIPT_FILE = Path(__file__).parent.parent / "resources" / "plenarprotokolle" / "open_data" / "19180-data.xml"
+
+
+class TestXmlParse(unittest.TestCase):
+
+    def test_iterparse_engine_matches_bs4(self):
+        bs4_metadata, bs4_candidates = read_transcript_xml_file(TRANSCRIPT_FILE, engine="bs4")
+        iter_metadata, iter_candidates = read_transcript_xml_file(TRANSCRIPT_FILE, engine="iterparse")
+
+        self.assertEqual(bs4_metadata, iter_metadata)
+        self.assertEqual(len(bs4_candidates), len(iter_candidates))
+        for bs4_candidate, iter_candidate in zip(bs4_candidates, iter_candidates):
+            self.assertEqual(bs4_candidate, iter_candidate)
+
+    def test_stream_is_lazy(self):
+        metadata, candidates = stream_transcript_xml_file(TRANSCRIPT_FILE)
+
+        self.assertEqual(metadata.session_no, 19180)
+        self.assertEqual(metadata.legislative_period, 19)
+
+        first_candidate = next(candidates)
+        self.assertEqual(first_candidate.speaker.surname, "Schäuble")
+        candidates.close()
+
+    def test_unknown_engine(self):
+        with self.assertRaises(RuntimeError):
+            read_transcript_xml_file(TRANSCRIPT_FILE, engine="unknown")